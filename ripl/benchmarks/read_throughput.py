@@ -0,0 +1,62 @@
+'''
+Throughput benchmark for the RIPL reader.
+
+    PYTHONPATH=. python benchmarks/read_throughput.py [size_in_mb]
+
+Generates a synthetic source file of roughly the requested size and times
+tokenising it alone and then fully parsing it into forms.
+'''
+import sys
+import time
+
+from ripl.read import Reader
+
+
+FORM = '''(defn process-{n} (rec)
+  "Generated rule {n}"
+  (if (> (get rec :score) {n}.5)
+    (cons 'high [1 2 3 0x{n:x}])
+    {{:id {n}, :tags '(a b c), :name "rule {n}"}}))
+; a trailing comment for rule {n}
+'''
+
+
+def make_source(size_mb):
+    '''Build up roughly size_mb of RIPL source'''
+    target = int(size_mb * 1024 * 1024)
+    chunks, total, n = [], 0, 0
+    while total < target:
+        chunk = FORM.format(n=n)
+        chunks.append(chunk)
+        total += len(chunk)
+        n += 1
+
+    return ''.join(chunks), n
+
+
+def timed(label, func, size):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print(f'{label:<12} {elapsed:8.3f}s {size / elapsed / 2**20:8.2f} MB/s')
+    return result
+
+
+def main(argv):
+    size_mb = float(argv[1]) if len(argv) > 1 else 4
+    source, n_forms = make_source(size_mb)
+    size = len(source)
+    reader = Reader()
+
+    print(f'{n_forms} forms, {size / 2**20:.2f} MB')
+    timed('tokenise', lambda: sum(1 for _ in reader.tokenise(source)), size)
+    forms = timed('read_all', lambda: list(reader.read_all(source)), size)
+    assert len(forms) == n_forms
+
+    depth = 100000
+    nested = '(' * depth + ')' * depth
+    timed(f'nest {depth}', lambda: reader.read(nested), len(nested))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,45 @@
+'''
+Fixtures shared by the tests: most of them are run once in each of the
+evaluation modes, which should all give the same results.
+'''
+import pytest
+
+from ripl.eval import Evaluator
+from ripl.interpretor import Interpretor
+
+
+@pytest.fixture(params=Evaluator.modes)
+def mode(request):
+    return request.param
+
+
+@pytest.fixture
+def interp(mode):
+    '''A fresh interpretor without the prelude or the on disk cache'''
+    return Interpretor(mode=mode, cache=False)
+
+
+@pytest.fixture
+def prelude(interp):
+    '''A fresh interpretor with the prelude loaded'''
+    interp.load_prelude()
+    return interp
+
+
+def _runner(interp):
+    def run(text):
+        '''The value of the last form in text'''
+        *_, result = interp.eval_expr(text)
+        return result
+
+    return run
+
+
+@pytest.fixture
+def run(interp):
+    return _runner(interp)
+
+
+@pytest.fixture
+def run_prelude(prelude):
+    return _runner(prelude)
@@ -0,0 +1,297 @@
+'''
+Evaluate expressions as asyncio coroutines: async-fn and await.
+
+    (define fetch-both
+      (async-fn (a b)
+        (let ((page (await (fetch a))))
+          (list page (await (fetch b))))))
+
+Calling a procedure made with `async-fn` returns a coroutine rather than
+running its body. Inside the body, (await x) suspends evaluation until the
+awaitable x (a coroutine, a Task, an asyncio or concurrent future) has a
+result, handing control back to the event loop in the meantime: here
+`fetch` would be an async Python function. Many scripts can then be in
+flight on the same loop at once: use Evaluator.eval_async or
+Interpretor.eval_expr_async to run one.
+
+eval_async is Evaluator.eval's trampoline written as a coroutine. It only
+walks the parts of an expression that contain an `await`: anything else is
+handed straight to the Evaluator to run as normal, in whatever mode it is
+in. A call to an async-fn in tail position under an `await` is run in the
+same loop rather than as a new coroutine, so async code that recurses in
+tail position runs in constant stack.
+
+Sub-expressions are compiled every time they are reached when running in
+closure mode, which is cheap next to waiting for I/O.
+'''
+import asyncio
+from inspect import isawaitable
+from concurrent.futures import Future
+
+from .persistent import COLLECTIONS, elements, rebuild
+from .types import (
+    Symbol, LispList, Procedure, RiplError,
+    QUOTE, QUASIQUOTE, UNQUOTES, IF, COND, SET, DEFINE, LAMBDAS, DEFN,
+    DEFMACRO, LET, BEGIN, EVAL, APPLY, LOOP, RECUR, ELSE, ASYNC_FN, AWAIT
+)
+
+
+# Forms whose contents aren't run when the form is: an await inside one of
+# them isn't an await in the expression around it
+OPAQUE = frozenset([QUOTE, QUASIQUOTE, DEFN, DEFMACRO, ASYNC_FN, *LAMBDAS])
+SPECIAL_FORMS = OPAQUE | frozenset([
+    IF, COND, SET, DEFINE, LET, BEGIN, EVAL, APPLY, LOOP, RECUR, AWAIT,
+    *UNQUOTES
+])
+# The number of forms to remember whether they contain an await
+max_cached = 4096
+# id(form) -> (form, macro table, targets, result)
+_cache = {}
+
+
+class AsyncProcedure:
+    '''
+    A procedure defined with `async-fn`. Calling it returns a coroutine
+    that evaluates the body.
+    '''
+    def __init__(self, params, docstring, body, env, evaluator):
+        self._params = params
+        self._body = body
+        self._outer_env = env
+        self._evaluator = evaluator
+        self.__doc__ = docstring
+
+    get_call_env = Procedure.get_call_env
+
+    def __call__(self, *args):
+        return eval_async(
+            self._evaluator, self._body, self.get_call_env(args))
+
+
+def await_outside(x):
+    '''What `await` does when it isn't inside of an async-fn'''
+    raise RiplError('`await` can only be used inside of an async-fn')
+
+
+def contains(evaluator, expr, targets):
+    '''
+    Will running expr reach one of the special forms in `targets`?
+    Macros are expanded on the way so that ones which expand to an await
+    are found.
+    '''
+    hit = _cache.get(id(expr))
+    if (hit is not None and hit[1] is evaluator.macro_table and
+            hit[2] is targets):
+        return hit[3]
+
+    macro_table = evaluator.macro_table
+    found, stack = False, [expr]
+    while stack:
+        form = stack.pop()
+        if isinstance(form, COLLECTIONS):
+            stack.extend(elements(form))
+            continue
+        elif type(form) is not LispList or not form:
+            continue
+
+        head = form.car
+        if type(head) is not Symbol:
+            stack.extend(form)
+        elif head in targets:
+            found = True
+            break
+        elif head in macro_table:
+            stack.append(evaluator.expand_once(form, macro_table[head]))
+        elif head not in OPAQUE:
+            stack.extend(form)
+
+    if len(_cache) >= max_cached:
+        _cache.clear()
+    _cache[id(expr)] = (expr, macro_table, targets, found)
+    return found
+
+
+AWAITS = frozenset([AWAIT])
+# Inside of a loop that awaits, recur has to come back to it
+AWAITS_OR_RECURS = frozenset([AWAIT, RECUR])
+
+
+def awaitable(val):
+    '''Check that val can be awaited, adapting thread pool futures'''
+    if isinstance(val, Future):
+        return asyncio.wrap_future(val)
+
+    if not isawaitable(val):
+        raise RiplError(f'Can only await an awaitable, not {val!r}')
+
+    return val
+
+
+async def _sub(evaluator, expr, env):
+    '''Evaluate a sub-expression, only making a coroutine if needed'''
+    if contains(evaluator, expr, AWAITS):
+        return await eval_async(evaluator, expr, env)
+    return evaluator.eval(expr, env)
+
+
+async def eval_async(evaluator, expr, env=None):
+    '''
+    Evaluate an expression as a coroutine, suspending at each await.
+    This has the same signature as Evaluator.eval.
+    '''
+    if env is None:
+        env = evaluator.global_env
+
+    run = evaluator.eval
+    macro_table = evaluator.macro_table
+    # The innermost (frame, names, body, env) that `recur` jumps to
+    loop = None
+    targets = AWAITS
+
+    while True:
+        if not contains(evaluator, expr, targets):
+            return run(expr, env)
+
+        if isinstance(expr, COLLECTIONS):
+            return rebuild(expr, [
+                await _sub(evaluator, e, env) for e in elements(expr)])
+
+        head, *rest = expr
+        macro = macro_table.get(head) if type(head) is Symbol else None
+        if macro:
+            expr = evaluator.expand_once(expr, macro)
+            continue
+
+        if head is AWAIT:
+            if len(rest) != 1:
+                raise RiplError(f'Malformed `await` form: {rest}')
+
+            target = rest[0]
+            call = type(target) is LispList and target
+            while call and type(target.car) is Symbol:
+                if target.car in SPECIAL_FORMS:
+                    call = False
+                elif target.car in macro_table:
+                    target = evaluator.expand_once(
+                        target, macro_table[target.car])
+                    call = type(target) is LispList and target
+                else:
+                    break
+
+            if not call:
+                val = await _sub(evaluator, target, env)
+            else:
+                proc, *args = [await _sub(evaluator, x, env) for x in target]
+                if (type(proc) is AsyncProcedure and
+                        proc._evaluator is evaluator):
+                    # Run the body here rather than awaiting a new coroutine
+                    expr = proc._body
+                    env = proc.get_call_env(args)
+                    loop, targets = None, AWAITS
+                    continue
+                val = proc(*args)
+
+            return await awaitable(val)
+
+        elif head is IF:
+            if not 2 <= len(rest) <= 3:
+                raise RiplError(f'Malformed `if` form: {rest}')
+
+            if await _sub(evaluator, rest[0], env):
+                expr = rest[1]
+            elif len(rest) == 3:
+                expr = rest[2]
+            else:
+                return None
+
+        elif head is COND:
+            for branch in rest:
+                if not (isinstance(branch, LispList) and len(branch) == 2):
+                    raise RiplError(f'Invalid `cond` branche: {branch}')
+
+                cond, body = branch
+                cond = await _sub(evaluator, cond, env)
+
+                if cond is ELSE or cond is True:
+                    expr = body
+                    break
+                elif cond is not False:
+                    raise RiplError(f'Invalid `cond` condition: {cond}')
+            else:
+                # No branch matched
+                return None
+
+        elif head is LET:
+            bindings, body = rest
+            parms, vals = zip(*bindings)
+            vals = [await _sub(evaluator, val, env) for val in vals]
+            env = env.new_child(dict(zip(parms, vals)))
+            expr = body
+
+        elif head is BEGIN:
+            for exp in rest[:-1]:
+                await _sub(evaluator, exp, env)
+
+            expr = rest[-1]
+
+        elif head is DEFINE:
+            try:
+                sym, value = rest
+            except ValueError:
+                raise RiplError(f'Invalid `define`: {LispList(rest)}')
+
+            if not isinstance(sym, Symbol):
+                raise RiplError(f'Attempt to define non-Symbol: {sym}')
+
+            if not evaluator.can_define(sym, env.get(sym)):
+                raise RiplError(f'Attempt to re-define symbol: {sym}')
+
+            evaluator.define(env, sym, await _sub(evaluator, value, env))
+            return None
+
+        elif head is SET:
+            try:
+                sym, value = rest
+            except ValueError:
+                raise RiplError(f'Invalid `set!`: {LispList(rest)}')
+
+            if env.get(sym) is None:
+                raise RiplError(
+                    f'Attempt to `set!` non existant symbol: {sym}')
+
+            evaluator.assign(env, sym, await _sub(evaluator, value, env))
+            return None
+
+        elif head is LOOP:
+            # One frame for the whole loop that recur rebinds
+            names, inits, body, fresh = evaluator.loop_parts(expr)
+            inits = [await _sub(evaluator, init, env) for init in inits]
+            frame = dict(zip(names, inits))
+            env = env.new_child(frame)
+            loop = (frame, names, body, env, fresh)
+            targets = AWAITS_OR_RECURS
+            expr = body
+
+        elif head is RECUR:
+            if loop is None:
+                raise RiplError(f'`recur` outside of `loop`: {expr}')
+
+            vals = [await _sub(evaluator, val, env) for val in rest]
+            frame, names, expr, env, fresh = loop
+            if fresh:
+                # Procedures made so far keep the old bindings
+                frame = dict(zip(names, vals))
+                env = env.parents.new_child(frame)
+                loop = (frame, names, expr, env, fresh)
+            else:
+                for name, val in zip(names, vals):
+                    frame[name] = val
+
+        elif head is EVAL or head is APPLY or head in UNQUOTES:
+            raise RiplError(f"`await` isn't supported inside of `{head}`")
+
+        else:
+            # A call with an await in its arguments: the result is not
+            # awaited unless the call is itself inside of an await
+            proc, *args = [await _sub(evaluator, x, env) for x in expr]
+            return proc(*args)
@@ -0,0 +1,108 @@
+'''
+Numeric arrays backed by numpy, if it is installed.
+
+(array [1 2 3]) or (array buffer) makes a numpy ndarray: anything that
+supports the buffer protocol (bytes, array.array, memoryviews, other
+arrays) is wrapped without copying its data. The arithmetic and comparison
+builtins work element-wise on arrays, broadcasting against numbers and
+other arrays, so a whole array is handled in a single call rather than
+one element at a time through a RIPL loop. Comparisons give boolean arrays
+that can be used as masks:
+    (mask xs (> xs 0))        -> the positive elements of xs
+    (where (> xs 0) xs 0)     -> xs with the negative elements zeroed
+
+sum, mean, min, max and dot run in numpy for arrays and fall back to plain
+Python for any other iterable. Arrays are ordinary ndarrays so they can be
+passed straight to (and returned from) pyimported numpy functions.
+'''
+import builtins
+
+from .types import RiplError
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _require():
+    if np is None:
+        raise RiplError('Arrays need numpy: pip install ripl[arrays]')
+
+
+def is_array(x):
+    return np is not None and isinstance(x, np.ndarray)
+
+
+def array(data, dtype=None):
+    '''
+    A numeric array of the elements of data. Buffers (including other
+    arrays) are shared rather than copied when no conversion is needed.
+    '''
+    _require()
+
+    if isinstance(data, np.ndarray):
+        return data if dtype is None else data.astype(dtype, copy=False)
+
+    try:
+        view = memoryview(data)
+    except TypeError:
+        # Vectors, lists and seqs of numbers
+        return np.array(list(data), dtype=dtype)
+
+    return np.asarray(view, dtype=dtype)
+
+
+def mask(arr, bools):
+    '''The elements of an array where the boolean array `bools` is true'''
+    _require()
+    return np.asarray(arr)[np.asarray(bools, dtype=bool)]
+
+
+def where(bools, a, b):
+    '''Element-wise (if bools a b) across arrays and numbers'''
+    _require()
+    return np.where(bools, a, b)
+
+
+def array_sum(xs, start=0):
+    '''The sum of the elements of xs'''
+    if is_array(xs):
+        return xs.sum() + start
+    return builtins.sum(xs, start)
+
+
+def mean(xs):
+    '''The arithmetic mean of the elements of xs'''
+    if is_array(xs):
+        return xs.mean()
+
+    xs = list(xs)
+    if not xs:
+        raise RiplError('mean of an empty sequence')
+    return builtins.sum(xs) / len(xs)
+
+
+def array_min(xs, *rest, **kwargs):
+    '''The smallest element of xs, or the smallest argument'''
+    if not rest and is_array(xs):
+        return xs.min()
+    return builtins.min(xs, *rest, **kwargs)
+
+
+def array_max(xs, *rest, **kwargs):
+    '''The largest element of xs, or the largest argument'''
+    if not rest and is_array(xs):
+        return xs.max()
+    return builtins.max(xs, *rest, **kwargs)
+
+
+def dot(a, b):
+    '''The dot product of two arrays or sequences of numbers'''
+    if is_array(a) or is_array(b):
+        return np.dot(a, b)
+
+    a, b = list(a), list(b)
+    if len(a) != len(b):
+        raise RiplError('dot of sequences with different lengths')
+    return builtins.sum(x * y for x, y in zip(a, b))
@@ -0,0 +1,214 @@
+'''
+An on-disk cache of read (and macro expanded) forms for *.rpl files.
+
+A cached copy of each file that has been evaluated is written to a per
+user cache directory (see default_cache_dir) or, much like Python's
+__pycache__, to a __riplcache__ directory next to the file if no cache
+directory is given. Keeping them out of the source tree means that files
+in read only or shared places, like the prelude, can still be cached.
+
+A cache file is a header followed by one pickle per top level form so
+that it can be written and read back a form at a time, keeping memory
+bounded just like reading the source.
+
+The header records a key built from the source text, the interpreter
+version and a fingerprint of the macros that were defined when the file
+was first loaded: the stored forms have had those macros expanded so they
+are only valid if the same macros are present. Any mismatch is a miss and
+the file is read from source again.
+
+Loading a cache file unpickles it, which can run arbitrary code, so the
+directory that it is in must be private to the user: one that belongs to
+someone else, or that anyone else can write to, is never read from or
+written to. Cache directories are made with mode 0o700.
+'''
+import os
+import mmap
+import stat
+import pickle
+import hashlib
+import tempfile
+
+from . import __version__
+
+
+MAGIC = b'RPLC'
+CACHE_DIR_NAME = '__riplcache__'
+SUFFIX = f'.ripl-{__version__}.rplc'
+
+
+def default_cache_dir():
+    '''$RIPL_CACHE_DIR, or ripl in the user's cache directory'''
+    path = os.environ.get('RIPL_CACHE_DIR')
+    if path:
+        return path
+
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'ripl')
+
+
+def is_private(dirname):
+    '''
+    Is a directory safe to load cached code from: it belongs to the user
+    and nobody else can write to it?
+    '''
+    try:
+        st = os.lstat(dirname)
+    except OSError:
+        return False
+
+    return (stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid() and
+            not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH))
+
+
+def make_private_dir(dirname):
+    '''Create a cache directory if needed: True if it is safe to use'''
+    try:
+        os.makedirs(dirname, mode=0o700, exist_ok=True)
+    except OSError:
+        return False
+
+    return is_private(dirname)
+
+
+def fingerprint(evaluator):
+    '''Identify the macros that have been defined'''
+    return repr(sorted(
+        (name, repr(macro._params), repr(macro._body))
+        for name, macro in evaluator.macro_table.items()
+    ))
+
+
+class FormCache:
+    '''
+    Read and write cached forms for source files.
+    If `cache_dir` is None the cache lives alongside each source file.
+    '''
+    def __init__(self, cache_dir=None, version=__version__):
+        self.cache_dir = cache_dir
+        self.version = version
+
+    def path_for(self, fname):
+        '''Where the cache for a given source file lives'''
+        fname = os.path.abspath(fname)
+        base = os.path.basename(fname) + SUFFIX
+
+        if self.cache_dir is None:
+            return os.path.join(os.path.dirname(fname), CACHE_DIR_NAME, base)
+
+        # Avoid collisions between files of the same name
+        tag = hashlib.sha1(fname.encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'{tag}-{base}')
+
+    def key(self, fname, fingerprint):
+        '''Hash the source along with everything the cache depends on'''
+        digest = hashlib.sha256()
+        digest.update(f'{self.version}\0{fingerprint}\0'.encode())
+
+        with open(fname, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > 0:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    digest.update(m)
+
+        return digest.hexdigest()
+
+    def load(self, fname, key):
+        '''
+        Return an iterator over the cached forms for a file or None if
+        there is no valid cache entry.
+        '''
+        path = self.path_for(fname)
+        if not is_private(os.path.dirname(path)):
+            return None
+
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return None
+
+        try:
+            header = pickle.load(f)
+        except Exception:
+            f.close()
+            return None
+
+        if header != (MAGIC, self.version, key):
+            f.close()
+            return None
+
+        return self._forms(f)
+
+    @staticmethod
+    def _forms(f):
+        with f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
+    def writer(self, fname, key):
+        '''Start writing a new cache entry for a file'''
+        return CacheWriter(self.path_for(fname), (MAGIC, self.version, key))
+
+
+class CacheWriter:
+    '''
+    Write cached forms one at a time as a context manager: the entry is
+    only put in place if the block exits cleanly. Failing to write the
+    cache is never an error, the file just won't be cached.
+    '''
+    def __init__(self, path, header):
+        self.path = path
+        self.header = header
+        self._file = None
+
+    def __enter__(self):
+        dirname = os.path.dirname(self.path)
+        if not make_private_dir(dirname):
+            # Nothing would ever be loaded from here
+            return self
+
+        try:
+            fd, self._tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+            self._file = os.fdopen(fd, 'wb')
+            self._dump(self.header)
+        except OSError:
+            self._close(discard=True)
+
+        return self
+
+    def add(self, form):
+        '''Record the next top level form'''
+        if self._file is None:
+            return
+
+        try:
+            self._dump(form)
+        except Exception:
+            # Expanded forms can hold any value that a macro put there and
+            # not all of them pickle: the file just isn't cached
+            self._close(discard=True)
+
+    def _dump(self, obj):
+        # Each form is a pickle of its own so that reading back is bounded
+        pickle.dump(obj, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._close(discard=exc_type is not None)
+
+    def _close(self, discard):
+        if self._file is None:
+            return
+
+        try:
+            self._file.close()
+            if discard:
+                os.unlink(self._tmp)
+            else:
+                os.replace(self._tmp, self.path)
+        except OSError:
+            pass
+
+        self._file = None
@@ -0,0 +1,471 @@
+'''
+Evaluate internal expressions on an explicit stack.
+
+Evaluator.eval recurses through Python for everything that isn't in tail
+position: each argument, each `if` test and each non-tail call is another
+Python frame, so non tail recursive code dies with a RecursionError after
+a few hundred levels. The Machine is a CEK machine instead: the state is
+the expression being reduced (Control), the Environment that it is being
+reduced in and a stack of frames saying what to do with the value once we
+have it (the Kontinuation). Running a program is a single loop with no
+recursion, so the depth of recursion is only limited by memory.
+
+The machine alternates between two phases:
+
+    - reduce `expr` in `env`: either to a value directly (constants and
+      symbols) or by pushing a frame and moving on to a sub-expression
+    - hand a value to the frame on top of the stack, which either asks
+      for another sub-expression to be reduced or produces a value itself
+
+Calls to Procedures replace the control and environment rather than
+pushing anything, which gives tail calls for free. (Procedures that belong
+to another Evaluator, such as the base of a clone, are called like Python
+functions so that they run against their own globals.) A `loop` leaves a BODY
+frame under its body holding the environment that `recur` rebinds: it is
+dropped by any tail call out of the loop so that doesn't grow the stack.
+Arguments that are constants or symbols are evaluated where they stand
+rather than taking a trip through the stack.
+
+Python functions that call back into ripl (map, reduce...), macro
+expansion, the unquotes in a quasiquote and the elements of vector and map
+literals still start a nested run of the machine: only that boundary uses
+the Python stack.
+'''
+from types import FunctionType
+
+from .env import BINARY
+from .persistent import COLLECTIONS
+from .types import (
+    Symbol, LispList, Procedure, RiplError, arity_error,
+    QUOTE, QUASIQUOTE, UNQUOTES, IF, COND, SET, DEFINE, LAMBDAS, DEFN,
+    DEFMACRO, LET, BEGIN, EVAL, APPLY, LOOP, RECUR, ELSE, ASYNC_FN
+)
+from .aio import AsyncProcedure
+
+
+# Frame kinds. Call and let frames are lists so that they can be filled in
+# as their values arrive, the rest are tuples.
+#   [CALL, remaining exprs, env, values]
+#   [LET, remaining exprs, env, values, names, body]
+#   [LOOP, remaining exprs, env, values, names, body, fresh]
+#   [RECUR, remaining exprs, env, values]
+#   (BODY, loop frame, names, body, env, fresh)
+#   (IF, true branch, false branch, env)
+#   (COND, body, remaining branches, env)
+#   (BEGIN, remaining exprs, env)
+#   (DEFINE, sym, env)
+#   (SET, sym, env)
+#   (EVAL,)
+(CALL, LET_, LOOP_, RECUR_, BODY_, IF_, COND_, BEGIN_, DEFINE_,
+ SET_, EVAL_) = range(11)
+# Frames that collect a list of values
+FILLED = frozenset([CALL, LET_, LOOP_, RECUR_])
+
+SPECIAL_FORMS = frozenset([
+    QUOTE, QUASIQUOTE, IF, COND, SET, DEFINE, DEFN, DEFMACRO, LET, BEGIN,
+    EVAL, APPLY, LOOP, RECUR, ASYNC_FN, *LAMBDAS, *UNQUOTES
+])
+
+# Marks that a frame has only just been pushed and has no value to take
+START = object()
+# An `if` with no false branch
+MISSING = object()
+
+
+class Machine:
+    '''Run expressions for an Evaluator without using the Python stack'''
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.value_types = evaluator.value_types
+
+    def run(self, expr, env=None):
+        '''
+        Evaluate an expression in an environment.
+        This has the same signature as Evaluator.eval.
+        '''
+        evaluator = self.evaluator
+        global_env = evaluator.global_env
+        macro_table = evaluator.macro_table
+        value_types = self.value_types
+
+        if env is None:
+            env = global_env
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+
+        while True:
+            # Reduce `expr` in `env`: end up with `val` or a new `expr`
+            kind = type(expr)
+
+            if kind is Symbol:
+                for m in env.maps:
+                    if expr in m:
+                        val = m[expr]
+                        break
+                else:
+                    val = None
+
+                if val is None:
+                    raise RiplError(f'Unknown symbol: `{expr}`')
+
+            elif kind is not LispList:
+                if isinstance(expr, value_types):
+                    val = expr
+                elif isinstance(expr, COLLECTIONS):
+                    val = evaluator.fill_collection(expr, env)
+                else:
+                    raise RiplError(f'Unknown expression in input: {expr}')
+
+            elif not expr._len:
+                val = expr
+
+            elif type(expr.car) is not Symbol or (
+                    expr.car not in SPECIAL_FORMS):
+                head = expr.car
+                macro = macro_table.get(head) if type(head) is Symbol else None
+                if macro:
+                    # Run the macro (once per call site) and then evaluate
+                    # the expansion in its place
+                    expr = evaluator.expand_once(expr, macro)
+                    continue
+
+                # A call: the head and arguments are collected in a frame
+                push([CALL, expr, env, []])
+                val = START
+
+            else:
+                head = expr.car
+                macro = macro_table.get(head)
+                if macro:
+                    expr = evaluator.expand_once(expr, macro)
+                    continue
+
+                rest = expr.cdr
+                nargs = rest._len
+
+                if head is IF:
+                    if not 2 <= nargs <= 3:
+                        raise RiplError(f'Malformed `if` form: {rest}')
+
+                    cond, rest = rest.car, rest.cdr
+                    false = rest.cdr.car if nargs == 3 else MISSING
+                    push((IF_, rest.car, false, env))
+                    expr = cond
+                    continue
+
+                elif head is BEGIN:
+                    if not nargs:
+                        raise RiplError('Empty `begin` form')
+                    if nargs > 1:
+                        push((BEGIN_, rest.cdr, env))
+                    expr = rest.car
+                    continue
+
+                elif head is LET:
+                    if nargs != 2 or not rest.car:
+                        raise RiplError(f'Malformed `let` form: {rest}')
+
+                    bindings, body = rest
+                    names = [binding.car for binding in bindings]
+                    exprs = LispList(binding.cdr.car for binding in bindings)
+                    push([LET_, exprs, env, [], names, body])
+                    val = START
+
+                elif head is LOOP:
+                    names, inits, body, fresh = evaluator.loop_parts(expr)
+                    push([LOOP_, LispList(inits), env, [], names, body, fresh])
+                    val = START
+
+                elif head is RECUR:
+                    push([RECUR_, rest, env, []])
+                    val = START
+
+                elif head is COND:
+                    if not nargs:
+                        # No branch matched
+                        val = None
+                    else:
+                        branch = _branch(rest.car)
+                        push((COND_, branch.cdr.car, rest.cdr, env))
+                        expr = branch.car
+                        continue
+
+                elif head is QUOTE:
+                    val = rest.car
+
+                elif head in LAMBDAS:
+                    if nargs != 2:
+                        raise RiplError(
+                            f'Invalid procedure definition: {rest}')
+                    params, body = rest
+                    val = Procedure(params, "", body, env, evaluator)
+
+                elif head is ASYNC_FN:
+                    if nargs != 2:
+                        raise RiplError(
+                            f'Invalid procedure definition: {rest}')
+                    params, body = rest
+                    val = AsyncProcedure(params, "", body, env, evaluator)
+
+                elif head is DEFINE:
+                    sym, value = _binding(rest, 'define')
+                    if not isinstance(sym, Symbol):
+                        raise RiplError(f'Attempt to define non-Symbol: {sym}')
+
+                    if not evaluator.can_define(sym, env.get(sym)):
+                        raise RiplError(f'Attempt to re-define symbol: {sym}')
+
+                    push((DEFINE_, sym, env))
+                    expr = value
+                    continue
+
+                elif head is SET:
+                    sym, value = _binding(rest, 'set!')
+                    if not isinstance(sym, Symbol):
+                        raise RiplError(f'Attempt to `set!` non-Symbol: {sym}')
+
+                    if env.get(sym) is None:
+                        raise RiplError(
+                            f'Attempt to `set!` non existant symbol: {sym}')
+
+                    push((SET_, sym, env))
+                    expr = value
+                    continue
+
+                elif head is DEFN:
+                    name, doc_str, params, body = _defn(rest, 'procedure')
+                    if not evaluator.can_define(name, env.get(name)):
+                        raise RiplError(
+                            f'Attempt to re-define symbol: {name}')
+
+                    evaluator.define(env, name, Procedure(
+                        params, doc_str, body, env, evaluator))
+                    val = None
+
+                elif head is DEFMACRO:
+                    if env is not global_env:
+                        raise RiplError(
+                            'Macro definition only allowed at the top level')
+
+                    name, doc_str, params, body = _defn(rest, 'macro')
+                    evaluator.define_macro(name, Procedure(
+                        params, doc_str, body, env, evaluator))
+                    val = None
+
+                elif head is APPLY:
+                    # (apply f args...) is a call of f
+                    push([CALL, rest, env, []])
+                    val = START
+
+                elif head is EVAL:
+                    # The value of the argument is run in the global env
+                    if nargs != 1:
+                        raise RiplError(f'Malformed `eval` form: {rest}')
+                    push((EVAL_,))
+                    expr = rest.car
+                    continue
+
+                elif head is QUASIQUOTE:
+                    val = evaluator.fill_quasiquote(rest.car, env)
+
+                else:
+                    raise RiplError("Can't unquote outside of quasi-quote")
+
+            # Hand `val` to whatever is waiting for it until one of them
+            # needs something else reducing
+            while stack:
+                frame = stack[-1]
+                kind = frame[0]
+
+                if kind is CALL or kind in FILLED:
+                    vals = frame[3]
+                    if val is not START:
+                        vals.append(val)
+
+                    # Symbols and constants are evaluated in place
+                    rest, fenv = frame[1], frame[2]
+                    while rest._len:
+                        arg = rest.car
+                        rest = rest.cdr
+                        arg_type = type(arg)
+
+                        if arg_type is Symbol:
+                            for m in fenv.maps:
+                                if arg in m:
+                                    val = m[arg]
+                                    break
+                            else:
+                                val = None
+
+                            if val is None:
+                                raise RiplError(f'Unknown symbol: `{arg}`')
+                            vals.append(val)
+
+                        elif arg_type is LispList:
+                            if arg._len:
+                                break
+                            vals.append(arg)
+
+                        elif isinstance(arg, value_types):
+                            vals.append(arg)
+
+                        elif isinstance(arg, COLLECTIONS):
+                            vals.append(evaluator.fill_collection(arg, fenv))
+
+                        else:
+                            raise RiplError(
+                                f'Unknown expression in input: {arg}')
+                    else:
+                        arg = None
+
+                    if arg is not None:
+                        # Needs reducing in its own right
+                        frame[1] = rest
+                        expr, env = arg, fenv
+                        break
+
+                    pop()
+                    if kind is LET_:
+                        env = fenv.new_child(dict(zip(frame[4], vals)))
+                        expr = frame[5]
+                        break
+
+                    elif kind is LOOP_:
+                        names = frame[4]
+                        loop = dict(zip(names, vals))
+                        env = fenv.new_child(loop)
+                        expr = frame[5]
+                        push((BODY_, loop, names, expr, env, frame[6]))
+                        break
+
+                    elif kind is RECUR_:
+                        if not stack or stack[-1][0] is not BODY_:
+                            raise RiplError('`recur` outside of `loop`')
+
+                        _, loop, names, expr, env, fresh = stack[-1]
+                        if fresh:
+                            # Procedures made so far keep the old bindings
+                            loop = dict(zip(names, vals))
+                            env = env.parents.new_child(loop)
+                            stack[-1] = (BODY_, loop, names, expr, env, fresh)
+                        else:
+                            for name, val in zip(names, vals):
+                                loop[name] = val
+                        break
+
+                    proc = vals[0]
+                    if type(proc) is Procedure and (
+                            proc._evaluator is evaluator):
+                        if stack and stack[-1][0] is BODY_:
+                            # A tail call out of a loop
+                            pop()
+
+                        params = proc._params
+                        if type(params) is Symbol:
+                            env = proc.get_call_env(vals[1:])
+                        else:
+                            if len(vals) != len(params) + 1:
+                                raise arity_error(params, vals[1:])
+                            env = proc._outer_env.new_child(
+                                dict(zip(params, vals[1:])))
+                        expr = proc._body
+                        break
+
+                    if len(vals) == 3 and type(proc) is FunctionType:
+                        # (+ a b) and friends skip the variadic wrapper
+                        binary = BINARY.get(proc)
+                        if binary is not None:
+                            val = binary(vals[1], vals[2])
+                            continue
+
+                    # Python functions are just called
+                    val = proc(*vals[1:])
+                    continue
+
+                pop()
+                if kind is BODY_:
+                    # The loop is finished
+                    continue
+
+                elif kind is IF_:
+                    if val:
+                        expr, env = frame[1], frame[3]
+                        break
+                    if frame[2] is MISSING:
+                        val = None
+                        continue
+                    expr, env = frame[2], frame[3]
+                    break
+
+                elif kind is BEGIN_:
+                    rest, env = frame[1], frame[2]
+                    if rest.cdr._len:
+                        push((BEGIN_, rest.cdr, env))
+                    expr = rest.car
+                    break
+
+                elif kind is COND_:
+                    if val is ELSE or (isinstance(val, bool) and val):
+                        expr, env = frame[1], frame[3]
+                        break
+                    if not isinstance(val, bool):
+                        raise RiplError(f'Invalid `cond` condition: {val}')
+
+                    rest, env = frame[2], frame[3]
+                    if not rest._len:
+                        # No branch matched
+                        val = None
+                        continue
+
+                    branch = _branch(rest.car)
+                    push((COND_, branch.cdr.car, rest.cdr, env))
+                    expr = branch.car
+                    break
+
+                elif kind is DEFINE_:
+                    _, sym, denv = frame
+                    evaluator.define(denv, sym, val)
+                    val = None
+
+                elif kind is EVAL_:
+                    expr, env = val, global_env
+                    break
+
+                else:
+                    evaluator.assign(frame[2], frame[1], val)
+                    val = None
+
+            else:
+                return val
+
+
+def _branch(branch):
+    '''Check a (cond body) pair from a `cond` form'''
+    if not (isinstance(branch, LispList) and len(branch) == 2):
+        raise RiplError(f'Invalid `cond` branche: {branch}')
+    return branch
+
+
+def _binding(rest, form):
+    '''The (sym value) of a define or set!'''
+    if len(rest) != 2:
+        raise RiplError(f'Invalid `{form}`: {rest}')
+    return rest
+
+
+def _defn(rest, kind):
+    '''Split up a (name [docstring] params body) definition'''
+    rest = list(rest)
+    doc_str = rest.pop(1) if len(rest) == 4 else ""
+
+    try:
+        name, params, body = rest
+    except ValueError:
+        raise RiplError(f'Invalid {kind} definition: {rest}')
+
+    if not isinstance(name, Symbol):
+        raise RiplError(f'Attempt to define non-Symbol: {name}')
+
+    return name, doc_str, params, body
@@ -0,0 +1,458 @@
+'''
+Go blocks and channels: lightweight tasks that communicate by message.
+
+    (define c (chan))
+    (go (>! c (* 6 7)))
+    (<!! c)                 ; 42
+
+(go body) starts body as a task and returns a channel that gets its
+result: if body raises then taking the result raises the same error.
+Tasks are async-fn coroutines (see ripl.aio) run by a single cooperative
+scheduler rather than by threads, so a parked task costs about as much
+memory as its environment and the coroutine evaluating it: a hundred
+thousand of them are fine.
+
+Inside of a go block:
+    (<! c)          take a value from c, parking until there is one
+    (>! c x)        put x on c, parking until there is room
+    (alts ops)      do whichever of the ops can happen first: each op is a
+                    channel to take from or a (channel value) pair to put.
+                    Returns (value channel)
+Outside of one the same operations block the calling thread instead:
+<!!, >!! and alts!!. These run any tasks that are ready while they wait
+and can be used from any thread. If nothing else could ever make one of
+them go ahead then it raises a deadlock error rather than hanging.
+
+(chan) is unbuffered: a put waits for a taker. (chan n) buffers up to n
+values. Taking from a closed, empty channel gives nil and putting on a
+closed channel gives #f.
+
+Tasks only run while some thread is in one of the blocking operations (or
+in `go`) and only one of them runs at a time, so a task that blocks stalls
+all of them. (thread-call f arg ...) runs a blocking Python call on the
+thread pool from ripl.futures and returns a channel that gets its result,
+so a go block can park on it with <! instead.
+'''
+from collections import deque
+from inspect import isawaitable
+from threading import (
+    Condition, RLock, current_thread, enumerate as all_threads
+)
+
+from .types import LispList, RiplError
+from .persistent import PersistentVector
+from . import futures
+
+
+# Marks the take half of an operation
+TAKE = object()
+
+
+class Failure:
+    '''An error to raise in whoever receives this rather than a value'''
+    __slots__ = ('error',)
+
+    def __init__(self, error):
+        self.error = error
+
+
+class Task:
+    '''A go block: its coroutine and the channel that gets its result'''
+    __slots__ = ('coro', 'result')
+
+    def __init__(self, coro, result):
+        self.coro = coro
+        self.result = result
+
+
+class Handle:
+    '''
+    Something waiting on a channel operation: a parked Task or, if `task`
+    is None, a thread blocked in <!! and friends. One handle can be queued
+    on several channels by alts: only the first to fire it counts, and it
+    is then taken out of the queues of the others.
+    '''
+    __slots__ = ('task', 'alt', 'active', 'value', 'ports')
+
+    def __init__(self, task, alt):
+        self.task = task
+        self.alt = alt
+        self.active = True
+        self.value = None
+        # The (channel, value) pairs it is queued on
+        self.ports = ()
+
+    def fire(self, value, chan):
+        self.active = False
+        self.unpark(chan)
+        if self.alt and type(value) is not Failure:
+            value = LispList([value, chan])
+
+        if self.task is None:
+            self.value = value
+            scheduler.cond.notify_all()
+        else:
+            scheduler.ready.append((self.task, value))
+
+    def unpark(self, fired=None):
+        '''Leave the queue of every channel but the one that fired'''
+        ports, self.ports = self.ports, ()
+        for chan, val in ports:
+            if chan is not fired:
+                chan.unpark(self, val)
+
+
+class Op:
+    '''
+    A channel operation for a go block to park on: `await`ing it hands it
+    to the scheduler. `ports` are (channel, value) pairs with TAKE as the
+    value for a take.
+    '''
+    __slots__ = ('ports', 'alt')
+
+    def __init__(self, ports, alt=False):
+        for chan, _ in ports:
+            if not isinstance(chan, Channel):
+                raise RiplError(f'Not a channel: {chan!r}')
+        self.ports = ports
+        self.alt = alt
+
+    def __await__(self):
+        return (yield self)
+
+
+class Channel:
+    '''
+    A queue of values between tasks with at most `size` values buffered.
+    Takers and putters that can't go ahead yet wait in line as Handles.
+    '''
+    __slots__ = ('buffer', 'size', 'takers', 'putters', 'closed')
+
+    def __init__(self, size=0):
+        # Most channels never queue anything (every go block has one for
+        # its result) so the deques are only made when they are needed
+        self.buffer = self.takers = self.putters = ()
+        self.size = size
+        self.closed = False
+
+    def park(self, handle, val):
+        '''Queue a handle until the operation can go ahead'''
+        if val is TAKE:
+            if not self.takers:
+                self.takers = deque()
+            self.takers.append((handle, val))
+        else:
+            if not self.putters:
+                self.putters = deque()
+            self.putters.append((handle, val))
+
+    def unpark(self, handle, val):
+        '''Stop a handle waiting on this channel'''
+        queue = self.takers if val is TAKE else self.putters
+        if queue:
+            try:
+                queue.remove((handle, val))
+            except ValueError:
+                pass
+
+    def push(self, val):
+        if not self.buffer:
+            self.buffer = deque()
+        self.buffer.append(val)
+
+    def poll_take(self):
+        '''Take a value if one is ready: returns (done, value)'''
+        buffer, putters = self.buffer, self.putters
+        if buffer:
+            val = buffer.popleft()
+            # Room for a waiting putter to go ahead
+            while putters and len(buffer) < self.size:
+                handle, put = putters.popleft()
+                if handle.active:
+                    self.push(put)
+                    handle.fire(True, self)
+            return True, val
+
+        while putters:
+            handle, put = putters.popleft()
+            if handle.active:
+                handle.fire(True, self)
+                return True, put
+
+        if self.closed:
+            return True, None
+        return False, None
+
+    def poll_put(self, val):
+        '''Put a value if there is room or a taker: returns (done, put)'''
+        if self.closed:
+            return True, False
+
+        takers = self.takers
+        while takers:
+            handle, _ = takers.popleft()
+            if handle.active:
+                handle.fire(val, self)
+                return True, True
+
+        if len(self.buffer) < self.size:
+            self.push(val)
+            return True, True
+        return False, None
+
+    def offer(self, val):
+        '''Put a value without ever waiting, overfilling the buffer'''
+        if not self.poll_put(val)[0]:
+            self.push(val)
+
+    def close(self):
+        '''No more puts: anyone waiting to take gets nil'''
+        self.closed = True
+        takers = self.takers
+        while takers:
+            handle, _ = takers.popleft()
+            if handle.active:
+                handle.fire(None, self)
+
+    def __repr__(self):
+        return f'<chan {len(self.buffer)}/{self.size}>'
+
+
+class Scheduler:
+    '''
+    Run go blocks one step at a time. A step runs a task until it awaits
+    an Op, which either happens straight away or parks the task on the
+    channels involved until another task (or thread) lets it go ahead.
+    Everything is done under `cond` so that any thread can take part.
+    '''
+    # Seconds between checks for a deadlock while other threads are alive
+    deadlock_check = 0.1
+
+    def __init__(self):
+        self.cond = Condition(RLock())
+        # (task, value to resume it with)
+        self.ready = deque()
+        # (channel, value) from threads started by thread_call
+        self.inbox = deque()
+        # thread_calls that haven't delivered their result yet
+        self.pending = 0
+        # The ident of the thread running tasks, if any
+        self.driver = None
+
+    def spawn(self, coro):
+        '''Start a task for a coroutine, returning its result channel'''
+        result = Channel(1)
+        with self.cond:
+            self.ready.append((Task(coro, result), None))
+            self.run()
+        return result
+
+    def start(self, op, handle):
+        '''Do an operation now if possible, otherwise queue the handle'''
+        for chan, val in op.ports:
+            if val is TAKE:
+                done, got = chan.poll_take()
+            else:
+                done, got = chan.poll_put(val)
+
+            if done:
+                handle.fire(got, chan)
+                return
+
+        for chan, val in op.ports:
+            chan.park(handle, val)
+        handle.ports = op.ports
+
+    def run(self):
+        '''Run tasks until none are ready. Must be called under `cond`.'''
+        if self.driver is not None:
+            # Called from inside a task: the loop below will get to it
+            return
+
+        ready, inbox = self.ready, self.inbox
+        self.driver = current_thread().ident
+        try:
+            while ready or inbox:
+                while inbox:
+                    chan, val = inbox.popleft()
+                    self.pending -= 1
+                    chan.offer(val)
+
+                if ready:
+                    self.step(*ready.popleft())
+        finally:
+            self.driver = None
+
+    def step(self, task, value):
+        '''Run a task up to its next channel operation'''
+        try:
+            if type(value) is Failure:
+                op = task.coro.throw(value.error)
+            else:
+                op = task.coro.send(value)
+        except StopIteration as stop:
+            if stop.value is not None:
+                task.result.offer(stop.value)
+            task.result.close()
+            return
+        except Exception as e:
+            # Raised wherever the result is taken rather than in whichever
+            # thread happens to be running the task
+            task.result.offer(Failure(e))
+            task.result.close()
+            return
+        except BaseException:
+            task.result.close()
+            raise
+
+        if type(op) is not Op:
+            error = RiplError(
+                f'Only channel operations can be awaited in a go block, '
+                f'not {op!r}')
+            self.ready.append((task, Failure(error)))
+            return
+
+        self.start(op, Handle(task, op.alt))
+
+    def block(self, op):
+        '''
+        Do an operation from a thread, running tasks until it happens.
+        If no other thread is alive (or busy on the futures pool) then
+        nothing else can happen, so that is reported as a deadlock. While
+        other threads are alive one of them might yet go ahead, so this
+        keeps waiting.
+        '''
+        handle = Handle(None, op.alt)
+        with self.cond:
+            if self.driver == current_thread().ident:
+                raise RiplError(
+                    'Blocking channel operation inside of a go block: '
+                    'use <!, >! or alts')
+
+            self.start(op, handle)
+            while True:
+                self.run()
+                if not handle.active:
+                    break
+
+                if not self.pending and not _others_alive():
+                    handle.active = False
+                    handle.unpark()
+                    raise RiplError(
+                        'Deadlock: every task is waiting on a channel')
+
+                self.cond.wait(self.deadlock_check)
+
+        if type(handle.value) is Failure:
+            raise handle.value.error
+        return handle.value
+
+    def deliver(self, chan, val):
+        '''Hand the result of a thread_call over from its thread'''
+        with self.cond:
+            self.inbox.append((chan, val))
+            self.cond.notify_all()
+
+
+scheduler = Scheduler()
+
+
+def _pool_thread(thread):
+    return thread.name.startswith(futures.thread_name_prefix)
+
+
+def _others_alive():
+    '''Could any thread other than this one still use a channel?'''
+    me = current_thread()
+    # Idle pool threads can't do anything until they are given a call
+    busy = futures.busy() - _pool_thread(me)
+    return busy > 0 or any(
+        t is not me and not _pool_thread(t) for t in all_threads())
+
+
+def chan(size=0):
+    '''(chan) is an unbuffered channel and (chan n) buffers n values'''
+    return Channel(size)
+
+
+def close(chan):
+    '''(close! c): no more values will be put on c'''
+    with scheduler.cond:
+        chan.close()
+
+
+def go_call(f, *args):
+    '''
+    (go-call f arg ...) runs (f arg ...) as a task, where f is an async-fn,
+    returning a channel that gets the result. (go body) is short for
+    (go-call (async-fn () body)).
+    '''
+    coro = f(*args)
+    if isawaitable(coro):
+        return scheduler.spawn(coro.__await__())
+
+    result = Channel(1)
+    result.offer(coro)
+    result.close()
+    return result
+
+
+def take_op(chan):
+    '''The operation that <! parks on'''
+    return Op([(chan, TAKE)])
+
+
+def put_op(chan, val):
+    '''The operation that >! parks on'''
+    if val is None:
+        raise RiplError("Can't put nil on a channel")
+    return Op([(chan, val)])
+
+
+def alts_op(ops):
+    '''The operation that alts parks on'''
+    ports = []
+    for op in ops:
+        if isinstance(op, Channel):
+            ports.append((op, TAKE))
+        elif isinstance(op, (LispList, PersistentVector, list, tuple)):
+            chan, val = op
+            ports.append((chan, val))
+        else:
+            raise RiplError(f'Invalid alts operation: {op!r}')
+
+    return Op(ports, alt=True)
+
+
+def take_blocking(chan):
+    '''(<!! c) takes a value from c, blocking this thread until it can'''
+    return scheduler.block(take_op(chan))
+
+
+def put_blocking(chan, val):
+    '''(>!! c x) puts x on c, blocking this thread until it can'''
+    return scheduler.block(put_op(chan, val))
+
+
+def alts_blocking(ops):
+    '''(alts!! ops) is alts for outside of a go block'''
+    return scheduler.block(alts_op(ops))
+
+
+def thread_call(f, *args):
+    '''
+    (thread-call f arg ...) runs (f arg ...) on a real thread, returning
+    a channel that gets the result. Taking from it raises anything that
+    the call raised.
+    '''
+    result = Channel(1)
+
+    def done(future):
+        error = future.exception()
+        scheduler.deliver(
+            result, future.result() if error is None else Failure(error))
+
+    with scheduler.cond:
+        scheduler.pending += 1
+    futures.submit(f, *args).add_done_callback(done)
+    return result
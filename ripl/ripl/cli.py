@@ -1,9 +1,9 @@
 '''
 The command line interface from RIPL
 '''
+import sys
 import argparse
 
-from .repl import REPL
 from . import __version__
 
 
@@ -11,6 +11,20 @@ def main(argv=None):
     '''
     Main program loop
     '''
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if '--client' in argv:
+        # Handled before importing the interpretor, which is most of the
+        # time that starting up takes
+        from .client import main as client_main
+        return client_main(argv)
+
+    from .repl import REPL
+    from .eval import Evaluator
+    from .jit import JIT
+    from .server import serve
+
     parser = argparse.ArgumentParser()
     parser.add_argument(
         '-f',
@@ -36,29 +50,134 @@ def main(argv=None):
         action='store_true',
         required=False,
     )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        required=False,
+    )
+    parser.add_argument(
+        '--expand',
+        action='store_true',
+        required=False,
+        help='expand all macros in each form before running it',
+    )
+    parser.add_argument(
+        '--fold',
+        action='store_true',
+        required=False,
+        help='fold constant expressions before running each form',
+    )
+    parser.add_argument(
+        '--fold-report',
+        action='store_true',
+        required=False,
+        help='with --fold, list everything that was folded on exit',
+    )
+    parser.add_argument(
+        '--jit',
+        type=int,
+        nargs='?',
+        const=JIT.threshold,
+        default=None,
+        required=False,
+        help='compile procedures to Python after this many calls',
+    )
+    parser.add_argument(
+        '-m',
+        '--mode',
+        choices=Evaluator.modes,
+        default=None,
+        required=False,
+    )
+    parser.add_argument(
+        '-i',
+        '--image',
+        type=str,
+        default=None,
+        required=False,
+        help='boot from a saved image instead of loading the prelude',
+    )
+    parser.add_argument(
+        '--save-image',
+        type=str,
+        default=None,
+        required=False,
+        help='save an image after loading the prelude and any file/script',
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        required=False,
+        help='after loading the prelude and any file/script (and saving '
+             'any image), run scripts sent by `ripl --client` over a Unix '
+             'socket',
+    )
+    parser.add_argument(
+        '--client',
+        action='store_true',
+        required=False,
+        help='run a script (-s, -f or stdin) on a `ripl --serve` server',
+    )
+    parser.add_argument(
+        '--socket',
+        type=str,
+        default=None,
+        required=False,
+        help='the socket for --serve and --client: defaults to '
+             '$RIPL_SOCKET or one in $XDG_RUNTIME_DIR',
+    )
+    parser.add_argument(
+        '--pool',
+        type=int,
+        default=4,
+        required=False,
+        help='with --serve, the number of interpretors to keep warm',
+    )
 
-    if argv is None:
-        args = parser.parse_args()
-    else:
-        args = parser.parse_args(argv)
+    args = parser.parse_args(argv)
 
     if args.version:
         print(__version__)
 
-    repl = REPL(load_prelude=not args.no_prelude)
+    # Images already contain everything that the prelude defines
+    load_prelude = not (args.no_prelude or args.image)
 
-    if args.filename:
-        with open(args.file_name, 'r') as f:
-            prog = '\n'.join(line for line in f)
+    repl = REPL(
+        load_prelude=load_prelude,
+        mode=args.mode,
+        cache=not args.no_cache,
+        image=args.image,
+        expand=args.expand,
+        jit=args.jit,
+        fold=args.fold or args.fold_report,
+    )
 
-        repl.eval_and_print(prog)
+    batch = args.filename or args.script or args.save_image or args.serve
+    if batch and load_prelude:
+        repl.load_prelude()
+
+    if args.filename:
+        # Forms are read and evaluated one at a time
+        repl.eval_file_and_print(args.filename)
 
     elif args.script:
         repl.eval_and_print(args.script)
 
-    else:
+    if args.save_image:
+        for name in repl.save_image(args.save_image):
+            print(f'Unable to save `{name}` in image', file=sys.stderr)
+
+    if args.serve:
+        # After saving the image: serving freezes what has been defined
+        serve(repl, args.socket, args.pool)
+
+    elif not (args.filename or args.script or args.save_image):
         repl.input_loop()
 
+    if args.fold_report:
+        for line in repl.folder.report():
+            print(line, file=sys.stderr)
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,116 @@
+'''
+A thin client for `ripl --serve`: send a script to the server and print
+what it returns.
+
+    ripl --serve &
+    ripl --client -s '(+ 1 2)'
+    echo '(define x 4) (* x x)' | ripl --client
+
+This only imports the standard library so that it starts as quickly as
+Python can. The protocol is one JSON object per line each way (see
+ripl.server) so anything that can talk to a Unix socket will also do:
+    echo '{"code": "(+ 1 2)"}' | socat - UNIX-CONNECT:$RIPL_SOCKET
+'''
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+
+
+def default_socket():
+    '''$RIPL_SOCKET or a socket in the user's runtime directory'''
+    path = os.environ.get('RIPL_SOCKET')
+    if path:
+        return path
+
+    run_dir = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(run_dir, f'ripl-{os.getuid()}.sock')
+
+
+def _check_owner(path):
+    '''
+    Refuse a socket that belongs to another user: the default lives in a
+    shared directory when there is no $XDG_RUNTIME_DIR, where anyone could
+    have created it to read the code sent to it.
+    '''
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f'{path} belongs to another user')
+
+
+def request(msg, path=None):
+    '''Send one request to the server and return its reply'''
+    path = path or default_socket()
+    _check_owner(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(msg).encode() + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+
+def main(argv=None):
+    '''
+    Run a script on the server, printing each non-nil result as `ripl -s`
+    would. Returns the exit status.
+    '''
+    parser = argparse.ArgumentParser(prog='ripl --client')
+    parser.add_argument('--client', action='store_true')
+    parser.add_argument('-s', '--script', type=str, default=None)
+    parser.add_argument('-f', '--filename', type=str, default=None)
+    parser.add_argument(
+        '--socket',
+        type=str,
+        default=None,
+        help='the socket that the server is listening on',
+    )
+    parser.add_argument(
+        '--session',
+        type=str,
+        default=None,
+        help='keep definitions between calls that name the same session',
+    )
+    parser.add_argument(
+        '--close',
+        action='store_true',
+        help='end the session given by --session',
+    )
+    args = parser.parse_args(argv)
+
+    if args.close:
+        msg = {'op': 'close', 'session': args.session}
+    else:
+        if args.script is not None:
+            code = args.script
+        elif args.filename:
+            with open(args.filename) as f:
+                code = f.read()
+        else:
+            code = sys.stdin.read()
+
+        msg = {'op': 'eval', 'code': code}
+        if args.session:
+            msg['session'] = args.session
+
+    try:
+        reply = request(msg, args.socket)
+    except OSError as e:
+        print(f'Unable to reach the server: {e}', file=sys.stderr)
+        return 2
+
+    sys.stdout.write(reply.get('out', ''))
+    for value in reply.get('values', []):
+        print(value)
+
+    if 'error' in reply:
+        print(reply['error'], file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
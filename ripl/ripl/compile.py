@@ -0,0 +1,885 @@
+'''
+Compile internal expressions to trees of Python closures.
+
+Evaluator.eval re-inspects an expression every time that it is run: type
+checks, destructuring and a walk down the chain of special forms. The
+Compiler does that analysis once per form and hands back a closure that
+only needs a frame to run. Procedures created by compiled code keep their
+compiled body so calling them never looks at the s-expression again.
+
+Every compiled closure has the signature `code(frame) -> value`.
+
+Variables are resolved lexically at compile time. Each lambda (or let) gets
+a Frame: a fixed size list of [parent_frame, slot_0, slot_1, ...] holding its
+parameters followed by any names it `define`s. A reference to a local is
+compiled to a (depth, slot) address so finding it is `depth` parent hops
+and an index. Only names that are not bound by any enclosing lambda go
+through the global environment.
+
+Calls in tail position return a TailCall instead of making the call so that
+the trampoline in CompiledProcedure.__call__ (and Compiler.run) can run them
+without growing the Python stack.
+'''
+from types import FunctionType
+from collections.abc import Mapping
+
+from .env import BINARY
+from .aio import AsyncProcedure
+from .persistent import COLLECTIONS, elements, rebuild, is_constant
+from .types import (
+    Symbol, LispList, Procedure, RiplError, arity_error,
+    QUOTE, QUASIQUOTE, UNQUOTE, UNQUOTE_SPLICING, IF, COND, SET, DEFINE,
+    LAMBDAS, DEFN, DEFMACRO, LET, BEGIN, EVAL, APPLY, LOOP, RECUR, ELSE,
+    ASYNC_FN
+)
+
+
+class Unset:
+    '''Marker for a local slot that has not yet been `define`d'''
+    def __repr__(self):
+        return 'UNSET'
+
+    def __reduce__(self):
+        # There is only ever the one marker
+        return 'UNSET'
+
+
+UNSET = Unset()
+# Returned by `recur` to send its loop round again
+AGAIN = object()
+
+
+class Again:
+    '''
+    Returned by `recur` to send its loop round again with a new Frame,
+    for loops that make procedures which hold on to the old one.
+    '''
+    __slots__ = ('frame',)
+
+    def __init__(self, frame):
+        self.frame = frame
+
+
+class TailCall:
+    '''A pending call to a compiled procedure in tail position'''
+    __slots__ = ('proc', 'args')
+
+    def __init__(self, proc, args):
+        self.proc = proc
+        self.args = args
+
+
+def trampoline(result):
+    '''Run any pending tail calls until we have a real value'''
+    while type(result) is TailCall:
+        proc = result.proc
+        result = proc._code(proc.get_call_env(result.args))
+
+    return result
+
+
+class CompiledProcedure(Procedure):
+    '''
+    A user-defined Procedure with a pre-compiled body.
+    The outer env is the Frame that the procedure was created in.
+    '''
+    # Closures can't be pickled: the body is compiled again on demand
+    _transient = Procedure._transient + ('_code', '_tier1')
+
+    def __init__(self, params, docstring, body, env, evaluator, code,
+                 scope):
+        super().__init__(params, docstring, body, env, evaluator)
+        self._scope = scope
+        self._variadic = isinstance(params, Symbol)
+        self._nparams = 1 if self._variadic else len(params)
+        self._locals = [UNSET] * scope.nlocals
+        self._set_code(code)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._code = self._compile_body
+
+    def _set_code(self, code):
+        '''Install the compiled body, counting calls for the JIT if any'''
+        jit = self._evaluator.jit
+        self._code = code if jit is None else jit.watch(self, code)
+
+    def set_body(self, body):
+        super().set_body(body)
+        # Compiled again on the next call
+        self._code = self._tier1 = self._compile_body
+
+    def _compile_body(self, frame):
+        '''Stand in for the compiled body until the first call'''
+        compiler = self._evaluator.compiler
+        self._set_code(compiler.compile(self._body, self._scope, tail=True))
+        return self._code(frame)
+
+    def get_call_env(self, args):
+        '''Build the Frame for a call: [parent, *args, *locals]'''
+        if self._variadic:
+            args = [LispList(args)]
+        elif len(args) != self._nparams:
+            raise arity_error(self._params, args)
+
+        frame = [self._outer_env]
+        frame += args
+        if self._locals:
+            frame += self._locals
+        return frame
+
+    def __call__(self, *args):
+        '''Bind the given arguments and run the compiled body'''
+        return trampoline(self._code(self.get_call_env(args)))
+
+
+class Scope:
+    '''
+    The compile time picture of a Frame: which slot each name lives in.
+    The outermost Scope has no parent, holds no names and stands for the
+    global environment.
+    '''
+    __slots__ = ('names', 'nparams', 'parent', 'global_env', 'loop', 'fresh')
+
+    def __init__(self, names=(), parent=None, global_env=None, loop=None):
+        self.names = list(names)
+        self.nparams = len(self.names)
+        self.parent = parent
+        # The Scope of the innermost loop that `recur` can jump to
+        self.loop = loop
+        # Whether `recur` to this loop needs a new Frame: see compile_loop
+        self.fresh = False
+        if parent is not None:
+            global_env = parent.global_env
+        self.global_env = global_env
+
+    @property
+    def nlocals(self):
+        '''The number of slots that are filled by `define`'''
+        return len(self.names) - self.nparams
+
+    def add(self, name):
+        '''Allocate a slot for a local definition'''
+        if name not in self.names:
+            self.names.append(name)
+
+    def resolve(self, name):
+        '''
+        Find the (depth, index, scope) address of a lexically bound name
+        or None for a global.
+        '''
+        depth, scope = 0, self
+        while scope.parent is not None:
+            if name in scope.names:
+                return depth, scope.names.index(name), scope
+            scope = scope.parent
+            depth += 1
+
+        return None
+
+
+class FrameView(Mapping):
+    '''
+    The locals that a Scope can see, looked up by name in a live Frame:
+    for code that needs an environment rather than a Frame. Setting a name
+    writes through to its slot.
+    '''
+    def __init__(self, scope, frame):
+        self.slots = {}
+        while scope.parent is not None:
+            for i, name in enumerate(scope.names, 1):
+                self.slots.setdefault(name, (frame, i))
+            frame, scope = frame[0], scope.parent
+
+    def __getitem__(self, name):
+        frame, slot = self.slots[name]
+        val = frame[slot]
+        if val is UNSET:
+            raise KeyError(name)
+        return val
+
+    def __setitem__(self, name, val):
+        frame, slot = self.slots[name]
+        frame[slot] = val
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __len__(self):
+        return len(self.slots)
+
+
+def frame_getter(depth, slot):
+    '''Fetch a slot from a frame `depth` parents up'''
+    if depth == 0:
+        return lambda frame: frame[slot]
+    elif depth == 1:
+        return lambda frame: frame[0][slot]
+    elif depth == 2:
+        return lambda frame: frame[0][0][slot]
+
+    def get(frame):
+        for _ in range(depth):
+            frame = frame[0]
+        return frame[slot]
+
+    return get
+
+
+def frame_setter(depth, slot):
+    '''Assign to a slot in a frame `depth` parents up'''
+    def set_(frame, value):
+        for _ in range(depth):
+            frame = frame[0]
+        frame[slot] = value
+
+    return set_
+
+
+def _scan_defines(body):
+    '''Find the names that a body will `define` in its own frame'''
+    if not (isinstance(body, LispList) and body):
+        return
+
+    head = body[0]
+    if (head is DEFINE or head is DEFN) and len(body) > 1:
+        yield body[1]
+    elif head is BEGIN:
+        for form in body[1:]:
+            yield from _scan_defines(form)
+
+
+class Compiler:
+    '''Convert parsed forms into closures for an Evaluator'''
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        self.special_forms = {
+            QUOTE: self.compile_quote,
+            QUASIQUOTE: self.compile_quasiquote,
+            UNQUOTE: self.compile_unquote,
+            UNQUOTE_SPLICING: self.compile_unquote,
+            IF: self.compile_if,
+            COND: self.compile_cond,
+            SET: self.compile_set,
+            DEFINE: self.compile_define,
+            DEFN: self.compile_defn,
+            DEFMACRO: self.compile_defmacro,
+            LET: self.compile_let,
+            BEGIN: self.compile_begin,
+            EVAL: self.compile_eval,
+            APPLY: self.compile_apply,
+            LOOP: self.compile_loop,
+            RECUR: self.compile_recur,
+            ASYNC_FN: self.compile_async_fn,
+        }
+        for sym in LAMBDAS:
+            self.special_forms[sym] = self.compile_lambda
+
+    def run(self, expr, env=None):
+        '''
+        Compile and run an expression: a drop in for Evaluator.eval.
+        `env` is the global environment to use.
+        '''
+        if env is None:
+            env = self.evaluator.global_env
+
+        return trampoline(self.compile(expr, Scope(global_env=env))(None))
+
+    def compile(self, expr, scope, tail=False):
+        '''
+        Convert an expression to a closure.
+        `tail` marks that the expression is in tail position.
+        '''
+        if isinstance(expr, Symbol):
+            return self.compile_symbol(expr, scope)
+
+        elif isinstance(expr, LispList):
+            if not expr:
+                return self.compile_quote([expr], scope, tail)
+
+            head, *rest = expr
+
+            if isinstance(head, Symbol):
+                # Macros are expanded once, here, rather than on every run
+                macro = self.evaluator.macro_table.get(head)
+                if macro:
+                    expansion = self.evaluator.expand_once(expr, macro)
+                    return self.compile(expansion, scope, tail)
+
+                special_form = self.special_forms.get(head)
+                if special_form:
+                    return special_form(rest, scope, tail)
+
+            return self.compile_call(head, rest, scope, tail)
+
+        elif isinstance(expr, self.evaluator.value_types):
+            return self.compile_quote([expr], scope, tail)
+
+        elif isinstance(expr, COLLECTIONS):
+            return self.compile_collection(expr, scope)
+
+        raise RiplError(f'Unknown expression in input: {expr}')
+
+    def compile_symbol(self, sym, scope):
+        '''Look up a symbol: by address if it is local'''
+        address = scope.resolve(sym)
+
+        if address is None:
+            env = scope.global_env
+            # An inline cache for this reference: the value is reused until
+            # the version of the global environment moves on. The version
+            # and value are stored together so that another thread can
+            # never see one without the other.
+            cache = [(None, None)]
+
+            def run(frame):
+                cached_version, val = cache[0]
+                version = env.version
+                if cached_version == version:
+                    return val
+
+                # Read before the lookup so that a define in the meantime
+                # leaves the entry stale rather than wrong
+                val = env.get(sym)
+                if val is None:
+                    raise RiplError(f'Unknown symbol: `{sym}`')
+
+                cache[0] = (version, val)
+                return val
+
+            return run
+
+        depth, index, owner = address
+        get = frame_getter(depth, index + 1)
+
+        if index < owner.nparams:
+            # Parameters are always bound
+            return get
+
+        def run(frame):
+            val = get(frame)
+            if val is UNSET:
+                raise RiplError(f'Unknown symbol: `{sym}`')
+            return val
+
+        return run
+
+    def _compile_lookup(self, sym, scope):
+        '''Look up a symbol returning None rather than raising'''
+        address = scope.resolve(sym)
+
+        if address is None:
+            env = scope.global_env
+            return lambda frame: env.get(sym)
+
+        get = frame_getter(address[0], address[1] + 1)
+
+        def run(frame):
+            val = get(frame)
+            return None if val is UNSET else val
+
+        return run
+
+    def _compile_bind(self, sym, scope, value):
+        '''
+        Bind a new name in the innermost frame.
+        `value(frame)` computes the value to bind.
+        '''
+        can_define = self.evaluator.can_define
+
+        if scope.parent is None:
+            env = scope.global_env
+            define = self.evaluator.define
+
+            def run(frame):
+                if not can_define(sym, env.get(sym)):
+                    raise RiplError(f'Attempt to re-define symbol: {sym}')
+
+                define(env, sym, value(frame))
+
+            return run
+
+        scope.add(sym)
+        slot = scope.names.index(sym) + 1
+        # Names can't shadow an existing binding in an outer frame either
+        outer = self._compile_lookup(sym, scope.parent)
+
+        def run(frame):
+            if (frame[slot] is not UNSET or
+                    not can_define(sym, outer(frame[0]))):
+                raise RiplError(f'Attempt to re-define symbol: {sym}')
+
+            frame[slot] = value(frame)
+
+        return run
+
+    def compile_quote(self, rest, scope, tail):
+        '''(quote expr)'''
+        value = rest[0]
+        return lambda frame: value
+
+    def compile_quasiquote(self, rest, scope, tail):
+        '''(quasiquote expr)'''
+        return self._compile_template(rest[0], scope)
+
+    def _compile_template(self, expr, scope):
+        '''Build a closure that fills in the unquoted parts of expr'''
+        if not (isinstance(expr, LispList) and expr):
+            return lambda frame: expr
+
+        # Make sure we aren't splicing a list into the head
+        # position of the new list
+        if expr[0] is UNQUOTE_SPLICING:
+            raise RiplError(
+                f"Can't splice at the head of a list: {expr}")
+
+        if expr[0] is UNQUOTE:
+            if len(expr) != 2:
+                raise RiplError(f'Unquoting error: {expr}')
+            return self.compile(expr[1], scope)
+
+        parts = []
+        for elem in expr:
+            if (isinstance(elem, LispList) and elem and
+                    elem[0] is UNQUOTE_SPLICING):
+                if len(elem) != 2:
+                    raise RiplError(f'Unquoting error: {expr}')
+                parts.append((True, self.compile(elem[1], scope)))
+            else:
+                parts.append((False, self._compile_template(elem, scope)))
+
+        def run(frame):
+            result = []
+            for splice, code in parts:
+                if splice:
+                    result.extend(code(frame))
+                else:
+                    result.append(code(frame))
+            return LispList(result)
+
+        return run
+
+    def compile_collection(self, expr, scope):
+        '''[elem ...] or {key value ...}: evaluate each element'''
+        if is_constant(expr):
+            return lambda frame: expr
+
+        codes = [self.compile(e, scope) for e in elements(expr)]
+        return lambda frame: rebuild(expr, [code(frame) for code in codes])
+
+    def compile_unquote(self, rest, scope, tail):
+        raise RiplError("Can't unquote outside of quasi-quote")
+
+    def compile_if(self, rest, scope, tail):
+        '''(if cond true [false])'''
+        try:
+            cond, true, *false = rest
+        except ValueError:
+            raise RiplError(f'Malformed `if` form: {rest}')
+
+        if len(false) > 1:
+            # > 2 clauses
+            raise RiplError(f'Malformed `if` form: {false[1:]}')
+
+        cond = self.compile(cond, scope)
+        true = self.compile(true, scope, tail)
+
+        if not false:
+            # No false branch
+            return lambda frame: true(frame) if cond(frame) else None
+
+        false = self.compile(false[0], scope, tail)
+        return lambda frame: true(frame) if cond(frame) else false(frame)
+
+    def compile_cond(self, rest, scope, tail):
+        '''(cond (test body) ...)'''
+        branches = []
+        for branch in rest:
+            if not (isinstance(branch, LispList) and len(branch) == 2):
+                raise RiplError(f'Invalid `cond` branche: {branch}')
+
+            cond, body = branch
+            branches.append((
+                self.compile(cond, scope),
+                self.compile(body, scope, tail)
+            ))
+
+        def run(frame):
+            for cond, body in branches:
+                test = cond(frame)
+
+                if isinstance(test, bool):
+                    if test:
+                        return body(frame)
+                elif test is ELSE:
+                    return body(frame)
+                else:
+                    raise RiplError(f'Invalid `cond` condition: {test}')
+
+        return run
+
+    def compile_set(self, rest, scope, tail):
+        '''(set! sym value)'''
+        try:
+            sym, value = rest
+        except ValueError:
+            raise RiplError(f'Invalid `set!`: {LispList(rest)}')
+
+        if not isinstance(sym, Symbol):
+            raise RiplError(f'Attempt to `set!` non-Symbol: {sym}')
+
+        value = self.compile(value, scope)
+        address = scope.resolve(sym)
+
+        if address is None:
+            env = scope.global_env
+            evaluator = self.evaluator
+
+            if env is not evaluator.global_env:
+                # Run against a local environment (see ripl.aio): set the
+                # name wherever it is bound, as the walker would
+                assign = evaluator.assign
+
+                def run(frame):
+                    if env.get(sym) is None:
+                        raise RiplError(
+                            f'Attempt to `set!` non existant symbol: {sym}')
+
+                    assign(env, sym, value(frame))
+
+                return run
+
+            rebound = evaluator.rebound
+
+            def run(frame):
+                if env.get(sym) is None:
+                    raise RiplError(
+                        f'Attempt to `set!` non existant symbol: {sym}')
+
+                env[sym] = value(frame)
+                rebound(sym)
+
+            return run
+
+        depth, index, _ = address
+        get = frame_getter(depth, index + 1)
+        set_ = frame_setter(depth, index + 1)
+
+        def run(frame):
+            if get(frame) is UNSET:
+                raise RiplError(
+                    f'Attempt to `set!` non existant symbol: {sym}')
+
+            set_(frame, value(frame))
+
+        return run
+
+    def compile_define(self, rest, scope, tail):
+        '''(define sym value)'''
+        try:
+            sym, value = rest
+        except ValueError:
+            raise RiplError(f'Invalid `define`: {LispList(rest)}')
+
+        if not isinstance(sym, Symbol):
+            raise RiplError(f'Attempt to define non-Symbol: {sym}')
+
+        return self._compile_bind(sym, scope, self.compile(value, scope))
+
+    def _compile_procedure(self, params, doc_str, body, scope):
+        '''Compile a procedure body once for every closure over it'''
+        if isinstance(params, Symbol):
+            # (lambda args body) collects all arguments into `args`
+            inner = Scope([params], scope)
+        else:
+            inner = Scope(params, scope)
+
+        for name in _scan_defines(body):
+            inner.add(name)
+
+        code = self.compile(body, inner, tail=True)
+        evaluator = self.evaluator
+
+        return lambda frame: CompiledProcedure(
+            params, doc_str, body, frame, evaluator, code, inner)
+
+    def _split_definition(self, rest, kind):
+        '''Pull apart (name [docstring] params body)'''
+        try:
+            if len(rest) == 4:
+                name, doc_str, params, body = rest
+            else:
+                doc_str = ""
+                name, params, body = rest
+        except ValueError:
+            raise RiplError(f'Invalid {kind} definition: {rest}')
+
+        if not isinstance(name, Symbol):
+            raise RiplError(f'Attempt to define non-Symbol: {name}')
+
+        return name, doc_str, params, body
+
+    def compile_lambda(self, rest, scope, tail):
+        '''(lambda params body)'''
+        try:
+            params, body = rest
+        except ValueError:
+            raise RiplError(f'Invalid procedure definition: {rest}')
+
+        return self._compile_procedure(params, "", body, scope)
+
+    def compile_async_fn(self, rest, scope, tail):
+        '''
+        (async-fn params body)
+        The body is run by ripl.aio rather than being compiled here, so it
+        sees the enclosing locals through a FrameView.
+        '''
+        try:
+            params, body = rest
+        except ValueError:
+            raise RiplError(f'Invalid procedure definition: {rest}')
+
+        evaluator = self.evaluator
+        env = scope.global_env
+        if scope.parent is None:
+            return lambda frame: AsyncProcedure(
+                params, "", body, env, evaluator)
+
+        return lambda frame: AsyncProcedure(
+            params, "", body, env.new_child(FrameView(scope, frame)),
+            evaluator)
+
+    def compile_defn(self, rest, scope, tail):
+        '''(defn name [docstring] params body)'''
+        name, doc_str, params, body = self._split_definition(
+            rest, 'procedure')
+
+        if scope.parent is not None:
+            # Allocate the slot first so that the body can recurse
+            scope.add(name)
+
+        make_proc = self._compile_procedure(params, doc_str, body, scope)
+        return self._compile_bind(name, scope, make_proc)
+
+    def compile_defmacro(self, rest, scope, tail):
+        '''(defmacro name [docstring] params body)'''
+        if scope.parent is not None:
+            raise RiplError('Macro definition only allowed at the top level')
+
+        name, doc_str, params, body = self._split_definition(rest, 'macro')
+        make_proc = self._compile_procedure(params, doc_str, body, scope)
+        define_macro = self.evaluator.define_macro
+
+        return lambda frame: define_macro(name, make_proc(frame))
+
+    def compile_let(self, rest, scope, tail):
+        '''
+        (let ((parm val) ...) body)
+        The bindings get a new Frame of their own, exactly as if this was
+        ((lambda (parm ...) body) val ...) but without building the lambda.
+        '''
+        bindings, body = rest
+        parms, vals = zip(*bindings)
+        vals = [self.compile(val, scope) for val in vals]
+
+        inner = Scope(parms, scope, loop=scope.loop)
+        for name in _scan_defines(body):
+            inner.add(name)
+
+        body = self.compile(body, inner, tail)
+        locals_ = [UNSET] * inner.nlocals
+
+        def run(frame):
+            new = [frame]
+            new += [val(frame) for val in vals]
+            if locals_:
+                new += locals_
+            return body(new)
+
+        return run
+
+    def compile_loop(self, rest, scope, tail):
+        '''
+        (loop ((name init) ...) body)
+        Like `let`, the names get a Frame of their own. It is made once for
+        the whole loop: `recur` assigns to its slots and returns AGAIN to go
+        round the loop without building anything. If the body can make
+        procedures, which would see later values through a shared Frame,
+        `recur` copies the Frame instead and hands it back in an Again.
+        '''
+        names, inits, body, fresh = self.evaluator.analyse_loop(rest)
+        inits = [self.compile(init, scope) for init in inits]
+
+        inner = Scope(names, scope)
+        inner.loop = inner
+        inner.fresh = fresh
+        for name in _scan_defines(body):
+            inner.add(name)
+
+        body = self.compile(body, inner, tail)
+        locals_ = [UNSET] * inner.nlocals
+
+        def run(frame):
+            new = [frame]
+            new += [init(frame) for init in inits]
+            if locals_:
+                new += locals_
+
+            result = body(new)
+            while result is AGAIN:
+                result = body(new)
+            return result
+
+        def run_fresh(frame):
+            new = [frame]
+            new += [init(frame) for init in inits]
+            if locals_:
+                new += locals_
+
+            result = body(new)
+            while type(result) is Again:
+                result = body(result.frame)
+            return result
+
+        return run_fresh if fresh else run
+
+    def compile_recur(self, rest, scope, tail):
+        '''
+        (recur val ...): rebind the names of the innermost loop in place,
+        or in a copy of its Frame if it needs one. analyse_loop has already
+        checked that this is in tail position.
+        '''
+        if scope.loop is None:
+            form = LispList([RECUR, *rest])
+            raise RiplError(f'`recur` outside of `loop`: {form}')
+
+        depth, inner = 0, scope
+        while inner is not scope.loop:
+            inner = inner.parent
+            depth += 1
+
+        vals = [self.compile(val, scope) for val in rest]
+        end = len(vals) + 1
+
+        if scope.loop.fresh:
+            def run(frame):
+                new = [val(frame) for val in vals]
+                for _ in range(depth):
+                    frame = frame[0]
+                # Procedures made so far keep the old Frame
+                frame = frame[:]
+                frame[1:end] = new
+                return Again(frame)
+
+        elif depth == 0 and len(vals) == 1:
+            val, = vals
+
+            def run(frame):
+                frame[1] = val(frame)
+                return AGAIN
+
+        elif depth == 0 and len(vals) == 2:
+            first, second = vals
+
+            def run(frame):
+                frame[1], frame[2] = first(frame), second(frame)
+                return AGAIN
+
+        else:
+            def run(frame):
+                new = [val(frame) for val in vals]
+                for _ in range(depth):
+                    frame = frame[0]
+                frame[1:end] = new
+                return AGAIN
+
+        return run
+
+    def compile_begin(self, rest, scope, tail):
+        '''(begin expr ...)'''
+        if not rest:
+            return lambda frame: None
+
+        init = [self.compile(exp, scope) for exp in rest[:-1]]
+        last = self.compile(rest[-1], scope, tail)
+
+        def run(frame):
+            for code in init:
+                code(frame)
+            return last(frame)
+
+        return run
+
+    def compile_eval(self, rest, scope, tail):
+        '''
+        (eval expr): evaluate the value of expr.
+        The value is compiled at run time so it only sees globals.
+        '''
+        arg = self.compile(rest[0], scope)
+        env = scope.global_env
+        run = self.run
+        return lambda frame: run(arg(frame), env)
+
+    def compile_apply(self, rest, scope, tail):
+        '''(apply f args ...)'''
+        return self.compile_call(rest[0], rest[1:], scope, tail)
+
+    def compile_call(self, head, rest, scope, tail):
+        '''
+        Assume that `head` is a proc and `rest` are args.
+        Compiled procedures in tail position are handed back to the
+        trampoline rather than being called here.
+        '''
+        proc_code = self.compile(head, scope)
+        arg_codes = [self.compile(arg, scope) for arg in rest]
+
+        # A global that is currently one of the std_ops: while it still is
+        # the operator is called directly rather than through its wrapper
+        builtin = None
+        if (len(arg_codes) == 2 and isinstance(head, Symbol) and
+                scope.resolve(head) is None):
+            builtin = scope.global_env.get(head)
+            if type(builtin) is not FunctionType or builtin not in BINARY:
+                builtin = None
+
+        if builtin is not None:
+            binary = BINARY[builtin]
+            a, b = arg_codes
+
+            def run(frame):
+                proc = proc_code(frame)
+                if proc is builtin:
+                    return binary(a(frame), b(frame))
+
+                args = [a(frame), b(frame)]
+                if tail and type(proc) is CompiledProcedure:
+                    return TailCall(proc, args)
+                return proc(*args)
+
+            return run
+
+        if tail:
+            def run(frame):
+                proc = proc_code(frame)
+                args = [arg(frame) for arg in arg_codes]
+                if type(proc) is CompiledProcedure:
+                    return TailCall(proc, args)
+                # If this is a Python function then just call it
+                return proc(*args)
+
+            return run
+
+        # Specialise the common small arities to avoid building a list
+        if len(arg_codes) == 0:
+            return lambda frame: proc_code(frame)()
+
+        elif len(arg_codes) == 1:
+            a, = arg_codes
+            return lambda frame: proc_code(frame)(a(frame))
+
+        elif len(arg_codes) == 2:
+            a, b = arg_codes
+            return lambda frame: proc_code(frame)(a(frame), b(frame))
+
+        return lambda frame: proc_code(frame)(
+            *[arg(frame) for arg in arg_codes])
@@ -4,28 +4,200 @@ An environment to evaluate expressions in using collections.ChainMap
 import operator as op
 import functools as ft
 
+from itertools import count
 from importlib import import_module
-from collections import ChainMap as Env
+from collections import ChainMap
 
-from .types import Symbol
+from .types import Symbol, LispList, LazySeq, RiplError
+from .seq import (
+    seq, lazy_seq, lazy_range, iterate, take, drop, lazy_map, lazy_filter,
+    remove, take_while, drop_while, lazy_mapcat, partition, reduce
+)
+from .persistent import (
+    PersistentVector, PersistentMap, hash_map, conj, assoc, dissoc, get,
+    transient, persistent, conj_, assoc_, dissoc_
+)
+from .arrays import (
+    array, is_array, mask, where, array_sum, mean, array_min, array_max, dot
+)
+from .transduce import (
+    transduce, into, sequence, completing, reduced, is_reduced, cat
+)
+from .futures import future_call, deref, future_all, is_future, is_realised
+from .aio import await_outside
+from .channels import (
+    Channel, chan, close, go_call, take_op, put_op, alts_op, take_blocking,
+    put_blocking, alts_blocking, thread_call
+)
+
+
+# next() on a count is atomic under the GIL
+_versions = count(1)
+
+
+class Env(ChainMap):
+    '''
+    A ChainMap that counts the changes made to it.
+
+    Every binding made through the Env (define, set!, defn, pyimport...)
+    bumps `version` so that compiled code can cache what a name refers to
+    and only look it up again once the version has moved on. Anything that
+    writes to the underlying maps directly must call `changed`.
+
+    Versions are drawn from a single counter rather than incremented so
+    that two threads binding names at once can't both move the version on
+    to the same number: a version is never reused.
+
+    An Env that has been cloned is `frozen`: its top layer is shared with
+    the clones so anything that tries to bind a name in it is an error.
+    '''
+    version = 0
+    frozen = False
+
+    def __setitem__(self, key, value):
+        self._check(key)
+        self.maps[0][key] = value
+        self.version = next(_versions)
+
+    def __delitem__(self, key):
+        self._check(key)
+        super().__delitem__(key)
+        self.version = next(_versions)
+
+    def _check(self, key):
+        if self.frozen:
+            raise RiplError(
+                f'Attempt to change `{key}` in an environment that is '
+                'shared with cloned interpretors')
+
+    def freeze(self):
+        '''Refuse any further changes to the top layer'''
+        self.frozen = True
+
+    def changed(self):
+        '''Note a change made behind the Env's back'''
+        self.version = next(_versions)
 
 
 def cons(val, lst):
-    '''Naive implementation of cons using python lists'''
-    if not isinstance(lst, list):
+    '''Cons a value on to the front of a list, sharing the tail'''
+    if isinstance(lst, list):
+        lst = LispList(lst)
+    elif not isinstance(lst, (LispList, LazySeq)):
         raise ValueError('The second argument to cons must be a list')
 
-    return [val] + lst
+    return lst.cons(val)
+
+
+def car(lst):
+    '''The first element of a list'''
+    if isinstance(lst, LispList):
+        if not lst:
+            raise IndexError('car of an empty list')
+        return lst.car
+    elif isinstance(lst, LazySeq):
+        return lst.first()
+
+    return lst[0]
+
+
+def cdr(lst):
+    '''Everything but the first element of a list'''
+    if isinstance(lst, LispList):
+        return lst.cdr
+    elif isinstance(lst, LazySeq):
+        return lst.rest()
+
+    return lst[1:]
 
 
 def append(lst_1, lst_2):
     '''Append two lists'''
-    if not (isinstance(lst_1, list) and isinstance(lst_2, list)):
+    seqs = (list, LispList, LazySeq, PersistentVector)
+    if not (isinstance(lst_1, seqs) and isinstance(lst_2, seqs)):
         raise ValueError('Append must be applied to two lists')
 
     return lst_1 + lst_2
 
 
+# The builtin made for each binary operator -> that operator, so that
+# evaluators can skip the wrapper for calls with two arguments
+BINARY = {}
+# Marks an argument that wasn't given
+_MISSING = object()
+
+
+def arithmetic(binary, unary=None, identity=_MISSING):
+    '''
+    Make a LISPy variadic function out of a binary operator:
+        ()        -> identity (if there is one)
+        (a)       -> unary(a), or a if there is no unary version
+        (a b)     -> binary(a, b)
+        (a b ...) -> folded left to right
+    '''
+    def variadic(a=_MISSING, b=_MISSING, *rest):
+        if rest:
+            return ft.reduce(binary, rest, binary(a, b))
+        elif b is not _MISSING:
+            return binary(a, b)
+        elif a is not _MISSING:
+            return a if unary is None else unary(a)
+        elif identity is not _MISSING:
+            return identity
+
+        raise TypeError('Expected at least one argument')
+
+    BINARY[variadic] = binary
+    return variadic
+
+
+def comparison(compare):
+    '''
+    Make a LISPy variadic comparison out of a binary one: (< a b c) is
+    true when each argument compares true with the next, like a < b < c
+    in Python. Comparing arrays gives an array of booleans: chains of
+    those are combined element-wise.
+    '''
+    def variadic(a, b=_MISSING, *rest):
+        if not rest:
+            return True if b is _MISSING else compare(a, b)
+
+        result = compare(a, b)
+        if type(result) is not bool:
+            for c in rest:
+                result = result & compare(b, c)
+                b = c
+            return result
+
+        if not result:
+            return False
+
+        for c in rest:
+            if not compare(b, c):
+                return False
+            b = c
+
+        return True
+
+    BINARY[variadic] = compare
+    return variadic
+
+
+STD_OPS = {
+    Symbol('+'): arithmetic(op.add, identity=0),
+    Symbol('-'): arithmetic(op.sub, unary=op.neg),
+    Symbol('*'): arithmetic(op.mul, identity=1),
+    Symbol('/'): arithmetic(op.truediv, unary=lambda a: 1 / a),
+    Symbol('%'): arithmetic(op.mod),
+    Symbol('>'): comparison(op.gt),
+    Symbol('<'): comparison(op.lt),
+    Symbol('>='): comparison(op.ge),
+    Symbol('<='): comparison(op.le),
+    Symbol('='): comparison(op.eq),
+    Symbol('!='): comparison(op.ne),
+}
+
+
 def pyimport(module, env, _as=None, _from=None):
     '''
     Import a module and insert it into the given environment.
@@ -71,41 +243,122 @@ def curry(func, *args):
     return ft.partial(func, *args)
 
 
+def comp(*funcs):
+    '''
+    Compose functions right to left: ((comp f g) x) is (f (g x)).
+    Composed transducers transform elements left to right.
+    '''
+    if not funcs:
+        return lambda x: x
+
+    *outer, inner = funcs
+    if not outer:
+        return inner
+
+    outer.reverse()
+
+    def composed(*args):
+        result = inner(*args)
+        for f in outer:
+            result = f(result)
+        return result
+
+    return composed
+
+
 def make_global_env():
     '''
     Build a global environment with some standard procedures to get started.
     '''
-    def lisp_variadic(func):
-        '''Change Python single arg functions to LISPy variadic function'''
-        return lambda *args: ft.reduce(func, args)
-
     py_builtins = {Symbol(k): v for k, v in __builtins__.items()}
-
-    std_ops = {
-        Symbol('+'): lisp_variadic(op.add),
-        Symbol('-'): lisp_variadic(op.sub),
-        Symbol('*'): lisp_variadic(op.mul),
-        Symbol('/'): lisp_variadic(op.truediv),
-        Symbol('%'): lisp_variadic(op.mod),
-        Symbol('>'): lisp_variadic(op.gt),
-        Symbol('<'): lisp_variadic(op.lt),
-        Symbol('>='): lisp_variadic(op.ge),
-        Symbol('<='): lisp_variadic(op.le),
-        Symbol('='): lisp_variadic(op.eq),
-        Symbol('!='): lisp_variadic(op.ne),
-        }
+    std_ops = STD_OPS
 
     key_words = {
         Symbol('append'): append,
         Symbol('apply'): lambda x, xs: env[x](xs),
         Symbol('begin'): lambda *x: x[-1],
-        Symbol('car'): lambda x: x[0],
-        Symbol('cdr'): lambda x: x[1:],
+        Symbol('car'): car,
+        Symbol('cdr'): cdr,
         Symbol('cons'): cons,
         Symbol('and'): op.and_,
         Symbol('or'): op.or_,
         Symbol('not'): op.not_,
         Symbol('len'): len,
+        Symbol('await'): await_outside,
+        }
+
+    lazy_seqs = {
+        Symbol('seq'): seq,
+        Symbol('make-lazy-seq'): lazy_seq,
+        Symbol('range'): lazy_range,
+        Symbol('iterate'): iterate,
+        Symbol('take'): take,
+        Symbol('drop'): drop,
+        Symbol('map'): lazy_map,
+        Symbol('filter'): lazy_filter,
+        Symbol('reduce'): reduce,
+        Symbol('remove'): remove,
+        Symbol('take-while'): take_while,
+        Symbol('drop-while'): drop_while,
+        Symbol('mapcat'): lazy_mapcat,
+        Symbol('partition-all'): partition,
+        }
+
+    collections = {
+        Symbol('conj'): conj,
+        Symbol('assoc'): assoc,
+        Symbol('dissoc'): dissoc,
+        Symbol('get'): get,
+        Symbol('transient'): transient,
+        Symbol('persistent!'): persistent,
+        Symbol('conj!'): conj_,
+        Symbol('assoc!'): assoc_,
+        Symbol('dissoc!'): dissoc_,
+        }
+
+    arrays = {
+        Symbol('array'): array,
+        Symbol('array?'): is_array,
+        Symbol('mask'): mask,
+        Symbol('where'): where,
+        Symbol('sum'): array_sum,
+        Symbol('mean'): mean,
+        Symbol('min'): array_min,
+        Symbol('max'): array_max,
+        Symbol('dot'): dot,
+        }
+
+    transducers = {
+        Symbol('comp'): comp,
+        Symbol('transduce'): transduce,
+        Symbol('into'): into,
+        Symbol('sequence'): sequence,
+        Symbol('completing'): completing,
+        Symbol('reduced'): reduced,
+        Symbol('reduced?'): is_reduced,
+        Symbol('cat'): cat,
+        }
+
+    futures = {
+        Symbol('future-call'): future_call,
+        Symbol('deref'): deref,
+        Symbol('future-all'): future_all,
+        Symbol('future?'): is_future,
+        Symbol('realised?'): is_realised,
+        }
+
+    channels = {
+        Symbol('chan'): chan,
+        Symbol('close!'): close,
+        Symbol('go-call'): go_call,
+        Symbol('chan-take'): take_op,
+        Symbol('chan-put'): put_op,
+        Symbol('chan-alts'): alts_op,
+        Symbol('<!!'): take_blocking,
+        Symbol('>!!'): put_blocking,
+        Symbol('alts!!'): alts_blocking,
+        Symbol('thread-call'): thread_call,
+        Symbol('chan?'): lambda x: isinstance(x, Channel),
         }
 
     type_cons = {
@@ -114,8 +367,9 @@ def make_global_env():
         Symbol('float'): float,
         Symbol('complex'): complex,
         Symbol('dict'): dict,
-        Symbol('list'): list,
-        Symbol('vector'): list,
+        Symbol('list'): LispList,
+        Symbol('vector'): PersistentVector,
+        Symbol('hash-map'): hash_map,
         Symbol('tuple'): tuple,
         Symbol(','): tuple
         }
@@ -124,22 +378,29 @@ def make_global_env():
         Symbol('eq?'): op.is_,
         Symbol('equal?'): op.eq,
         Symbol('callable?'): callable,
-        Symbol('null?'): lambda x: x == [],
+        Symbol('null?'): lambda x: (
+            x is LispList.EMPTY or x == [] or
+            isinstance(x, LazySeq) and not x),
         Symbol('string?'): lambda x: isinstance(x, str),
         Symbol('symbol?'): lambda x: isinstance(x, Symbol),
-        Symbol('dict?'): lambda x: isinstance(x, dict),
+        Symbol('dict?'): lambda x: isinstance(x, (dict, PersistentMap)),
+        Symbol('vector?'): lambda x: isinstance(x, (PersistentVector, list)),
         Symbol('tuple?'): lambda x: isinstance(x, tuple),
-        Symbol('list?'): lambda x: isinstance(x, list),
+        Symbol('list?'): lambda x: isinstance(
+            x, (LispList, LazySeq, PersistentVector, list)),
         Symbol('int?'): lambda x: isinstance(x, int),
         Symbol('float?'): lambda x: isinstance(x, float),
         Symbol('number?'): lambda x: isinstance(x, (int, float, complex)),
     }
 
-    # Create a new top level environment
-    env = Env(py_builtins)
-
     # Place all of the builtins at the same level (future envs will be nested)
-    for defs in [std_ops, key_words, type_cons, bool_tests]:
-        env.update(defs)
+    builtins = py_builtins
+    for defs in [std_ops, key_words, lazy_seqs, collections, arrays,
+                 transducers, futures, channels, type_cons, bool_tests]:
+        builtins.update(defs)
+
+    # Create a new top level environment: user definitions go in their own
+    # layer on top of the builtins so that they can shadow them.
+    env = Env({}, builtins)
 
     return env
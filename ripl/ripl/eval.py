@@ -1,14 +1,22 @@
 '''
 Evaluate internal expressions
 '''
-from collections import Counter
-
-from .env import make_global_env
-from .types import Symbol, Keyword, LispList, Procedure
-
-
-class RiplError(Exception):
-    pass
+from types import FunctionType
+from threading import RLock
+from collections import Counter, ChainMap
+
+from .env import make_global_env, BINARY
+from .compile import Compiler
+from .cek import Machine
+from .parallel import WorkerPool
+from .aio import AsyncProcedure, eval_async
+from .persistent import COLLECTIONS, elements, rebuild, is_constant
+from .types import (
+    Symbol, Keyword, LispList, Vector, Procedure, RiplError,
+    QUOTE, QUASIQUOTE, UNQUOTES, UNQUOTE, UNQUOTE_SPLICING, IF, COND, SET,
+    DEFINE, LAMBDAS, DEFN, DEFMACRO, LET, BEGIN, EVAL, APPLY, LOOP,
+    RECUR, ELSE, ASYNC_FN
+)
 
 
 def is_balanced(text):
@@ -17,23 +25,269 @@ def is_balanced(text):
     return all([c['('] == c[')'], c['{'] == c['}'], c['['] == c[']']])
 
 
+def check_recur(expr, nargs, tail):
+    '''
+    Check that every `recur` for a loop taking `nargs` values is in tail
+    position: `tail` says whether `expr` is. Macros should have already
+    been expanded.
+    '''
+    if not (isinstance(expr, LispList) and expr):
+        return
+
+    head, rest = expr.car, expr.cdr
+
+    if not isinstance(head, Symbol):
+        # ((lambda ...) args): nothing in the call is in tail position
+        for sub in expr:
+            check_recur(sub, nargs, False)
+        return
+
+    elif head is QUOTE or head is QUASIQUOTE:
+        return
+
+    elif head is RECUR:
+        if not tail:
+            raise RiplError(
+                f'`recur` can only be used in tail position: {expr}')
+        if len(rest) != nargs:
+            raise RiplError(
+                f'`recur` expected {nargs} values, got {len(rest)}: {expr}')
+        tail_from = len(rest)
+
+    elif head is IF:
+        # The test isn't in tail position, the branches are
+        tail_from = 1
+
+    elif head is BEGIN:
+        tail_from = len(rest) - 1
+
+    elif head is COND:
+        for branch in rest:
+            if isinstance(branch, LispList):
+                check_recur(branch.car, nargs, False)
+                for body in branch.cdr:
+                    check_recur(body, nargs, tail)
+        return
+
+    elif head is LET or head is LOOP:
+        if len(rest) != 2:
+            return
+        bindings, body = rest
+        for binding in bindings:
+            if isinstance(binding, LispList):
+                for init in binding.cdr:
+                    check_recur(init, nargs, False)
+
+        if head is LOOP:
+            # The body is the tail of the inner loop, not this one
+            nargs = len(bindings)
+        check_recur(body, nargs, tail or head is LOOP)
+        return
+
+    elif (head in LAMBDAS or head is DEFN or head is DEFMACRO or
+          head is ASYNC_FN):
+        # A new procedure: only a loop inside of it can be recurred to
+        for sub in rest:
+            check_recur(sub, nargs, False)
+        return
+
+    else:
+        # Arguments to a call
+        tail_from = len(rest)
+
+    for i, sub in enumerate(rest):
+        check_recur(sub, nargs, tail and i >= tail_from)
+
+
+def makes_procedures(expr):
+    '''
+    Could evaluating expr make a procedure that closes over the environment
+    it runs in? Macros should have already been expanded.
+    '''
+    stack = [expr]
+    while stack:
+        expr = stack.pop()
+        if isinstance(expr, LispList) and expr:
+            head = expr.car
+            if head is QUOTE:
+                continue
+            elif isinstance(head, Symbol) and (
+                    head in LAMBDAS or head is DEFN or head is ASYNC_FN):
+                return True
+            stack.extend(expr)
+        elif isinstance(expr, COLLECTIONS):
+            stack.extend(elements(expr))
+
+    return False
+
+
 class Evaluator:
     '''An Evaluator can reduce a list of internal data types to a result'''
+    # Everything that evaluates to itself in every mode. Symbols and
+    # Keywords are strs too: a Symbol has to be looked for first.
     value_types = (
-        int, float, complex, dict, set, bool, Keyword
+        str, int, float, complex, dict, set, bool, Keyword, Vector
     )
+    # walk    :: re-inspect each expression as it is evaluated
+    # closure :: compile each form to closures once and then run those
+    # cek     :: walk expressions on an explicit stack rather than recursing
+    # Every mode gives the same results: `set!` rebinds a name where it is
+    # bound, quasiquote fills in its unquotes when it is run and (eval x)
+    # evaluates the value of x in the global environment.
+    modes = ('walk', 'closure', 'cek')
+    # The number of macro call sites to remember the expansions of
+    max_expansions = 4096
+
+    def __init__(self, read_proc, mode='walk'):
+        if mode not in self.modes:
+            raise RiplError(f'Unknown evaluation mode: {mode}')
 
-    def __init__(self, read_proc):
         self.global_env = make_global_env()
+        self.builtins = self.global_env.maps[-1]
         self.macro_table = {}
-
+        self._expansions = {}
+        self.jit = None
+        self.folder = None
+        # Held while binding globals and macros: see `define`
+        self.lock = RLock()
+        self._set_mode(mode)
         self._set_read_proc(read_proc)
+        self._set_workers()
+
+    def _set_mode(self, mode):
+        '''Set up the evaluation strategy'''
+        self.mode = mode
+        self.compiler = Compiler(self)
+
+        if mode == 'closure':
+            # Swap out the tree walker for the compiler
+            self.eval = self.compiler.run
+
+        elif mode == 'cek':
+            # Swap out the tree walker for the stack machine
+            self.eval = Machine(self).run
+
+    def clone(self):
+        '''
+        A new Evaluator that shares everything defined so far as its base.
+        Definitions (and macros) made by the clone go in a private layer on
+        top of the shared ones so they are never seen by anyone else.
+
+        The base layers are only read from. Procedures defined in them
+        still run against them, so from now on anything that would bind a
+        global name or macro in them raises instead: that includes a
+        shared procedure doing `set!` on a global when a clone calls it.
+        '''
+        macro_maps = getattr(self.macro_table, 'maps', [self.macro_table])
+        self.global_env.freeze()
+
+        new = object.__new__(type(self))
+        new.global_env = self.global_env.new_child()
+        new.builtins = self.builtins
+        new.macro_table = ChainMap({}, *macro_maps)
+        new._expansions = {}
+        new.jit = None
+        new.folder = None
+        new.lock = RLock()
+        new.workers = self.workers
+        new._set_mode(self.mode)
+        if self.jit is not None:
+            new.jit = self.jit.clone(new)
+        return new
+
+    def reset(self):
+        '''
+        Forget everything defined since this Evaluator was created, or
+        cloned, by dropping its private layer. The layers that are shared
+        with other Evaluators are untouched.
+        '''
+        self.global_env.maps[0] = {}
+        self.global_env.changed()
+
+        if isinstance(self.macro_table, ChainMap):
+            self.macro_table.maps[0] = {}
+        else:
+            self.macro_table.clear()
+
+        if self.jit is not None:
+            self.jit.reset()
+
+    def assign(self, env, sym, value):
+        '''
+        `set!` a name where it is bound. Globals are always written to the
+        top layer of the global environment so that cloned Evaluators
+        never write to the layers that they share.
+        '''
+        global_maps = self.global_env.maps
+
+        for m in env.maps:
+            if sym in m:
+                if any(m is g for g in global_maps):
+                    break
+                m[sym] = value
+                return
+
+        self.global_env[sym] = value
+        self.rebound(sym)
+
+    def rebound(self, sym):
+        '''Note that a global name has been given a new value'''
+        if self.jit is not None:
+            self.jit.invalidate(sym)
+        if self.folder is not None:
+            self.folder.invalidate(sym)
 
     def _set_read_proc(self, read_proc):
         '''
         Bind in the read procedure from the Reader.
         '''
-        self.global_env['read'] = read_proc
+        self.builtins[Symbol('read')] = read_proc
+
+    def _set_workers(self):
+        '''
+        Bind in pmap, preduce and pcall: see ripl.parallel.
+        The worker processes are only started when first used.
+        '''
+        self.workers = WorkerPool(self)
+        self.builtins.update(self.workers.builtins())
+
+    def can_define(self, sym, current):
+        '''
+        A name can be defined if it is unbound or only bound to a builtin:
+        the prelude and user code are free to shadow the builtins.
+        '''
+        return current is None or current is self.builtins.get(sym)
+
+    def define(self, env, sym, value):
+        '''
+        Bind a new name in env. Globals are checked and bound under the
+        lock so that if threads race to define the same name only one of
+        them succeeds.
+        '''
+        if env is not self.global_env:
+            env[sym] = value
+            return
+
+        with self.lock:
+            if not self.can_define(sym, env.get(sym)):
+                raise RiplError(f'Attempt to re-define symbol: {sym}')
+
+            env[sym] = value
+            self.rebound(sym)
+
+    def define_macro(self, name, proc):
+        '''Add a new macro, under the lock like `define`'''
+        with self.lock:
+            if self.global_env.frozen:
+                raise RiplError(
+                    f'Attempt to define macro `{name}` in an environment '
+                    'that is shared with cloned interpretors')
+
+            if self.macro_table.get(name) is not None:
+                raise RiplError(
+                    f'Attempt to re-define existing macro: {name}')
+
+            self.macro_table[name] = proc
 
     def eval(self, expr, env=None):
         '''
@@ -45,17 +299,35 @@ class Evaluator:
         if env is None:
             env = self.global_env
 
+        # The innermost (frame, names, body, env) that `recur` jumps to
+        loop = None
+
         while True:
-            if isinstance(expr, self.value_types):
-                return expr
+            if isinstance(expr, Symbol):
+                # Walk the maps directly: ChainMap.get checks every map
+                # for the name and then looks it up all over again
+                for m in env.maps:
+                    if expr in m:
+                        val = m[expr]
+                        break
+                else:
+                    val = None
 
-            elif isinstance(expr, Symbol):
-                val = env.get(expr)
                 if val is None:
                     raise RiplError(f'Unknown symbol: `{expr}`')
                 return val
 
+            elif isinstance(expr, self.value_types):
+                return expr
+
+            elif isinstance(expr, COLLECTIONS):
+                return self.fill_collection(expr, env)
+
             elif isinstance(expr, LispList):
+                if not expr:
+                    # () is the empty list, as in the other modes
+                    return expr
+
                 head, *rest = expr
 
                 if not isinstance(head, Symbol):
@@ -69,24 +341,22 @@ class Evaluator:
                 # Check for known macros
                 macro = self.macro_table.get(head)
                 if macro:
-                    # Run the macro
-                    expr = self.apply(macro, rest)
-                    # Evaluate in the global env
-                    # XXX: Is this right? (From Norvig I think...)
-                    return self.eval(expr, self.global_env)
+                    # Run the macro (once per call site) and then evaluate
+                    # the expansion in its place
+                    expr = self.expand_once(expr, macro)
+                    continue
 
                 # Now we switch based on the head and deal with special forms
-                if head == Symbol('quote'):
+                if head is QUOTE:
                     return rest[0]
 
-                elif head == Symbol('quasiquote'):
-                    # expr = self.expand_quasiquote(rest[0])
-                    return self.expand_quasiquote(rest[0])
+                elif head is QUASIQUOTE:
+                    return self.fill_quasiquote(rest[0], env)
 
-                elif head in [Symbol('unquote'), Symbol('unquote-splicing')]:
+                elif head in UNQUOTES:
                     raise RiplError("Can't unquote outside of quasi-quote")
 
-                elif head == Symbol('if'):
+                elif head is IF:
                     cond, *rest = rest
                     cond = self.eval(cond, env)
                     true, *rest = rest
@@ -106,10 +376,11 @@ class Evaluator:
 
                         expr = false
 
-                elif head == Symbol('cond'):
+                elif head is COND:
                     # The rest of the list should be ((cond body) ...)
                     for branch in rest:
-                        if not (isinstance(branch, list) and len(branch) == 2):
+                        if not (isinstance(branch, LispList) and
+                                len(branch) == 2):
                             raise RiplError(
                                 f'Invalid `cond` branche: {branch}')
 
@@ -119,17 +390,22 @@ class Evaluator:
                         if isinstance(cond, bool):
                             if cond:
                                 expr = body
-                        elif cond == Keyword('else'):
+                                break
+                        elif cond is ELSE:
                             expr = body
+                            break
                         else:
                             raise RiplError(
                                 f'Invalid `cond` condition: {cond}')
+                    else:
+                        # No branch matched
+                        return None
 
-                elif head == Symbol('set!'):
+                elif head is SET:
                     try:
                         sym, value = rest
                     except ValueError:
-                        raise RiplError('Invalid `set!`: {value}')
+                        raise RiplError(f'Invalid `set!`: {LispList(rest)}')
 
                     if not isinstance(sym, Symbol):
                         raise RiplError(
@@ -140,28 +416,27 @@ class Evaluator:
                         raise RiplError(
                             f'Attempt to `set!` non existant symbol: {sym}')
 
-                    env[sym] = self.eval(value, env)
+                    self.assign(env, sym, self.eval(value, env))
                     return
 
-                elif head == Symbol('define'):
+                elif head is DEFINE:
                     try:
                         sym, value = rest
                     except ValueError:
-                        raise RiplError('Invalid `define`: {value}')
+                        raise RiplError(f'Invalid `define`: {LispList(rest)}')
 
                     if not isinstance(sym, Symbol):
                         raise RiplError(
                             f'Attempt to define non-Symbol: {sym}')
 
-                    current = env.get(sym)
-                    if current is not None:
+                    if not self.can_define(sym, env.get(sym)):
                         raise RiplError(
                             f'Attempt to re-define symbol: {sym}')
 
-                    env[sym] = self.eval(value, env)
+                    self.define(env, sym, self.eval(value, env))
                     return
 
-                elif head in [Symbol('lambda'), Symbol('λ'), Symbol('fn')]:
+                elif head in LAMBDAS:
                     try:
                         params, body = rest
                         return Procedure(params, "", body, env, self)
@@ -169,7 +444,15 @@ class Evaluator:
                         raise RiplError(
                             f'Invalid procedure definition: {rest}')
 
-                elif head == Symbol('defn'):
+                elif head is ASYNC_FN:
+                    try:
+                        params, body = rest
+                        return AsyncProcedure(params, "", body, env, self)
+                    except ValueError:
+                        raise RiplError(
+                            f'Invalid procedure definition: {rest}')
+
+                elif head is DEFN:
                     try:
                         if len(rest) == 4:
                             doc_str = rest.pop(1)
@@ -181,22 +464,21 @@ class Evaluator:
                             raise RiplError(
                                 f'Attempt to define non-Symbol: {name}')
 
-                        current = env.get(name)
-                        if current is not None:
+                        if not self.can_define(name, env.get(name)):
                             raise RiplError(
                                 f'Attempt to re-define symbol: {name}')
 
-                        env[name] = Procedure(
+                        self.define(env, name, Procedure(
                             params, doc_str, body, env, self
-                        )
+                        ))
                         return
 
                     except ValueError:
                         raise RiplError(
                             f'Invalid procedure definition: {rest}')
 
-                elif head == Symbol('defmacro'):
-                    if env != self.global_env:
+                elif head is DEFMACRO:
+                    if env is not self.global_env:
                         raise RiplError(
                             'Macro definition only allowed at the top level')
 
@@ -211,14 +493,9 @@ class Evaluator:
                             raise RiplError(
                                 f'Attempt to define non-Symbol: {name}')
 
-                        current = self.macro_table.get(name)
-                        if current is not None:
-                            raise RiplError(
-                                f'Attempt to re-define existing macro: {name}')
-
-                        self.macro_table[name] = Procedure(
+                        self.define_macro(name, Procedure(
                             params, doc_str, body, env, self
-                        )
+                        ))
                         return
 
                     except ValueError:
@@ -226,38 +503,54 @@ class Evaluator:
                             f'Invalid macro definition: {rest}')
 
                 # (let ((parm val) ...) body)
-                # => ((lambda (parm ...) body) val ...)
-                elif head == Symbol('let'):
+                # is ((lambda (parm ...) body) val ...) without the lambda:
+                # the body stays in tail position
+                elif head is LET:
                     bindings, body = rest
                     parms, vals = zip(*bindings)
-                    # Convert to interal repr
-                    parms = LispList(parms)
-                    vals = LispList(vals)
-                    expr = LispList([
-                        LispList([Symbol('lambda'), parms, body]),
-                        *vals])
-
-                elif head == Symbol('begin'):
+                    vals = self.get_args(vals, env)
+                    env = env.new_child(dict(zip(parms, vals)))
+                    expr = body
+
+                elif head is BEGIN:
                     for exp in rest[:-1]:
                         self.eval(exp, env)
 
                     expr = rest[-1]
 
-                elif head == Symbol('eval'):
-                    # evaluate a quoted expression
-                    if isinstance(rest[0], list):
-                        # tokens are [quote, [ ... ]]
-                        expr = rest[1]
+                elif head is LOOP:
+                    # One frame for the whole loop that recur rebinds
+                    names, inits, body, fresh = self.loop_parts(expr)
+                    frame = dict(zip(names, self.get_args(inits, env)))
+                    env = env.new_child(frame)
+                    loop = (frame, names, body, env, fresh)
+                    expr = body
+
+                elif head is RECUR:
+                    if loop is None:
+                        raise RiplError(f'`recur` outside of `loop`: {expr}')
+
+                    vals = self.get_args(rest, env)
+                    frame, names, expr, env, fresh = loop
+                    if fresh:
+                        # Procedures made so far keep the old bindings
+                        frame = dict(zip(names, vals))
+                        env = env.parents.new_child(frame)
+                        loop = (frame, names, expr, env, fresh)
                     else:
-                        # single token is a symbol, try to look it up
-                        try:
-                            _val = env[rest[0]]
-                            expr = _val
-                        except AttributeError:
-                            raise NameError(
-                                'Undefined symbol {}'.format(rest[0]))
+                        for name, val in zip(names, vals):
+                            frame[name] = val
 
-                elif head == Symbol('apply'):
+                elif head is EVAL:
+                    # (eval x): evaluate the value of x, which only sees
+                    # the globals
+                    if len(rest) != 1:
+                        raise RiplError(f'Malformed `eval` form: {rest}')
+
+                    expr = self.eval(rest[0], env)
+                    env, loop = self.global_env, None
+
+                elif head is APPLY:
                     # (apply f (...))
                     proc = self.eval(rest[0], env)
                     args = self.get_args(rest[1:], env)
@@ -273,10 +566,25 @@ class Evaluator:
                     proc = self.eval(head, env)
                     args = self.get_args(rest, env)
 
-                    if isinstance(proc, Procedure):
+                    if (isinstance(proc, Procedure) and
+                            proc._evaluator is self):
+                        if self.jit is not None:
+                            code = self.jit.entry(proc)
+                            if (code is not None and
+                                    len(args) == len(proc._params)):
+                                return code(*args)
+
                         expr = proc._body
                         env = proc.get_call_env(args)
                     else:
+                        # Procedures from the base of a clone run in the
+                        # base, like any other function
+                        if len(args) == 2 and type(proc) is FunctionType:
+                            # (+ a b) and friends skip the variadic wrapper
+                            binary = BINARY.get(proc)
+                            if binary is not None:
+                                return binary(args[0], args[1])
+
                         # If this is a Python function then just call it
                         return proc(*args)
 
@@ -284,47 +592,178 @@ class Evaluator:
                 raise RiplError(
                     f'Unknown expression in input: {expr}')
 
+    def eval_async(self, expr, env=None):
+        '''
+        A coroutine that evaluates an expression, suspending at each
+        `await` in it: see ripl.aio.
+        '''
+        return eval_async(self, expr, env)
+
+    def expand_once(self, expr, macro):
+        '''
+        Expand a call to a macro. Expansions are cached against the list
+        node of the call itself so each call site is only expanded once,
+        however many times it is run. An entry is only used if the macro
+        is the one that produced it: redefining or removing the macro
+        invalidates it.
+        '''
+        expansions = self._expansions
+        hit = expansions.get(id(expr))
+        if hit is not None and hit[1] is macro:
+            return hit[2]
+
+        if len(expansions) >= self.max_expansions:
+            # Forms built at run time (eval) would otherwise grow this
+            # without limit
+            expansions.clear()
+
+        expansion = self.apply(macro, list(expr.cdr))
+        # Holding on to expr stops its id being reused while cached
+        expansions[id(expr)] = (expr, macro, expansion)
+        return expansion
+
+    def analyse_loop(self, rest):
+        '''
+        Split up the (((name init) ...) body) of a `loop`, expanding any
+        macros in it and checking that `recur` is only used in tail
+        position. Returns (names, inits, body, fresh): `fresh` is true if
+        the body can make procedures, which then need each time round the
+        loop to have a frame of its own rather than one rebound in place.
+        '''
+        if len(rest) != 2 or not isinstance(rest[0], LispList):
+            raise RiplError(f'Malformed `loop` form: {rest}')
+
+        bindings, body = rest
+        for binding in bindings:
+            if not (isinstance(binding, LispList) and len(binding) == 2 and
+                    isinstance(binding.car, Symbol)):
+                raise RiplError(f'Invalid `loop` binding: {binding}')
+
+        names = [binding.car for binding in bindings]
+        inits = [self.expand_macros(binding.cdr.car) for binding in bindings]
+        body = self.expand_macros(body)
+        check_recur(body, len(names), True)
+
+        return names, inits, body, makes_procedures(body)
+
+    def loop_parts(self, expr):
+        '''
+        analyse_loop for a whole (loop ...) form, cached against the form
+        like a macro expansion so that it is only done once.
+        '''
+        expansions = self._expansions
+        hit = expansions.get(id(expr))
+        if hit is not None and hit[1] is LOOP:
+            return hit[2]
+
+        if len(expansions) >= self.max_expansions:
+            expansions.clear()
+
+        parts = self.analyse_loop(expr.cdr)
+        expansions[id(expr)] = (expr, LOOP, parts)
+        return parts
+
+    def expand_macros(self, expr):
+        '''
+        Expand every macro call in an expression ahead of time using the
+        macros that are currently defined. Quoted data, names and parameter
+        lists are left alone.
+        '''
+        while isinstance(expr, LispList) and expr:
+            head = expr.car
+            if not isinstance(head, Symbol):
+                break
+
+            macro = self.macro_table.get(head)
+            if not macro:
+                break
+
+            expr = self.expand_once(expr, macro)
+
+        if isinstance(expr, COLLECTIONS) and not is_constant(expr):
+            return rebuild(expr, list(map(self.expand_macros, elements(expr))))
+
+        if not (isinstance(expr, LispList) and expr):
+            return expr
+
+        expand = self.expand_macros
+        head = expr.car
+
+        if head is QUOTE or head is QUASIQUOTE or head is DEFMACRO:
+            return expr
+
+        elif (head in LAMBDAS or head is ASYNC_FN or head is DEFINE or
+              head is SET):
+            # Keep the parameters / name
+            return LispList([head, *expr[1:2], *map(expand, expr[2:])])
+
+        elif head is DEFN:
+            # Only the body is code
+            *init, body = expr
+            return LispList([*init, expand(body)])
+
+        elif (head is LET or head is LOOP) and len(expr) == 3:
+            _, bindings, body = expr
+            if isinstance(bindings, LispList):
+                bindings = LispList(
+                    LispList([b[0], *map(expand, b[1:])])
+                    if isinstance(b, LispList) else b
+                    for b in bindings
+                )
+            return LispList([head, bindings, expand(body)])
+
+        elif head is COND:
+            return LispList([head, *(
+                LispList(map(expand, branch))
+                if isinstance(branch, LispList) else branch
+                for branch in expr.cdr
+            )])
+
+        return LispList(map(expand, expr))
+
     def apply(self, proc, args):
         '''Apply a procedue to an argument list'''
         return proc(*args)
 
-    # XXX PRESENTLY BORKED
-    def expand_quasiquote(self, expr):
-        '''Expand a quasi-quoted expression in an environment'''
-        def is_pair(e):
-            return isinstance(e, LispList) and len(e) != 0
-
-        if not is_pair(expr):
-            # return LispList([Symbol("quote"), expr])
+    def fill_quasiquote(self, expr, env):
+        '''Build a quasi-quoted expression, evaluating its unquotes'''
+        if not (isinstance(expr, LispList) and expr):
             return expr
 
         # Make sure we aren't splicing a list into the head
         # position of the new list
-        if expr[0] == Symbol("unquote-splicing"):
+        if expr[0] is UNQUOTE_SPLICING:
             raise RiplError(
                 f"Can't splice at the head of a list: {expr}")
 
-        if expr[0] == Symbol('unquote'):
+        if expr[0] is UNQUOTE:
             if len(expr) != 2:
                 raise RiplError(f'Unquoting error: {expr}')
-            return expr[1]
+            return self.eval(expr[1], env)
+
+        result = []
+        for elem in expr:
+            if (isinstance(elem, LispList) and elem and
+                    elem[0] is UNQUOTE_SPLICING):
+                if len(elem) != 2:
+                    raise RiplError(f'Unquoting error: {expr}')
+                result.extend(self.eval(elem[1], env))
+            else:
+                result.append(self.fill_quasiquote(elem, env))
 
-        elif is_pair(expr[0]) and expr[0][0] == Symbol('unquote-splicing'):
-            if len(expr[0]) != 2:
-                raise RiplError(f'Unquoting error: {expr}')
+        return LispList(result)
 
-            return LispList(expr[0][1] + self.expand_quasiquote(expr[1:]))
+    def fill_collection(self, expr, env):
+        '''Evaluate the elements of a vector or map literal'''
+        if is_constant(expr):
+            return expr
 
-        else:
-            return LispList([
-                [self.expand_quasiquote(expr[0])] +
-                self.expand_quasiquote(expr[1:])
-            ])
+        return rebuild(expr, [self.eval(e, env) for e in elements(expr)])
 
     def get_args(self, lst, env):
         '''
         Find the arguments for a procedure via recursive evaluation.
-        NOTE: This will need to change if we move to internal
-              s-exps for data representation.
+        These are only ever splatted into a call so they stay as a
+        Python list rather than becoming a LispList.
         '''
-        return LispList([self.eval(elem, env) for elem in lst])
+        return [self.eval(elem, env) for elem in lst]
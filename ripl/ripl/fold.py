@@ -0,0 +1,564 @@
+'''
+An optional optimisation pass over forms before they are run.
+
+The Folder rewrites (macro expanded) forms so that work that doesn't depend
+on anything at run time is done once, up front:
+
+    - calls to the pure std_ops and bool_tests builtins whose arguments
+      are all literals are replaced by their result: (+ 1 2 3) => 6
+    - `if` and `cond` branches that can never be taken are dropped
+    - `let` bindings of literals are substituted into the body
+    - globals bound once by (define name <literal>) are treated as
+      constants and replaced by their value
+    - quoted numbers, strings and booleans lose their quote
+
+Folding is only safe while a name still means what it did when the form
+was folded, so nothing is folded that has been rebound. Each batch of forms
+(a file or a line of input) is scanned before any of it is folded and every
+name that it `set!`s, defines more than once or passes to a macro (which
+might rebind it) is never treated as a constant again. `eval` could rebind
+anything, so once a batch uses it no globals are folded at all. Names bound
+locally by lambda, let, loop or a local define shadow constants and
+builtins in the usual way.
+
+A procedure can be called after a later batch has rebound a global (or a
+builtin). Globals are only folded into the body of a procedure defined at
+the top level, by (defn name ...) or (define name (lambda ...)), and the
+Folder remembers which globals each folded body relied on. When the
+Evaluator rebinds one of them (see Evaluator.rebound) the procedure gets
+its unfolded body back. Bodies of other procedures, including any nested
+in a top level one, always look globals up.
+
+Every rewrite is recorded in `changes` as a (before, after) pair.
+'''
+from collections import Counter
+
+from .persistent import COLLECTIONS, elements, rebuild, is_constant
+from .types import (
+    Symbol, Keyword, LispList, Procedure,
+    QUOTE, QUASIQUOTE, IF, COND, SET, DEFINE, LAMBDAS, DEFN, DEFMACRO, LET,
+    EVAL, LOOP, ELSE, ASYNC_FN
+)
+
+
+# Builtins with no side effects whose results only depend on their args
+PURE = frozenset(Symbol(name) for name in [
+    '+', '-', '*', '/', '%', '>', '<', '>=', '<=', '=', '!=',
+    'eq?', 'equal?', 'callable?', 'null?', 'string?', 'symbol?', 'dict?',
+    'tuple?', 'list?', 'int?', 'float?', 'number?',
+])
+# Values that evaluate to themselves and can't be changed
+LITERALS = frozenset([int, float, complex, bool, str, Keyword])
+# Forms whose contents are not code to be folded
+OPAQUE = frozenset([QUOTE, QUASIQUOTE, DEFMACRO, EVAL])
+
+# A local name that isn't a known literal
+SHADOWED = object()
+# What an `if` without a false branch gives when the test fails
+NOTHING = LispList([QUOTE, None])
+
+
+def is_literal(expr):
+    '''Does this evaluate to itself?'''
+    return type(expr) in LITERALS
+
+
+def literal_value(expr):
+    '''
+    The value of a literal or quoted form as a 1-tuple, or () if the
+    value isn't known until run time.
+    '''
+    if type(expr) in LITERALS:
+        return (expr,)
+
+    if (type(expr) is LispList and len(expr) == 2 and expr.car is QUOTE):
+        value = expr.cdr.car
+        if type(value) in LITERALS or isinstance(value, (Symbol, LispList)):
+            return (value,)
+
+    return ()
+
+
+def as_form(value):
+    '''An expression that evaluates to value, or None if there isn't one'''
+    if type(value) in LITERALS:
+        return value
+
+    if isinstance(value, (Symbol, LispList)):
+        return LispList([QUOTE, value])
+
+    return None
+
+
+def _symbols(expr):
+    '''Every symbol anywhere in a form'''
+    if isinstance(expr, Symbol):
+        yield expr
+    elif isinstance(expr, LispList):
+        for sub in expr:
+            yield from _symbols(sub)
+    elif isinstance(expr, COLLECTIONS):
+        for sub in elements(expr):
+            yield from _symbols(sub)
+
+
+def _binds(expr, name):
+    '''Does anything in a form define or set! `name`?'''
+    if isinstance(expr, COLLECTIONS):
+        return any(_binds(sub, name) for sub in elements(expr))
+
+    if not (isinstance(expr, LispList) and expr):
+        return False
+
+    head = expr.car
+    if head is QUOTE:
+        return False
+
+    if (head is DEFINE or head is DEFN or head is SET) and len(expr) > 1:
+        if expr[1] is name:
+            return True
+
+    return any(_binds(sub, name) for sub in expr)
+
+
+def _definition(expr):
+    '''
+    The (name, body) of a top level (defn name ...) or (define name
+    (lambda ...)) form, or (None, None) for anything else.
+    '''
+    if not (isinstance(expr, LispList) and expr):
+        return None, None
+
+    head = expr.car
+    if head is DEFN and len(expr) in (4, 5) and isinstance(expr[1], Symbol):
+        return expr[1], expr[-1]
+
+    if (head is DEFINE and len(expr) == 3 and isinstance(expr[1], Symbol)
+            and isinstance(expr[2], LispList) and len(expr[2]) == 3
+            and expr[2].car in LAMBDAS):
+        return expr[1], expr[2][2]
+
+    return None, None
+
+
+class Folder:
+    '''Fold constants in forms for an Evaluator'''
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+        # (before, after) for each rewrite
+        self.changes = []
+        # Global name -> literal for names bound once by define
+        self.constants = {}
+        # Names that can never be constants again
+        self.rebound = set()
+        # Whether any batch has used `eval`, which can rebind any name
+        self.evals = False
+        # Constants defined by the current batch: not yet evaluated
+        self._pending = set()
+        # How many procedure bodies deep the fold currently is
+        self._procedures = 0
+        # The globals that folding the body of a top level procedure has
+        # relied on so far, or None when not folding one
+        self._deps = None
+        # (name, body, folded body, deps) for the last top level form, to
+        # be tracked once it has been run
+        self._defined = None
+        # Global name -> [(procedure, body, folded body)] for each folded
+        # procedure that relies on what the name means now
+        self._dependents = {}
+
+    def clone(self, evaluator):
+        '''A Folder for a cloned Evaluator that knows what we know'''
+        new = Folder(evaluator)
+        new.constants = dict(self.constants)
+        new.rebound = set(self.rebound)
+        new.evals = self.evals
+        return new
+
+    def report(self):
+        '''A line describing each change made so far'''
+        return [f'{before!r} => {after!r}' for before, after in self.changes]
+
+    def fold_all(self, exprs, prepare=None):
+        '''
+        Fold a batch of top level forms, yielding each one as it is needed.
+        The forms are all read and scanned for rebindings first, but are
+        only passed through `prepare` (macro expansion) and folded one at a
+        time so that each sees the definitions made by the ones before it.
+        '''
+        exprs = list(exprs)
+        self.scan(exprs)
+
+        for expr in exprs:
+            if prepare is not None:
+                expr = prepare(expr)
+
+            expr = self.fold_top(expr)
+            try:
+                yield expr
+            finally:
+                self.track()
+
+    def scan(self, exprs):
+        '''Find everything that a batch of forms rebinds'''
+        defined = Counter()
+        assigned = set()
+        macros = set(self.evaluator.macro_table)
+
+        for expr in exprs:
+            if self._scan(expr, defined, assigned, macros):
+                self.evals = True
+
+        # Anything already bound (builtins included) is being redefined
+        env = self.evaluator.global_env
+        rebound = assigned | {
+            name for name, n in defined.items()
+            if n > 1 or name in self.constants or env.get(name) is not None
+        }
+
+        for name in rebound - self.rebound:
+            self.constants.pop(name, None)
+
+        self.rebound |= rebound
+        self._pending = set()
+
+    def _scan(self, expr, defined, assigned, macros):
+        '''Note what a form rebinds, returning True if it uses `eval`'''
+        if isinstance(expr, COLLECTIONS):
+            return any([
+                self._scan(sub, defined, assigned, macros)
+                for sub in elements(expr)])
+
+        if not (isinstance(expr, LispList) and expr):
+            return False
+
+        head = expr.car
+        if head is QUOTE:
+            return False
+
+        if isinstance(head, Symbol) and head in macros:
+            # A macro could do anything with the names that it is given
+            names = set(_symbols(expr.cdr))
+            assigned.update(names)
+            return EVAL in names
+
+        if len(expr) > 1 and isinstance(expr[1], Symbol):
+            if head is DEFINE or head is DEFN:
+                defined[expr[1]] += 1
+            elif head is SET:
+                assigned.add(expr[1])
+            elif head is DEFMACRO:
+                macros.add(expr[1])
+
+        evals = head is EVAL
+        for sub in expr:
+            evals |= self._scan(sub, defined, assigned, macros)
+        return evals
+
+    def fold_top(self, expr):
+        '''
+        Fold a top level form, noting any constant that it defines and the
+        globals that the body of any procedure it defines relies on.
+        '''
+        name, body = _definition(expr)
+        self._deps = set() if name is not None else None
+        try:
+            expr = self.fold(expr, {})
+        finally:
+            deps, self._deps = self._deps, None
+
+        if deps:
+            self._defined = (name, body, _definition(expr)[1], deps)
+
+        if (isinstance(expr, LispList) and len(expr) == 3 and
+                expr.car is DEFINE and isinstance(expr[1], Symbol) and
+                is_literal(expr[2]) and expr[1] not in self.rebound):
+            self.constants[expr[1]] = expr[2]
+            self._pending.add(expr[1])
+
+        return expr
+
+    def track(self):
+        '''
+        Once the last top level form has been run, watch the globals that
+        the procedure it defined relies on.
+        '''
+        defined, self._defined = self._defined, None
+        if defined is None:
+            return
+
+        name, body, folded, deps = defined
+        proc = self.evaluator.global_env.get(name)
+        if not (isinstance(proc, Procedure) and proc._body is folded):
+            return
+
+        for sym in deps:
+            self._dependents.setdefault(sym, []).append((proc, body, folded))
+
+    def invalidate(self, sym):
+        '''
+        A global has been given a new value: it is no longer a constant and
+        every procedure whose body relied on it gets its unfolded body back.
+        '''
+        value = self.evaluator.global_env.get(sym)
+        if sym in self.constants and self.constants[sym] is value:
+            # The constant being defined
+            return
+
+        self.constants.pop(sym, None)
+        self.rebound.add(sym)
+
+        for proc, body, folded in self._dependents.pop(sym, ()):
+            if proc._body is folded:
+                proc.set_body(body)
+
+    def changed(self, before, after):
+        '''Record a rewrite'''
+        self.changes.append((before, after))
+        return after
+
+    def sees_globals(self):
+        '''
+        Can globals be folded here? Only outside of procedures or in the
+        body of a top level one.
+        '''
+        if self.evals:
+            return False
+        return not self._procedures or (
+            self._procedures == 1 and self._deps is not None)
+
+    def constant(self, sym, scope):
+        '''The value of a name as a 1-tuple if it is known to be constant'''
+        if sym in scope:
+            value = scope[sym]
+            return () if value is SHADOWED else (value,)
+
+        if (sym in self.rebound or sym not in self.constants or
+                not self.sees_globals()):
+            return ()
+
+        value = self.constants[sym]
+        # Only trust the value if it is still what the name is bound to
+        if (sym not in self._pending and
+                self.evaluator.global_env.get(sym) is not value):
+            return ()
+
+        if self._procedures:
+            self._deps.add(sym)
+        return (value,)
+
+    def builtin(self, sym, scope):
+        '''The builtin a name refers to if it is an unshadowed pure one'''
+        if (sym not in PURE or sym in scope or sym in self.rebound or
+                not self.sees_globals()):
+            return None
+
+        builtin = self.evaluator.builtins.get(sym)
+        if self.evaluator.global_env.get(sym) is not builtin:
+            return None
+
+        if self._procedures:
+            self._deps.add(sym)
+        return builtin
+
+    def fold(self, expr, scope):
+        '''
+        Fold an expression. `scope` maps the local names that are visible
+        to their literal value or SHADOWED.
+        '''
+        if type(expr) is Symbol:
+            value = self.constant(expr, scope)
+            if value:
+                return self.changed(expr, value[0])
+            return expr
+
+        if isinstance(expr, COLLECTIONS):
+            if is_constant(expr):
+                return expr
+            return rebuild(expr, [
+                self.fold(sub, scope) for sub in elements(expr)])
+
+        if not (isinstance(expr, LispList) and expr):
+            return expr
+
+        head = expr.car
+        if type(head) is not Symbol:
+            return LispList(self.fold(sub, scope) for sub in expr)
+
+        if head not in scope and self.evaluator.macro_table.get(head):
+            # Not expanded: the macro gets the form as written
+            return expr
+
+        if head is QUOTE:
+            value = literal_value(expr)
+            if value and is_literal(value[0]):
+                return self.changed(expr, value[0])
+            return expr
+
+        elif head in OPAQUE:
+            return expr
+
+        elif head is IF:
+            return self.fold_if(expr, scope)
+
+        elif head is COND:
+            return self.fold_cond(expr, scope)
+
+        elif head is LET:
+            return self.fold_let(expr, scope)
+
+        elif head is LOOP and len(expr) == 3:
+            _, bindings, body = expr
+            bindings = LispList(
+                LispList([b.car, *(self.fold(e, scope) for e in b.cdr)])
+                if isinstance(b, LispList) and b else b
+                for b in bindings
+            )
+            names = [b.car for b in bindings if isinstance(b, LispList)]
+            body = self.fold(body, self.shadow(scope, names, body))
+            return LispList([LOOP, bindings, body])
+
+        elif (head in LAMBDAS or head is ASYNC_FN) and len(expr) == 3:
+            _, params, body = expr
+            body = self.fold_body(body, self.shadow(scope, params, body))
+            return LispList([head, params, body])
+
+        elif head is DEFN and len(expr) in (4, 5):
+            *init, params, body = expr
+            body = self.fold_body(body, self.shadow(scope, params, body))
+            return LispList([*init, params, body])
+
+        elif (head is DEFINE or head is SET) and len(expr) == 3:
+            return LispList([head, expr[1], self.fold(expr[2], scope)])
+
+        # A call: fold the arguments and then the call itself if we can
+        expr = LispList(self.fold(sub, scope) for sub in expr)
+        builtin = self.builtin(head, scope)
+        if builtin is None:
+            return expr
+
+        args = [literal_value(arg) for arg in expr.cdr]
+        if not all(args):
+            return expr
+
+        try:
+            result = as_form(builtin(*(arg[0] for arg in args)))
+        except Exception:
+            # Leave the error for run time
+            return expr
+
+        if result is None:
+            return expr
+
+        return self.changed(expr, result)
+
+    def fold_body(self, body, scope):
+        '''
+        Fold a procedure body: only the body of a top level procedure sees
+        global constants or folds calls to builtins
+        '''
+        self._procedures += 1
+        try:
+            return self.fold(body, scope)
+        finally:
+            self._procedures -= 1
+
+    def shadow(self, scope, params, body):
+        '''The scope inside a procedure or loop body'''
+        if isinstance(params, Symbol):
+            params = [params]
+
+        names = [p for p in params if isinstance(p, Symbol)]
+        # Local defines shadow from the start of the body
+        names += [
+            sym for sym in scope
+            if scope[sym] is not SHADOWED and _binds(body, sym)
+        ]
+        names += [
+            sym for sym in self.constants
+            if sym not in scope and _binds(body, sym)
+        ]
+        names += [sym for sym in PURE if _binds(body, sym)]
+
+        return {**scope, **dict.fromkeys(names, SHADOWED)}
+
+    def fold_if(self, expr, scope):
+        '''(if test true [false]): drop the branch that can't be taken'''
+        parts = [self.fold(sub, scope) for sub in expr.cdr]
+        if not 2 <= len(parts) <= 3:
+            return LispList([IF, *parts])
+
+        test = literal_value(parts[0])
+        if not test:
+            return LispList([IF, *parts])
+
+        if test[0]:
+            return self.changed(expr, parts[1])
+
+        return self.changed(expr, parts[2] if len(parts) == 3 else NOTHING)
+
+    def fold_cond(self, expr, scope):
+        '''(cond (test body) ...): drop branches that can't be taken'''
+        branches = []
+
+        for branch in expr.cdr:
+            if not (isinstance(branch, LispList) and len(branch) == 2):
+                # Leave the error for run time
+                branches.append(branch)
+                continue
+
+            test, body = (self.fold(sub, scope) for sub in branch)
+            value = literal_value(test)
+
+            if value and value[0] is False:
+                continue
+
+            branches.append(LispList([test, body]))
+
+            if value and (value[0] is True or value[0] is ELSE):
+                # Nothing after this can be reached
+                break
+
+        if not branches:
+            return self.changed(expr, NOTHING)
+
+        first = branches[0]
+        if isinstance(first, LispList) and len(first) == 2:
+            value = literal_value(first.car)
+            if value and (value[0] is True or value[0] is ELSE):
+                return self.changed(expr, first[1])
+
+        folded = LispList([COND, *branches])
+        if len(branches) != len(expr) - 1:
+            self.changed(expr, folded)
+        return folded
+
+    def fold_let(self, expr, scope):
+        '''(let ((name value) ...) body): substitute literal bindings'''
+        if len(expr) != 3 or not isinstance(expr[1], LispList):
+            return expr
+
+        _, bindings, body = expr
+        kept, inner = [], dict(scope)
+
+        for binding in bindings:
+            if not (isinstance(binding, LispList) and len(binding) == 2):
+                return expr
+
+            name, value = binding.car, self.fold(binding[1], scope)
+            if is_literal(value) and not _binds(body, name):
+                inner[name] = value
+            else:
+                inner[name] = SHADOWED
+                kept.append(LispList([name, value]))
+
+        inner.update(self.shadow(inner, [], body))
+        body = self.fold(body, inner)
+
+        if not kept:
+            return self.changed(expr, body)
+
+        folded = LispList([LET, LispList(kept), body])
+        if len(kept) != len(bindings):
+            self.changed(expr, folded)
+        return folded
@@ -0,0 +1,116 @@
+'''
+Run blocking work in the background on a shared pool of threads.
+
+    (define f (future (load-data "a.txt")))
+    ...
+    (deref f)
+
+`future` starts evaluating its body on another thread straight away and
+returns a handle to it. `deref` waits for the result (raising anything
+that the body raised) and `future-all` waits for a whole collection of
+them. Only one thread runs Python code at a time, so this is for overlapping
+I/O, subprocesses and C code that releases the GIL: for CPU bound RIPL code
+use pmap and friends from ripl.parallel.
+
+Globals and macros can be defined from any thread (see Evaluator.define)
+but anything else that several futures share needs to be safe to share.
+'''
+from threading import Lock
+from concurrent.futures import (
+    Future, ThreadPoolExecutor, TimeoutError, wait, FIRST_EXCEPTION
+)
+
+from .types import LispList
+
+
+# Most of the threads will spend most of their time waiting
+max_threads = 32
+thread_name_prefix = 'ripl-future'
+_executor = None
+_executor_lock = Lock()
+# Calls submitted to the pool that haven't finished yet
+_busy = 0
+
+
+def executor():
+    '''The thread pool shared by every interpretor, made on first use'''
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_threads, thread_name_prefix=thread_name_prefix)
+    return _executor
+
+
+def _finished(future):
+    global _busy
+    with _executor_lock:
+        _busy -= 1
+
+
+def submit(f, *args):
+    '''Run (f arg ...) on the pool, keeping count of unfinished calls'''
+    global _busy
+    pool = executor()
+    with _executor_lock:
+        _busy += 1
+
+    future = pool.submit(f, *args)
+    future.add_done_callback(_finished)
+    return future
+
+
+def busy():
+    '''The number of calls on the pool that haven't finished'''
+    return _busy
+
+
+def future_call(f, *args):
+    '''
+    (future-call f arg ...) runs (f arg ...) on the thread pool and
+    returns a future for the result. f can be any procedure, including
+    Python functions from pyimported modules.
+    '''
+    return submit(f, *args)
+
+
+def deref(future, timeout_ms=None, default=None):
+    '''
+    (deref f) waits for future f and returns its result.
+    (deref f timeout-ms default) gives up and returns default instead if
+    the result isn't ready in time.
+    '''
+    if not isinstance(future, Future):
+        raise TypeError(f'Can only deref a future, not {future!r}')
+
+    if timeout_ms is None:
+        return future.result()
+
+    try:
+        return future.result(timeout_ms / 1000)
+    except TimeoutError:
+        return default
+
+
+def future_all(futures):
+    '''
+    (future-all fs) waits for every future in fs, returning a list of
+    their results in order. If any of them fails this raises its error
+    as soon as it does, without waiting for the rest.
+    '''
+    futures = list(futures)
+    done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+    for f in done:
+        if f.exception() is not None:
+            raise f.exception()
+
+    return LispList([f.result() for f in futures])
+
+
+def is_future(x):
+    return isinstance(x, Future)
+
+
+def is_realised(future):
+    '''True once a future has finished, one way or another'''
+    return future.done()
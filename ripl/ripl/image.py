@@ -0,0 +1,144 @@
+'''
+Save and restore the state of an interpretor as a single image file.
+
+Loading the prelude means reading, expanding and evaluating every form in
+it for each new process. An image skips all of that: it holds the user
+level of the global environment along with the macro table (and so every
+Procedure reachable from them) so that booting is a single load. This is
+the same idea as a Smalltalk image or an SBCL core.
+
+Python functions can't always be pickled (the builtins include lambdas) so
+anything that a fresh Evaluator already has is stored by reference: the
+builtins, the evaluator itself and its global environment, along with any
+modules brought in by `pyimport`. Compiled procedures are stored as source
+and compiled again the first time that they are called.
+'''
+import io
+import pickle
+from types import ModuleType
+from collections import ChainMap
+from importlib import import_module
+
+from . import __version__
+from .types import RiplError
+
+
+MAGIC = b'RPLI'
+# Values that pickle just as well as a reference to them would
+ATOMS = (type(None), bool, int, float, str)
+
+
+class ImagePickler(pickle.Pickler):
+    '''Store anything that a fresh Evaluator will provide by reference'''
+    def __init__(self, file, evaluator):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.refs = {
+            id(evaluator): ('evaluator',),
+            id(evaluator.global_env): ('global_env',),
+            id(evaluator.builtins): ('builtins',),
+        }
+        for name, val in evaluator.builtins.items():
+            if type(val) not in ATOMS:
+                self.refs.setdefault(id(val), ('builtin', name))
+
+    def persistent_id(self, obj):
+        if isinstance(obj, ModuleType):
+            return ('module', obj.__name__)
+
+        return self.refs.get(id(obj))
+
+
+class ImageUnpickler(pickle.Unpickler):
+    '''Resolve references against the Evaluator being booted'''
+    def __init__(self, file, evaluator):
+        super().__init__(file)
+        self.evaluator = evaluator
+
+    def persistent_load(self, pid):
+        kind, *args = pid
+
+        if kind == 'module':
+            return import_module(*args)
+        elif kind == 'builtin':
+            return self.evaluator.builtins[args[0]]
+        elif kind == 'evaluator':
+            return self.evaluator
+
+        return getattr(self.evaluator, kind)
+
+
+def _definitions(evaluator):
+    '''Everything above the builtins, flattening any cloned layers'''
+    return ChainMap(*evaluator.global_env.maps[:-1])
+
+
+def unpicklable(evaluator):
+    '''Names in the global environment whose values can't be saved'''
+    names = []
+
+    for name, val in _definitions(evaluator).items():
+        try:
+            ImagePickler(io.BytesIO(), evaluator).dump(val)
+        except Exception:
+            names.append(name)
+
+    return names
+
+
+def save(evaluator, fname):
+    '''
+    Write an image of an Evaluator's global definitions and macros.
+    Globals whose values can't be pickled (open files, generators and
+    the like) are left out: their names are returned.
+    '''
+    skipped = unpicklable(evaluator)
+    env = {
+        name: val for name, val in _definitions(evaluator).items()
+        if name not in skipped
+    }
+    macros = dict(evaluator.macro_table)
+    header = (MAGIC, __version__, evaluator.mode)
+
+    with open(fname, 'wb') as f:
+        pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+        ImagePickler(f, evaluator).dump((env, macros))
+
+    return skipped
+
+
+def read_mode(fname):
+    '''The evaluation mode that an image was saved from'''
+    with open(fname, 'rb') as f:
+        return _read_header(f)
+
+
+def load(evaluator, fname):
+    '''Restore the definitions and macros in an image into an Evaluator'''
+    with open(fname, 'rb') as f:
+        mode = _read_header(f)
+        if mode != evaluator.mode:
+            raise RiplError(
+                f'Image {fname} was saved in {mode} mode, '
+                f'not {evaluator.mode}')
+
+        env, macros = ImageUnpickler(f, evaluator).load()
+
+    evaluator.global_env.maps[0].update(env)
+    evaluator.global_env.changed()
+    evaluator.macro_table.update(macros)
+
+
+def _read_header(f):
+    try:
+        magic, version, mode = pickle.load(f)
+    except Exception:
+        raise RiplError(f'Not a ripl image: {f.name}')
+
+    if magic != MAGIC:
+        raise RiplError(f'Not a ripl image: {f.name}')
+
+    if version != __version__:
+        raise RiplError(
+            f'Image {f.name} is from ripl {version}, not {__version__}')
+
+    return mode
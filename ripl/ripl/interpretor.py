@@ -2,9 +2,16 @@
 The core interpretor class for running RIPL
 '''
 import os
+import copy
+import mmap
 
 from .read import Reader
 from .eval import Evaluator
+from .types import RiplError
+from .cache import FormCache, fingerprint, default_cache_dir
+from .jit import JIT
+from .fold import Folder
+from . import image as _image
 
 
 RIPL_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -17,15 +24,81 @@ class Interpretor:
     '''
     prelude_dir = PRELUDE_DIR
 
-    def __init__(self):
-        '''Allow for disabling the prelude'''
+    # The directory to cache in: None for default_cache_dir()
+    cache_dir = None
+
+    def __init__(self, mode=None, cache=True, image=None, expand=False,
+                 jit=None, fold=False, cache_dir=None):
+        '''
+        Allow for disabling the prelude.
+        `mode` selects the evaluation strategy: see Evaluator.modes
+        `cache` enables the on disk cache of read files: see ripl.cache
+        `cache_dir` is where to cache, by default looked up from the
+        environment as each interpretor is made: see default_cache_dir
+        `image` boots from a saved image rather than a clean environment,
+        taking its mode from the image: see ripl.image
+        `expand` expands every macro in each form as it is loaded, before
+        any of it is run, rather than as each call is reached
+        `jit` compiles procedures to Python once they have been called
+        this many times: see ripl.jit
+        `fold` runs each form through the constant folder before it is
+        run, expanding its macros first: see ripl.fold
+        '''
+        if image is not None:
+            saved_mode = _image.read_mode(image)
+            if mode is not None and mode != saved_mode:
+                raise RiplError(
+                    f'Image {image} was saved in {saved_mode} mode')
+            mode = saved_mode
+
+        self.cache_dir = cache_dir or self.cache_dir or default_cache_dir()
         self.reader = Reader()
-        self.evaluator = Evaluator(read_proc=self.reader.read)
+        self.evaluator = Evaluator(
+            read_proc=self.reader.read, mode=mode or 'walk')
+        self.cache = FormCache(self.cache_dir) if cache else None
+        self.expand = expand
+        self.folder = Folder(self.evaluator) if fold else None
+        self.evaluator.folder = self.folder
+
+        if jit is not None:
+            # Compiled code is only kept on disk if there is somewhere
+            # central to put it
+            self.evaluator.jit = JIT(
+                self.evaluator, threshold=jit,
+                cache_dir=self.cache_dir if cache else None)
+
+        if image is not None:
+            _image.load(self.evaluator, image)
+
+    def clone(self):
+        '''
+        A cheap copy of this interpretor that shares its definitions so
+        far. Anything that the clone defines is private to it and can be
+        dropped with `reset`: see Evaluator.clone.
+        '''
+        new = copy.copy(self)
+        new.evaluator = self.evaluator.clone()
+        if self.folder is not None:
+            new.folder = self.folder.clone(new.evaluator)
+            new.evaluator.folder = new.folder
+        return new
+
+    def reset(self):
+        '''Forget everything defined since this interpretor was cloned'''
+        self.evaluator.reset()
+
+    def save_image(self, fname):
+        '''
+        Save the global environment and macros to an image file.
+        Returns the names of any globals that couldn't be saved.
+        '''
+        return _image.save(self.evaluator, fname)
 
     def load_prelude(self):
         '''Load in the prelude if requested'''
-        for fname in os.listdir(self.prelude_dir):
-            self.slurp(os.path.join(self.prelude_dir, fname))
+        for fname in sorted(os.listdir(self.prelude_dir)):
+            if fname.endswith('.rpl'):
+                self.slurp(os.path.join(self.prelude_dir, fname))
 
     def slurp(self, fname):
         '''
@@ -34,13 +107,100 @@ class Interpretor:
         if not fname.endswith('.rpl'):
             raise NameError(f'Attempt to slurp non *.rpl file: {fname}')
 
-        with open(fname, 'r') as f:
-            while True:
-                try:
-                    # Read as many expressions as we can find
-                    self.eval_expr(f)
-                except StopIteration:
-                    return
+        for _ in self.eval_file(fname):
+            pass
+
+    def eval_file(self, fname):
+        '''
+        Evaluate each top level form in a file, yielding the results.
+        The file is memory mapped and read one form at a time.
+
+        With the cache enabled, forms are taken from the cache when it is
+        valid. Otherwise they are macro expanded as they are read and
+        recorded for next time.
+
+        Folding constants reads the whole file before running any of it.
+        '''
+        if self.cache is None:
+            for expr in self._expanded(self.read_file(fname)):
+                yield self.evaluator.eval(expr)
+            return
+
+        key = self.cache.key(fname, fingerprint(self.evaluator))
+        cached = self.cache.load(fname, key)
+
+        if cached is not None:
+            for expr in self._folded(cached):
+                yield self.evaluator.eval(expr)
+            return
+
+        with self.cache.writer(fname, key) as writer:
+            def record(expr):
+                expr = self.evaluator.expand_macros(expr)
+                writer.add(expr)
+                return expr
+
+            for expr in self._folded(self.read_file(fname), record):
+                yield self.evaluator.eval(expr)
+
+    def read_file(self, fname):
+        '''
+        Read each top level form in a file.
+        '''
+        with open(fname, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                # mmap can't map an empty file
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                yield from self.reader.read_stream(m)
+
+    def eval_stream(self, stream):
+        '''
+        Evaluate each top level form in a file like object (or mmap) as
+        soon as it has been read, yielding the results.
+        '''
+        for expr in self._expanded(self.reader.read_stream(stream)):
+            yield self.evaluator.eval(expr)
+
+    def eval_expr(self, text):
+        '''
+        Evaluate every top level form in a string, yielding the results.
+        '''
+        for expr in self._expanded(self.reader.read_all(text)):
+            yield self.evaluator.eval(expr)
+
+    async def eval_expr_async(self, text):
+        '''
+        Evaluate every top level form in a string without blocking the
+        event loop, yielding the results: each form is run as a coroutine
+        that suspends at any `await`s in it. See ripl.aio.
+            async for result in interp.eval_expr_async(text):
+                ...
+        '''
+        for expr in self._expanded(self.reader.read_all(text)):
+            yield await self.evaluator.eval_async(expr)
+
+    def _expanded(self, exprs):
+        '''
+        Expand macros in each form up front if that was asked for.
+        Folding constants needs the macros to have been expanded.
+        '''
+        expand = None
+        if self.expand or self.folder is not None:
+            expand = self.evaluator.expand_macros
+
+        return self._folded(exprs, expand)
+
+    def _folded(self, exprs, prepare=None):
+        '''
+        Pass each form through `prepare` just before it is run and then
+        fold constants if that is enabled.
+        '''
+        if self.folder is not None:
+            return self.folder.fold_all(exprs, prepare)
+
+        if prepare is None:
+            return exprs
 
-    def eval_expr(self, expr):
-        pass
+        return map(prepare, exprs)
@@ -0,0 +1,710 @@
+'''
+A second tier for hot procedures: compile them to Python source.
+
+The walk and closure modes count the calls made to each top level
+procedure. Once one has been called `threshold` times the JIT tries to
+translate its body into the source of a Python function, which is run
+through compile() so that from then on the procedure runs as CPython
+bytecode:
+
+    - calls to the procedure itself in tail position become a loop
+    - arithmetic and comparisons using the std_ops builtins become Python
+      operators
+    - globals are read from cells that are kept up to date as names are
+      given new values, rather than searched for on every use
+
+Forms that the JIT doesn't handle (closures, quasiquote, eval, vector
+literals of anything but constants...) leave a procedure with the
+interpretor. Inlined operators and calls to the
+procedure itself rely on what those names meant when it was promoted:
+giving one of them a new value (define, defn or set!) sends the procedure
+back to the interpretor until it is promoted again.
+
+Generated code is cached by its source, in memory and (if there is a cache
+directory) on disk, so that a given body only goes through compile() once.
+'''
+import os
+import sys
+import math
+import marshal
+import hashlib
+import tempfile
+from collections import ChainMap
+
+from . import __version__
+from .cache import is_private, make_private_dir
+from .compile import TailCall, trampoline
+from .persistent import COLLECTIONS, is_constant
+from .types import (
+    Symbol, LispList, Procedure, RiplError,
+    QUOTE, QUASIQUOTE, UNQUOTES, IF, COND, SET, DEFINE, LAMBDAS, DEFN,
+    DEFMACRO, LET, BEGIN, EVAL, APPLY, LOOP, RECUR, ELSE, ASYNC_FN
+)
+
+
+# Builtins that are inlined as Python operators:
+#   name -> (operator, number of arguments or None to fold any number)
+# Folding matches the std_ops: see ripl.env.arithmetic
+OPERATORS = {
+    Symbol('+'): ('+', None),
+    Symbol('-'): ('-', None),
+    Symbol('*'): ('*', None),
+    Symbol('/'): ('/', None),
+    Symbol('%'): ('%', None),
+    Symbol('>'): ('>', 2),
+    Symbol('<'): ('<', 2),
+    Symbol('>='): ('>=', 2),
+    Symbol('<='): ('<=', 2),
+    Symbol('='): ('==', 2),
+    Symbol('!='): ('!=', 2),
+    Symbol('eq?'): ('is', 2),
+    Symbol('equal?'): ('==', 2),
+    Symbol('not'): ('not', 1),
+}
+
+# Special forms that only the interpretor handles
+UNSUPPORTED = frozenset([
+    QUASIQUOTE, DEFN, DEFMACRO, EVAL, APPLY, LOOP, RECUR, ASYNC_FN
+]) | UNQUOTES | LAMBDAS
+
+# Arguments to the generated factory that aren't bindings
+HELPERS = '_proc, _valid, _lookup, _test, _tail, _TailCall, _trampoline'
+
+# Where a value goes: see Transpiler.stmt
+RETURN = object()
+VALUE = object()
+
+
+class Unsupported(Exception):
+    '''A form that the JIT leaves to the interpretor'''
+
+
+def _test(val):
+    '''The `cond` rules for what counts as a match'''
+    if isinstance(val, bool):
+        return val
+    elif val is ELSE:
+        return True
+
+    raise RiplError(f'Invalid `cond` condition: {val}')
+
+
+def _tail(proc, *args):
+    '''A call in tail position to something unknown until run time'''
+    if isinstance(proc, Procedure):
+        return TailCall(proc, args)
+
+    return proc(*args)
+
+
+def walk_trampoline(result):
+    '''Run tail calls between procedures for the tree walker'''
+    while type(result) is TailCall:
+        proc = result.proc
+        code = proc._jit_code
+        if code is None or len(result.args) != len(proc._params):
+            # Not promoted, or the walker has an error to raise: the walker
+            # deals with its own tail calls
+            return proc(*result.args)
+
+        result = proc._jit_core(*result.args)
+
+    return result
+
+
+class Transpiler:
+    '''Translate the body of a single procedure into Python source'''
+    def __init__(self, jit, proc):
+        self.jit = jit
+        self.proc = proc
+        self.evaluator = proc._evaluator
+        self.global_env = self.evaluator.global_env
+        self.builtins = self.evaluator.builtins
+        self.lines = []
+        # Values handed in to the generated code, by name
+        self.bindings = {}
+        self._names = {}
+        # Globals whose meaning is baked in to the generated code
+        self.deps = set()
+        self.self_name = None
+        self.count = 0
+        self.loops = False
+        self.tail_calls = False
+
+    def fresh(self, prefix):
+        '''A new Python name'''
+        self.count += 1
+        return f'{prefix}{self.count}'
+
+    def emit(self, indent, line):
+        self.lines.append((indent, line))
+
+    def source(self, mode):
+        '''The source of a factory for the compiled procedure'''
+        params = list(self.proc._params)
+        if not all(isinstance(p, Symbol) for p in params):
+            raise Unsupported(params)
+        if len(set(params)) != len(params):
+            raise Unsupported(params)
+
+        args = [f'v{i}' for i in range(len(params))]
+        self.count = len(args)
+        scope = ChainMap(dict(zip(params, args)))
+        body = self.evaluator.expand_macros(self.proc._body)
+
+        self.stmt(body, scope, 3, RETURN)
+        sig = ', '.join(args)
+
+        if self.loops:
+            # Leave the loop if anything that we rely on has changed
+            name = self.const(self.self_name)
+            loop = [
+                (2, 'while True:'),
+                (3, 'if not _valid[0]:'),
+                (4, f'return _tail({", ".join([f"_lookup({name})", *args])})'),
+            ]
+            self.tail_calls = True
+        else:
+            loop = []
+            self.lines = [(i - 1, line) for i, line in self.lines]
+
+        trampolined = f'return _trampoline(_f({sig}))'
+        out = [
+            (0, f'def _make({", ".join([HELPERS, *self.bindings])}):'),
+            (1, f'def _f({sig}):'),
+            *loop,
+            *self.lines,
+        ]
+
+        if self.tail_calls:
+            out += [(1, f'def _rec({sig}):'), (2, trampolined)]
+        else:
+            out.append((1, '_rec = _f'))
+
+        if mode == 'closure':
+            frame = ', '.join(f'_frame[{i + 1}]' for i in range(len(args)))
+            out += [(1, 'def _entry(_frame):'), (2, f'return _f({frame})')]
+        elif self.tail_calls:
+            out += [(1, f'def _entry({sig}):'), (2, trampolined)]
+        else:
+            out.append((1, '_entry = _f'))
+
+        out.append((1, 'return _entry, _f'))
+        return ''.join(f'{"    " * i}{line}\n' for i, line in out)
+
+    def bind(self, prefix, key, value):
+        '''Hand a value in to the generated code'''
+        name = self._names.get(key)
+        if name is None:
+            name = self._names[key] = self.fresh(prefix)
+            self.bindings[name] = value
+        return name
+
+    def const(self, value):
+        '''A constant: written out if it is simple, else bound'''
+        if value is None or type(value) in (bool, int, str):
+            return repr(value)
+        elif type(value) is float and math.isfinite(value):
+            return repr(value)
+
+        return self.bind('k', ('k', id(value)), value)
+
+    def global_value(self, sym, scope):
+        '''The current value of a global name (None if it is local)'''
+        if sym in scope:
+            return None
+        return self.global_env.get(sym)
+
+    def symbol(self, sym, scope):
+        '''A reference to a name'''
+        name = scope.get(sym)
+        if name is not None:
+            return name
+
+        value = self.global_env.get(sym)
+        if value is None:
+            # Not defined yet so it has to be looked up when used
+            return f'_lookup({self.const(sym)})'
+
+        return self.bind('g', ('g', sym), self.jit.cell(sym)) + '[0]'
+
+    def simple(self, expr):
+        '''Can `expr` be written as a single Python expression?'''
+        if not (isinstance(expr, LispList) and expr):
+            return True
+
+        head = expr.car
+        if head is QUOTE:
+            return True
+        elif head in (LET, BEGIN, DEFINE, SET):
+            return False
+        elif head is COND:
+            return all(
+                isinstance(b, LispList) and all(map(self.simple, b))
+                for b in expr.cdr
+            )
+
+        return all(map(self.simple, expr))
+
+    def expr(self, expr, scope, indent):
+        '''
+        Python expression for the value of `expr`. Any statements that are
+        needed to compute it are emitted first.
+        '''
+        if isinstance(expr, Symbol):
+            return self.symbol(expr, scope)
+
+        elif isinstance(expr, COLLECTIONS) and not is_constant(expr):
+            raise Unsupported(expr)
+
+        elif not (isinstance(expr, LispList) and expr):
+            return self.const(expr)
+
+        elif not self.simple(expr):
+            temp = self.fresh('t')
+            self.stmt(expr, scope, indent, temp)
+            return temp
+
+        head = expr.car
+        if head is QUOTE:
+            return self.const(self._one(expr))
+
+        elif head is IF:
+            cond, true, false = self._if_parts(expr)
+            cond = self.expr(cond, scope, indent)
+            true = self.expr(true, scope, indent)
+            false = self.expr(false, scope, indent)
+            return f'({true} if {cond} else {false})'
+
+        elif head is COND:
+            out = 'None'
+            for cond, body in reversed(self._cond_parts(expr)):
+                body = self.expr(body, scope, indent)
+                if cond is ELSE:
+                    out = body
+                else:
+                    cond = self.expr(cond, scope, indent)
+                    out = f'({body} if _test({cond}) else {out})'
+            return out
+
+        return self.call(expr, scope, indent, VALUE)
+
+    def stmt(self, expr, scope, indent, target):
+        '''
+        Emit statements to evaluate `expr`. `target` is RETURN for tail
+        position, a variable name to assign the value to, or None if the
+        value isn't needed.
+        '''
+        if not (isinstance(expr, LispList) and expr):
+            return self.result(self.expr(expr, scope, indent), indent, target)
+
+        head = expr.car
+        if head is IF:
+            cond, true, false = self._if_parts(expr)
+            self.emit(indent, f'if {self.expr(cond, scope, indent)}:')
+            self.stmt(true, scope.new_child(), indent + 1, target)
+            self.emit(indent, 'else:')
+            self.stmt(false, scope.new_child(), indent + 1, target)
+
+        elif head is COND:
+            # Each test is only run if the ones before it failed
+            for cond, body in self._cond_parts(expr):
+                if cond is ELSE:
+                    return self.stmt(body, scope.new_child(), indent, target)
+
+                test = self.expr(cond, scope, indent)
+                self.emit(indent, f'if _test({test}):')
+                self.stmt(body, scope.new_child(), indent + 1, target)
+                self.emit(indent, 'else:')
+                indent += 1
+                scope = scope.new_child()
+
+            self.result('None', indent, target)
+
+        elif head is LET:
+            bindings, body = self._let_parts(expr)
+            inner = scope.new_child()
+            for name, val in bindings:
+                var = self.fresh('v')
+                self.emit(indent, f'{var} = {self.expr(val, scope, indent)}')
+                inner[name] = var
+            self.stmt(body, inner, indent, target)
+
+        elif head is BEGIN:
+            forms = list(expr.cdr)
+            if not forms:
+                raise Unsupported(expr)
+            for form in forms[:-1]:
+                self.stmt(form, scope, indent, None)
+            self.stmt(forms[-1], scope, indent, target)
+
+        elif head is DEFINE:
+            sym, value = self._two(expr)
+            can_define = self.evaluator.can_define
+            if sym in scope or not can_define(sym, self.global_env.get(sym)):
+                # Leave the interpretor to complain about this
+                raise Unsupported(expr)
+            value = self.expr(value, scope, indent)
+            var = self.fresh('v')
+            self.emit(indent, f'{var} = {value}')
+            scope.maps[0][sym] = var
+            self.result('None', indent, target)
+
+        elif head is SET:
+            sym, value = self._two(expr)
+            # Only the innermost names behave the same in both modes
+            if sym not in scope.maps[0]:
+                raise Unsupported(expr)
+            value = self.expr(value, scope, indent)
+            self.emit(indent, f'{scope[sym]} = {value}')
+            self.result('None', indent, target)
+
+        elif head is QUOTE:
+            self.result(self.const(self._one(expr)), indent, target)
+
+        else:
+            self.call(expr, scope, indent, target)
+
+    def result(self, value, indent, target):
+        '''Do whatever is needed with a computed value'''
+        if target is VALUE:
+            return value
+        elif target is RETURN:
+            self.emit(indent, f'return {value}')
+        elif target is not None:
+            self.emit(indent, f'{target} = {value}')
+        elif not value.isidentifier() and value != 'None':
+            self.emit(indent, value)
+
+    def operands(self, exprs, scope, indent):
+        '''
+        Python expressions for a list of arguments. If any of them needs
+        statements then they are all computed in order ahead of time.
+        '''
+        if all(map(self.simple, exprs)):
+            return [self.expr(e, scope, indent) for e in exprs]
+
+        temps = []
+        for e in exprs:
+            temp = self.fresh('t')
+            self.stmt(e, scope, indent, temp)
+            temps.append(temp)
+        return temps
+
+    def call(self, expr, scope, indent, target):
+        '''A procedure call (or an inlined operator)'''
+        head, *args = expr
+
+        if isinstance(head, Symbol):
+            if head in UNSUPPORTED:
+                raise Unsupported(head)
+
+            value = self.global_value(head, scope)
+
+            if value is self.proc:
+                return self.self_call(head, args, scope, indent, target)
+
+            if value is not None and value is self.builtins.get(head):
+                op = OPERATORS.get(head)
+                if op is not None and op[1] in (None, len(args)) and args:
+                    self.deps.add(head)
+                    vals = self.operands(args, scope, indent)
+                    return self.result(
+                        self.operator(op[0], vals), indent, target)
+
+        proc, *vals = self.operands([head, *args], scope, indent)
+        call_args = ', '.join(vals)
+
+        if target is RETURN:
+            # Procedures are handed back to the trampoline
+            self.tail_calls = True
+            call = f'_tail({", ".join([proc, *vals])})'
+        else:
+            call = f'{proc}({call_args})'
+
+        return self.result(call, indent, target)
+
+    def self_call(self, head, args, scope, indent, target):
+        '''A recursive call: a loop if it is in tail position'''
+        nparams = len(self.proc._params)
+        if len(args) != nparams:
+            raise Unsupported(head)
+
+        self.deps.add(head)
+        if self.self_name is None:
+            self.self_name = head
+        vals = ', '.join(self.operands(args, scope, indent))
+        params = [f'v{i}' for i in range(nparams)]
+
+        if target is not RETURN:
+            name = self.const(head)
+            return self.result(
+                f'(_rec({vals}) if _valid[0] else _lookup({name})({vals}))',
+                indent, target)
+
+        self.loops = True
+        if params:
+            self.emit(indent, f'{", ".join(params)} = {vals}')
+        self.emit(indent, 'continue')
+
+    @staticmethod
+    def operator(op, vals):
+        if op == 'not':
+            return f'(not {vals[0]})'
+
+        if len(vals) == 1:
+            # (- a) negates and (/ a) is the reciprocal
+            if op == '-':
+                return f'(-{vals[0]})'
+            elif op == '/':
+                return f'(1 / {vals[0]})'
+
+        out = vals[0]
+        for val in vals[1:]:
+            out = f'({out} {op} {val})'
+        return out
+
+    @staticmethod
+    def _one(expr):
+        if len(expr) != 2:
+            raise Unsupported(expr)
+        return expr[1]
+
+    @staticmethod
+    def _two(expr):
+        if len(expr) != 3 or not isinstance(expr[1], Symbol):
+            raise Unsupported(expr)
+        return expr[1], expr[2]
+
+    @staticmethod
+    def _if_parts(expr):
+        if len(expr) == 3:
+            return expr[1], expr[2], None
+        elif len(expr) == 4:
+            return expr[1], expr[2], expr[3]
+        raise Unsupported(expr)
+
+    @staticmethod
+    def _cond_parts(expr):
+        branches = list(expr.cdr)
+        for branch in branches:
+            if not (isinstance(branch, LispList) and len(branch) == 2):
+                raise Unsupported(expr)
+        return [(b[0], b[1]) for b in branches]
+
+    @staticmethod
+    def _let_parts(expr):
+        if len(expr) != 3:
+            raise Unsupported(expr)
+        bindings = []
+        for binding in expr[1]:
+            if not (isinstance(binding, (LispList, list)) and
+                    len(binding) == 2 and isinstance(binding[0], Symbol)):
+                raise Unsupported(expr)
+            bindings.append((binding[0], binding[1]))
+        if not bindings:
+            raise Unsupported(expr)
+        return bindings, expr[2]
+
+
+class JIT:
+    '''
+    Count calls to procedures and promote the hot ones to Python code.
+    `cache_dir` is where to keep compiled code between runs, if anywhere.
+    '''
+    threshold = 100
+    # Compiled code shared by every JIT: generated source -> code object
+    _code_cache = {}
+
+    def __init__(self, evaluator, threshold=None, cache_dir=None):
+        self.evaluator = evaluator
+        if threshold is not None:
+            self.threshold = threshold
+        self.cache_dir = cache_dir
+        # Global name -> [(procedure, valid flag)] for promoted procedures
+        self._deps = {}
+        # Global name -> [current value] for generated code to read
+        self._cells = {}
+
+        if evaluator.mode == 'closure':
+            self._trampoline = trampoline
+        else:
+            self._trampoline = walk_trampoline
+
+    def clone(self, evaluator):
+        '''A JIT with the same settings for a cloned Evaluator'''
+        return JIT(evaluator, self.threshold, self.cache_dir)
+
+    def reset(self):
+        '''Forget about every procedure that has been promoted'''
+        self._deps = {}
+        self._cells = {}
+
+    def cell(self, sym):
+        '''The cell that generated code reads a global name from'''
+        cell = self._cells.get(sym)
+        if cell is None:
+            cell = self._cells[sym] = [self.evaluator.global_env.get(sym)]
+        return cell
+
+    def eligible(self, proc):
+        '''Only top level procedures with fixed arguments are promoted'''
+        if not isinstance(proc._params, (LispList, list)):
+            return False
+
+        if self.evaluator.mode == 'cek':
+            # Compiled code recurses on the Python stack: the machine doesn't
+            return False
+
+        if self.evaluator.mode == 'closure':
+            return proc._outer_env is None
+
+        return proc._outer_env is self.evaluator.global_env
+
+    def entry(self, proc):
+        '''
+        Count a call to a tree walking Procedure: returns the compiled
+        version of it if there is one.
+        '''
+        code = proc._jit_code
+        if code is None:
+            proc._jit_calls += 1
+            if proc._jit_calls == self.threshold:
+                code = self.promote(proc)
+        return code
+
+    def watch(self, proc, code):
+        '''
+        Count the calls made to a CompiledProcedure by wrapping its code.
+        Returns what should be used as the code for the procedure.
+        '''
+        proc._tier1 = code
+        if not self.eligible(proc):
+            return code
+
+        calls = 0
+        threshold = self.threshold
+
+        def count(frame):
+            nonlocal calls
+            calls += 1
+            if calls == threshold:
+                proc._code = self.promote(proc) or code
+            return proc._code(frame)
+
+        return count
+
+    def promote(self, proc):
+        '''
+        Compile a procedure to Python and install it.
+        Returns the new entry point or None if it can't be compiled.
+        '''
+        if not self.eligible(proc):
+            return None
+
+        # Under the lock so that invalidating a global can't slip in
+        # between the code reading it and recording that it depends on it
+        with self.evaluator.lock:
+            return self._promote(proc)
+
+    def _promote(self, proc):
+        mode = self.evaluator.mode
+        transpiler = Transpiler(self, proc)
+        try:
+            source = transpiler.source(mode)
+        except (Unsupported, RecursionError):
+            return None
+
+        valid = [True]
+        make = self._factory(source)
+        entry, core = make(
+            proc, valid, self._lookup, _test, _tail, TailCall,
+            self._trampoline, *transpiler.bindings.values())
+
+        for sym in transpiler.deps:
+            self._deps.setdefault(sym, []).append((proc, valid))
+
+        if mode == 'closure':
+            proc._code = entry
+        else:
+            proc._jit_code = entry
+            proc._jit_core = core
+
+        return entry
+
+    def invalidate(self, sym):
+        '''
+        A global has a new value: update its cell and demote everything
+        that relied on the old one.
+        '''
+        with self.evaluator.lock:
+            self._invalidate(sym)
+
+    def _invalidate(self, sym):
+        cell = self._cells.get(sym)
+        if cell is not None:
+            cell[0] = self.evaluator.global_env.get(sym)
+
+        for proc, valid in self._deps.pop(sym, ()):
+            if not valid[0]:
+                continue
+
+            valid[0] = False
+            if self.evaluator.mode == 'closure':
+                proc._code = self.watch(proc, proc._tier1)
+            else:
+                proc._jit_code = proc._jit_core = None
+                proc._jit_calls = 0
+
+    def _lookup(self, sym):
+        '''Globals that weren't defined when the procedure was promoted'''
+        val = self.evaluator.global_env.get(sym)
+        if val is None:
+            raise RiplError(f'Unknown symbol: `{sym}`')
+        return val
+
+    def _factory(self, source):
+        '''Run the generated source and return the factory that it defines'''
+        code = self._code_cache.get(source)
+        if code is None:
+            code = self._load(source)
+            if code is None:
+                code = compile(source, '<ripl-jit>', 'exec')
+                self._store(source, code)
+            self._code_cache[source] = code
+
+        namespace = {}
+        exec(code, namespace)
+        return namespace['_make']
+
+    def _path(self, source):
+        digest = hashlib.sha256(f'{__version__}\0{source}'.encode())
+        tag = sys.implementation.cache_tag
+        return os.path.join(
+            self.cache_dir, f'jit-{digest.hexdigest()[:32]}.{tag}')
+
+    def _load(self, source):
+        if self.cache_dir is None or not is_private(self.cache_dir):
+            return None
+
+        try:
+            with open(self._path(source), 'rb') as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _store(self, source, code):
+        '''Failing to write the cache is never an error'''
+        if self.cache_dir is None:
+            return
+
+        if not make_private_dir(self.cache_dir):
+            return
+
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(code, f)
+            os.replace(tmp, self._path(source))
+        except OSError:
+            pass
@@ -0,0 +1,380 @@
+'''
+Run procedures across a pool of worker processes: pmap, preduce and pcall.
+
+Each worker is a full interpretor booted once from an image of the parent
+(see ripl.image) so it already has the prelude, the macros and every
+global that existed when the pool was started. Work is then sent to it as
+pickles that are kept as small as possible:
+
+  - A procedure is sent as its parameters and body along with the values
+    of only those variables that it closes over and actually uses. Names
+    that it looks up in the global environment are sent as names and
+    resolved by the worker.
+  - Globals that have been defined or rebound since the pool started are
+    sent by value with the work that uses them (directly or through other
+    procedures) and installed in the worker before it runs.
+  - Elements are grouped into a few batches per worker rather than being
+    sent one at a time so that the cost of a round trip is shared.
+
+Nothing is shared: anything that a procedure changes with `set!` or
+`define` in a worker stays in that worker.
+'''
+import io
+import os
+import atexit
+import tempfile
+from itertools import chain
+from collections import ChainMap
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+from .types import (
+    Symbol, LispList, LazySeq, Procedure, RiplError
+)
+from .compile import CompiledProcedure, Scope, _scan_defines
+from .persistent import PersistentVector
+from .seq import reduce
+from . import image
+
+
+# The interpretor running in this process if it is a worker
+_worker = None
+# Contexts that this worker has already unpickled: pickle -> procedure
+_contexts = {}
+# Marks the end of the globals that follow the value in a pickle
+_END = 'END'
+
+
+def _symbols(body):
+    '''Every Symbol that appears anywhere in a body'''
+    found, stack = set(), [body]
+    while stack:
+        expr = stack.pop()
+        if isinstance(expr, Symbol):
+            found.add(expr)
+        elif isinstance(expr, (LispList, PersistentVector, list, tuple)):
+            stack.extend(expr)
+
+    return found
+
+
+def _frames(proc):
+    '''The local frames that a procedure closed over, innermost first'''
+    env = proc._outer_env
+
+    if isinstance(proc, CompiledProcedure):
+        scope = proc._scope.parent
+        while scope.parent is not None:
+            yield dict(zip(scope.names, env[1:]))
+            env, scope = env[0], scope.parent
+        return
+
+    nglobal = len(proc._evaluator.global_env.maps)
+    yield from env.maps[:len(env.maps) - nglobal]
+
+
+def free_variables(proc):
+    '''
+    Split the names that a procedure uses into the values it has closed
+    over and the names that it will look up in the global environment.
+    '''
+    params = proc._params
+    names = _symbols(proc._body)
+    names -= {params} if isinstance(params, Symbol) else set(params)
+
+    captured = {}
+    for frame in _frames(proc):
+        for name in names.intersection(frame):
+            captured.setdefault(name, frame[name])
+
+    return captured, names.difference(captured)
+
+
+def _new(cls):
+    return cls.__new__(cls)
+
+
+def _restore(proc, state):
+    '''Rebuild a procedure around the Evaluator that unpickled it'''
+    evaluator, params, doc, body, captured = state
+
+    if not isinstance(proc, CompiledProcedure):
+        env = evaluator.global_env
+        if captured:
+            env = env.new_child(captured)
+        Procedure.__init__(proc, params, doc, body, env, evaluator)
+        return
+
+    # The captured values become a single Frame between the procedure
+    # and the global environment
+    scope, frame = Scope(global_env=evaluator.global_env), None
+    if captured:
+        scope = Scope(captured, scope)
+        frame = [None, *captured.values()]
+
+    inner = Scope([params] if isinstance(params, Symbol) else params, scope)
+    for name in _scan_defines(body):
+        inner.add(name)
+
+    code = evaluator.compiler.compile(body, inner, tail=True)
+    CompiledProcedure.__init__(
+        proc, params, doc, body, frame, evaluator, code, inner)
+
+
+class ClosurePickler(image.ImagePickler):
+    '''
+    Pickle procedures as just what they need to run somewhere else,
+    noting the global names that they use.
+    '''
+    def __init__(self, file, evaluator):
+        super().__init__(file, evaluator)
+        self.evaluator = evaluator
+        self.globals = set()
+
+    def reducer_override(self, obj):
+        if not isinstance(obj, Procedure):
+            return NotImplemented
+
+        captured, names = free_variables(obj)
+        self.globals |= names
+        state = (
+            self.evaluator, obj._params, obj.__doc__, obj._body, captured)
+        # Restoring through state means that procedures which refer to
+        # each other come back as the same objects
+        return _new, (type(obj),), state, None, None, _restore
+
+
+def dumps(evaluator, obj, snapshot=None):
+    '''
+    Pickle `obj` for another interpretor. Given a `snapshot` of the
+    globals that it already has, any of them that `obj` needs and that
+    have changed since are sent as well.
+    '''
+    buf = io.BytesIO()
+    pickler = ClosurePickler(buf, evaluator)
+    pickler.dump(obj)
+
+    if snapshot is not None:
+        defs = ChainMap(*evaluator.global_env.maps[:-1])
+        sent, missing = set(), object()
+
+        while pickler.globals - sent:
+            names = pickler.globals - sent
+            sent |= names
+            changed = {
+                name: defs[name] for name in names
+                if name in defs and
+                defs[name] is not snapshot.get(name, missing)
+            }
+            if changed:
+                # Dumped into the same stream so that anything already
+                # sent is referred to rather than copied
+                pickler.dump(changed)
+
+    pickler.dump(_END)
+    return buf.getvalue()
+
+
+def loads(evaluator, data):
+    '''Unpickle what `dumps` made, defining any globals sent with it'''
+    unpickler = image.ImageUnpickler(io.BytesIO(data), evaluator)
+    obj = unpickler.load()
+
+    env = evaluator.global_env
+    changed = unpickler.load()
+    while changed != _END:
+        for name, val in changed.items():
+            env[name] = val
+            evaluator.rebound(name)
+        changed = unpickler.load()
+
+    return obj
+
+
+def _boot(fname, jit):
+    '''Start a worker from the parent's image'''
+    global _worker
+    from .interpretor import Interpretor
+    _worker = Interpretor(image=fname, cache=False, jit=jit)
+
+
+def _ping():
+    return os.getpid()
+
+
+def _context(data):
+    '''The procedure to run, reusing it if this worker has seen it'''
+    try:
+        return _contexts[data]
+    except KeyError:
+        pass
+
+    if len(_contexts) > 16:
+        _contexts.clear()
+
+    f = _contexts[data] = loads(_worker.evaluator, data)
+    return f
+
+
+def _run(kind, ctx, batch):
+    '''Run one batch of work in a worker, returning the pickled results'''
+    evaluator = _worker.evaluator
+    f = _context(ctx)
+    items = loads(evaluator, batch)
+
+    try:
+        if kind == 'map':
+            result = [f(*args) for args in items]
+        elif kind == 'reduce':
+            result = reduce(f, items)
+        else:
+            result = [thunk() for thunk in items]
+    except RiplError:
+        raise
+    except Exception as e:
+        # The original may not survive the trip back to the parent
+        raise RiplError(f'{type(e).__name__}: {e}') from None
+
+    return dumps(evaluator, result)
+
+
+def _batches(items, n):
+    '''Split items into at most n lists of nearly equal size'''
+    size = max(1, -(-len(items) // n))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class WorkerPool:
+    '''
+    A pool of worker processes for an Evaluator, started the first time
+    that it is used. `size` defaults to the number of CPUs.
+    '''
+    # Batches made per worker: enough that a slow batch doesn't leave
+    # the other workers idle at the end
+    batches_per_worker = 4
+
+    def __init__(self, evaluator, size=None):
+        self.evaluator = evaluator
+        self.size = size or os.cpu_count() or 1
+        self._executor = None
+        self._snapshot = None
+
+    def start(self):
+        '''Boot the workers from an image of the Evaluator as it is now'''
+        if self._executor is not None:
+            return
+
+        evaluator = self.evaluator
+        fd, fname = tempfile.mkstemp(suffix='.rpli')
+        os.close(fd)
+
+        try:
+            skipped = image.save(evaluator, fname)
+            self._snapshot = {
+                name: val for name, val in
+                image._definitions(evaluator).items()
+                if name not in skipped
+            }
+
+            jit = evaluator.jit.threshold if evaluator.jit else None
+            # Workers are spawned rather than forked so that threads in
+            # the parent can't leave them holding a lock
+            self._executor = ProcessPoolExecutor(
+                self.size, mp_context=get_context('spawn'),
+                initializer=_boot, initargs=(fname, jit))
+            atexit.register(self.shutdown)
+
+            # Wait for every worker to boot while the image is still there
+            pings = [self._executor.submit(_ping) for _ in range(self.size)]
+            for ping in pings:
+                ping.result()
+        finally:
+            os.remove(fname)
+
+    def shutdown(self):
+        '''Stop the workers'''
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def _submit(self, kind, evaluator, f, batches):
+        '''Send each batch off to be run, returning the futures'''
+        self.start()
+        ctx = dumps(evaluator, f, self._snapshot)
+        return [
+            self._executor.submit(
+                _run, kind, ctx, dumps(evaluator, batch, self._snapshot))
+            for batch in batches
+        ]
+
+    def _evaluator_for(self, f):
+        '''Clones share the pool: pickle against the one `f` came from'''
+        return getattr(f, '_evaluator', self.evaluator)
+
+    def pmap(self, f, *colls):
+        '''
+        (pmap f coll ...) is (map f coll ...) with the calls spread over
+        the workers. It returns a lazy seq straight away: using an element
+        waits for the batch that it is in.
+        '''
+        if _worker is not None:
+            # Already in a worker: don't start a pool from each one
+            return LazySeq.from_iter(map(f, *colls))
+
+        items = list(zip(*colls))
+        evaluator = self._evaluator_for(f)
+        futures = self._submit(
+            'map', evaluator, f,
+            _batches(items, self.size * self.batches_per_worker))
+
+        def results():
+            for future in futures:
+                yield from loads(evaluator, future.result())
+
+        return LazySeq.from_iter(results())
+
+    def preduce(self, f, *args):
+        '''
+        (preduce f coll) or (preduce f init coll): reduce in parallel.
+        Each worker reduces a run of coll and then the results are reduced
+        in order, starting from init if it was given, so f must be
+        associative: (f (f a b) c) must equal (f a (f b c)).
+        '''
+        *init, coll = args
+        if _worker is not None:
+            return reduce(f, *args)
+
+        items = list(coll)
+        if not items:
+            return reduce(f, *args)
+
+        evaluator = self._evaluator_for(f)
+        futures = self._submit(
+            'reduce', evaluator, f,
+            _batches(items, self.size * self.batches_per_worker))
+
+        partials = [loads(evaluator, fut.result()) for fut in futures]
+        return reduce(f, *init, partials)
+
+    def pcall(self, *thunks):
+        '''
+        (pcall f g ...) calls each of the procedures with no arguments at
+        the same time, returning a list of their results.
+        '''
+        if _worker is not None or not thunks:
+            return LispList([thunk() for thunk in thunks])
+
+        evaluator = self._evaluator_for(thunks[0])
+        futures = self._submit(
+            'call', evaluator, None, _batches(list(thunks), self.size))
+
+        return LispList(chain.from_iterable(
+            loads(evaluator, fut.result()) for fut in futures))
+
+    def builtins(self):
+        '''The procedures to bind in to the global environment'''
+        return {
+            Symbol('pmap'): self.pmap,
+            Symbol('preduce'): self.preduce,
+            Symbol('pcall'): self.pcall,
+        }
@@ -0,0 +1,833 @@
+'''
+Persistent vectors and hash maps for [...] and {...} literals.
+
+Both are tries with a branching factor of 32 in the style of Clojure's
+collections: an update copies the path from the root down to the change
+(at most log32(n) small arrays) and shares everything else with the old
+version, so assoc, conj, get and dissoc are all O(log32 n).
+
+    PersistentVector :: a bit-partitioned trie of the elements by index
+                        with the last (up to) 32 elements held in a tail
+    PersistentMap    :: a hash array mapped trie (HAMT) keyed on 5 bits
+                        of the key's hash at each level
+
+Calling `transient` on either gives a mutable version to build up a large
+collection with: nodes that the transient has made for itself are updated
+in place rather than copied. `persistent` then hands back an immutable
+collection in O(1) and the transient can't be used again.
+'''
+from collections.abc import Mapping, Sequence
+
+from .types import Symbol, LispList, RiplError
+
+
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+# Python hashes are 64 bits: keys whose hashes match in all of them go
+# in a collision node
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+
+def _hash(key):
+    return hash(key) & HASH_MASK
+
+
+def _editable(node, edit):
+    return edit is not None and node.edit is edit
+
+
+class _Node:
+    '''An interior or leaf node of a vector trie'''
+    __slots__ = ('edit', 'array')
+
+    def __init__(self, edit, array):
+        self.edit = edit
+        self.array = array
+
+
+_EMPTY_NODE = _Node(None, [])
+
+
+class PersistentVector:
+    '''
+    An immutable vector.
+
+    `count` elements are split between the trie under `root` (a multiple
+    of 32 of them, `shift` bits of index per level above the leaves) and
+    `tail`, a list of the last 1-32 which appending only needs to copy.
+    '''
+    __slots__ = ('_count', '_shift', '_root', '_tail', '_hash')
+
+    EMPTY = None
+
+    def __new__(cls, items=()):
+        if isinstance(items, PersistentVector):
+            return items
+
+        vec = TransientVector(cls.EMPTY)
+        for item in items:
+            vec.conj(item)
+        return vec.persistent()
+
+    @classmethod
+    def _make(cls, count, shift, root, tail):
+        vec = object.__new__(cls)
+        vec._count = count
+        vec._shift = shift
+        vec._root = root
+        vec._tail = tail
+        vec._hash = None
+        return vec
+
+    def _tail_offset(self):
+        return 0 if self._count < WIDTH else (self._count - 1) & ~MASK
+
+    def _leaf(self, i):
+        '''The array holding index i'''
+        if i >= self._tail_offset():
+            return self._tail
+
+        node = self._root
+        for level in range(self._shift, 0, -BITS):
+            node = node.array[(i >> level) & MASK]
+        return node.array
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PersistentVector(
+                self._leaf(i)[i & MASK]
+                for i in range(*index.indices(self._count)))
+
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('PersistentVector index out of range')
+
+        return self._leaf(index)[index & MASK]
+
+    def get(self, index, default=None):
+        if type(index) is int and 0 <= index < self._count:
+            return self._leaf(index)[index & MASK]
+        return default
+
+    def __iter__(self):
+        tail_offset = self._tail_offset()
+        for i in range(0, tail_offset, WIDTH):
+            yield from self._leaf(i)
+        yield from self._tail
+
+    def __reversed__(self):
+        for i in range(self._count - 1, -1, -1):
+            yield self[i]
+
+    def conj(self, val):
+        '''A new vector with `val` on the end'''
+        return TransientVector(self, owned=False).conj(val)._frozen()
+
+    def assoc(self, index, val):
+        '''A new vector with the element at `index` replaced by `val`'''
+        return TransientVector(self, owned=False).assoc(index, val)._frozen()
+
+    def pop(self):
+        '''A new vector without the last element'''
+        return TransientVector(self, owned=False).pop()._frozen()
+
+    def transient(self):
+        return TransientVector(self)
+
+    def __add__(self, other):
+        if not isinstance(other, (PersistentVector, list, tuple)):
+            return NotImplemented
+
+        vec = TransientVector(self)
+        for item in other:
+            vec.conj(item)
+        return vec.persistent()
+
+    def __radd__(self, other):
+        # The result takes the type of whatever is on the left
+        return other + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, list):
+            other = PersistentVector(other)
+        elif not isinstance(other, PersistentVector):
+            return NotImplemented
+
+        if self is other:
+            return True
+        return self._count == other._count and all(
+            a is b or a == b for a, b in zip(self, other))
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(tuple(self))
+        return self._hash
+
+    def __reduce__(self):
+        return (PersistentVector, (list(self),))
+
+    def __repr__(self):
+        return f'[{" ".join(map(repr, self))}]'
+
+
+class TransientVector:
+    '''
+    A mutable vector built from a PersistentVector, sharing its nodes until
+    they are changed. Changes are made in place to nodes that this transient
+    has already copied: the `edit` token marks which ones those are.
+    '''
+    __slots__ = ('_count', '_shift', '_root', '_tail', '_edit')
+
+    def __init__(self, vec, owned=True):
+        self._count = vec._count
+        self._shift = vec._shift
+        self._root = vec._root
+        self._tail = list(vec._tail)
+        # One off updates of a persistent vector don't need to own nodes
+        self._edit = object() if owned else None
+
+    def _check(self):
+        if self._edit is False:
+            raise RiplError('Transient used after persistent! was called')
+
+    def _editable(self, node):
+        '''`node` or a copy of it that this transient can change'''
+        if _editable(node, self._edit):
+            return node
+        return _Node(self._edit, list(node.array))
+
+    def _tail_offset(self):
+        return 0 if self._count < WIDTH else (self._count - 1) & ~MASK
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        self._check()
+        return PersistentVector.__getitem__(self, index)
+
+    _leaf = PersistentVector._leaf
+
+    def conj(self, val):
+        self._check()
+        count = self._count
+
+        if count - self._tail_offset() < WIDTH:
+            self._tail.append(val)
+            self._count += 1
+            return self
+
+        # The tail is full: push it down into the trie
+        leaf = _Node(self._edit, self._tail)
+        self._tail = [val]
+        shift = self._shift
+
+        if (count >> BITS) > (1 << shift):
+            # No room left under the root: add a level above it
+            branch = _path(self._edit, shift, leaf)
+            root = _Node(self._edit, [self._root, branch])
+            shift += BITS
+        else:
+            root = self._push_tail(shift, self._root, leaf)
+
+        self._root = root
+        self._shift = shift
+        self._count += 1
+        return self
+
+    def _push_tail(self, level, parent, leaf):
+        node = self._editable(parent)
+        index = ((self._count - 1) >> level) & MASK
+
+        if level == BITS:
+            child = leaf
+        elif index < len(node.array):
+            child = self._push_tail(level - BITS, node.array[index], leaf)
+        else:
+            child = _path(self._edit, level - BITS, leaf)
+
+        if index < len(node.array):
+            node.array[index] = child
+        else:
+            node.array.append(child)
+        return node
+
+    def assoc(self, index, val):
+        self._check()
+        if index < 0:
+            index += self._count
+
+        if index == self._count:
+            return self.conj(val)
+        elif not 0 <= index < self._count:
+            raise IndexError('PersistentVector index out of range')
+
+        if index >= self._tail_offset():
+            self._tail[index & MASK] = val
+            return self
+
+        self._root = node = self._editable(self._root)
+        for level in range(self._shift, 0, -BITS):
+            i = (index >> level) & MASK
+            node.array[i] = child = self._editable(node.array[i])
+            node = child
+        node.array[index & MASK] = val
+        return self
+
+    def pop(self):
+        self._check()
+        if not self._count:
+            raise IndexError('pop from an empty PersistentVector')
+
+        if self._count == 1 or len(self._tail) > 1:
+            self._tail.pop()
+            self._count -= 1
+            return self
+
+        # The tail is about to be empty: take the last leaf out of the trie
+        self._tail = list(self._leaf(self._count - 2))
+        root = self._pop_tail(self._shift, self._root)
+        shift = self._shift
+
+        if root is None:
+            root = _EMPTY_NODE
+        if shift > BITS and len(root.array) == 1:
+            root = root.array[0]
+            shift -= BITS
+
+        self._root = root
+        self._shift = shift
+        self._count -= 1
+        return self
+
+    def _pop_tail(self, level, node):
+        index = ((self._count - 2) >> level) & MASK
+
+        if level > BITS:
+            child = self._pop_tail(level - BITS, node.array[index])
+            if child is None and index == 0:
+                return None
+            node = self._editable(node)
+            if child is None:
+                del node.array[index]
+            else:
+                node.array[index] = child
+            return node
+
+        if index == 0:
+            return None
+        node = self._editable(node)
+        del node.array[index]
+        return node
+
+    def _frozen(self):
+        return PersistentVector._make(
+            self._count, self._shift, self._root, self._tail)
+
+    def persistent(self):
+        '''The finished vector: this transient can't be used after this'''
+        self._check()
+        self._edit = False
+        return self._frozen()
+
+
+def _path(edit, level, node):
+    '''A new branch down to `node` at the given level'''
+    while level:
+        node = _Node(edit, [node])
+        level -= BITS
+    return node
+
+
+PersistentVector.EMPTY = PersistentVector._make(0, BITS, _EMPTY_NODE, [])
+
+
+# Marks an entry in a map node that is a child node rather than a key
+_CHILD = object()
+# Marks a key that isn't in a map
+_MISSING = object()
+
+
+class _MapNode:
+    '''
+    A node in a HAMT: `bitmap` has a bit set for each of the 32 slots that
+    is in use and `array` holds a (key, value) pair for each of those in
+    order. A slot whose key is _CHILD has a node as its value instead.
+    '''
+    __slots__ = ('edit', 'bitmap', 'array')
+
+    def __init__(self, edit, bitmap, array):
+        self.edit = edit
+        self.bitmap = bitmap
+        self.array = array
+
+    def find(self, shift, h, key, default):
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit:
+            return default
+
+        i = 2 * (self.bitmap & (bit - 1)).bit_count()
+        k, v = self.array[i], self.array[i + 1]
+        if k is _CHILD:
+            return v.find(shift + BITS, h, key, default)
+        elif k is key or k == key:
+            return v
+        return default
+
+    def _set(self, edit, i, val):
+        node = self if _editable(self, edit) else _MapNode(
+            edit, self.bitmap, list(self.array))
+        node.array[i] = val
+        return node
+
+    def assoc(self, edit, shift, h, key, val, added):
+        bit = 1 << ((h >> shift) & MASK)
+        i = 2 * (self.bitmap & (bit - 1)).bit_count()
+
+        if not self.bitmap & bit:
+            added.append(key)
+            if _editable(self, edit):
+                self.array[i:i] = (key, val)
+                self.bitmap |= bit
+                return self
+            array = self.array[:i] + [key, val] + self.array[i:]
+            return _MapNode(edit, self.bitmap | bit, array)
+
+        k, v = self.array[i], self.array[i + 1]
+        if k is _CHILD:
+            child = v.assoc(edit, shift + BITS, h, key, val, added)
+            return self if child is v else self._set(edit, i + 1, child)
+
+        elif k is key or k == key:
+            return self if v is val else self._set(edit, i + 1, val)
+
+        # Two keys in the same slot: move them both down a level
+        added.append(key)
+        child = _pair(edit, shift + BITS, _hash(k), k, v, h, key, val)
+        node = self._set(edit, i + 1, child)
+        node.array[i] = _CHILD
+        return node
+
+    def without(self, edit, shift, h, key):
+        '''This node without `key`: None if that leaves it empty'''
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit:
+            return self
+
+        i = 2 * (self.bitmap & (bit - 1)).bit_count()
+        k, v = self.array[i], self.array[i + 1]
+        if k is _CHILD:
+            child = v.without(edit, shift + BITS, h, key)
+            if child is v:
+                return self
+            elif child is not None:
+                return self._set(edit, i + 1, child)
+        elif not (k is key or k == key):
+            return self
+
+        if self.bitmap == bit:
+            return None
+        if _editable(self, edit):
+            del self.array[i:i + 2]
+            self.bitmap ^= bit
+            return self
+        return _MapNode(
+            edit, self.bitmap ^ bit, self.array[:i] + self.array[i + 2:])
+
+    def items(self):
+        array = self.array
+        for i in range(0, len(array), 2):
+            if array[i] is _CHILD:
+                yield from array[i + 1].items()
+            else:
+                yield array[i], array[i + 1]
+
+
+class _CollisionNode:
+    '''The (key, value) pairs of keys whose hashes are all `h`'''
+    __slots__ = ('edit', 'h', 'array')
+
+    def __init__(self, edit, h, array):
+        self.edit = edit
+        self.h = h
+        self.array = array
+
+    def _index(self, key):
+        array = self.array
+        for i in range(0, len(array), 2):
+            if array[i] is key or array[i] == key:
+                return i
+        return -1
+
+    def find(self, shift, h, key, default):
+        i = self._index(key)
+        return default if i < 0 else self.array[i + 1]
+
+    def assoc(self, edit, shift, h, key, val, added):
+        if h != self.h:
+            # Not a collision after all: nest this node a level down
+            bit = 1 << ((self.h >> shift) & MASK)
+            node = _MapNode(edit, bit, [_CHILD, self])
+            return node.assoc(edit, shift, h, key, val, added)
+
+        i = self._index(key)
+        if i >= 0 and self.array[i + 1] is val:
+            return self
+
+        node = self if _editable(self, edit) else _CollisionNode(
+            edit, self.h, list(self.array))
+        if i >= 0:
+            node.array[i + 1] = val
+        else:
+            added.append(key)
+            node.array += (key, val)
+        return node
+
+    def without(self, edit, shift, h, key):
+        i = self._index(key)
+        if i < 0:
+            return self
+        elif len(self.array) == 2:
+            return None
+        return _CollisionNode(
+            edit, self.h, self.array[:i] + self.array[i + 2:])
+
+    def items(self):
+        array = self.array
+        for i in range(0, len(array), 2):
+            yield array[i], array[i + 1]
+
+
+def _pair(edit, shift, h1, k1, v1, h2, k2, v2):
+    '''A node holding two keys that share a slot at the level above'''
+    if h1 == h2:
+        return _CollisionNode(edit, h1, [k1, v1, k2, v2])
+
+    added = []
+    node = _MapNode(edit, 0, [])
+    node = node.assoc(edit, shift, h1, k1, v1, added)
+    return node.assoc(edit, shift, h2, k2, v2, added)
+
+
+class PersistentMap:
+    '''
+    An immutable hash map. Keys are compared and hashed in the same way as
+    they are for a dict, and iteration order is based on their hashes.
+    '''
+    __slots__ = ('_count', '_root', '_hash')
+
+    EMPTY = None
+
+    def __new__(cls, items=()):
+        if isinstance(items, PersistentMap):
+            return items
+
+        m = TransientMap(cls.EMPTY)
+        if isinstance(items, Mapping):
+            items = items.items()
+        for key, val in items:
+            m.assoc(key, val)
+        return m.persistent()
+
+    @classmethod
+    def _make(cls, count, root):
+        m = object.__new__(cls)
+        m._count = count
+        m._root = root
+        m._hash = None
+        return m
+
+    def __len__(self):
+        return self._count
+
+    def get(self, key, default=None):
+        return self._root.find(0, _hash(key), key, default)
+
+    def __getitem__(self, key):
+        val = self._root.find(0, _hash(key), key, _MISSING)
+        if val is _MISSING:
+            raise KeyError(key)
+        return val
+
+    def __contains__(self, key):
+        return self._root.find(0, _hash(key), key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        return (key for key, _ in self._root.items())
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return (val for _, val in self._root.items())
+
+    def items(self):
+        return self._root.items()
+
+    def assoc(self, key, val):
+        '''A new map with `key` bound to `val`'''
+        added = []
+        root = self._root.assoc(None, 0, _hash(key), key, val, added)
+        if root is self._root:
+            return self
+        return PersistentMap._make(self._count + len(added), root)
+
+    def dissoc(self, key):
+        '''A new map without `key`'''
+        root = self._root.without(None, 0, _hash(key), key)
+        if root is self._root:
+            return self
+        elif root is None:
+            return PersistentMap.EMPTY
+        return PersistentMap._make(self._count - 1, root)
+
+    def transient(self):
+        return TransientMap(self)
+
+    def __eq__(self, other):
+        if not isinstance(other, (PersistentMap, dict)):
+            return NotImplemented
+
+        if len(self) != len(other):
+            return False
+        for key, val in self.items():
+            found = other.get(key, _MISSING)
+            if not (found is val or found == val):
+                return False
+        return True
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self.items()))
+        return self._hash
+
+    def __reduce__(self):
+        return (PersistentMap, (list(self.items()),))
+
+    def __repr__(self):
+        pairs = ', '.join(f'{k!r} {v!r}' for k, v in self.items())
+        return f'{{{pairs}}}'
+
+
+class TransientMap:
+    '''A mutable map built from a PersistentMap: see TransientVector'''
+    __slots__ = ('_count', '_root', '_edit')
+
+    def __init__(self, m):
+        self._count = m._count
+        self._root = m._root
+        self._edit = object()
+
+    def _check(self):
+        if self._edit is False:
+            raise RiplError('Transient used after persistent! was called')
+
+    def __len__(self):
+        return self._count
+
+    def get(self, key, default=None):
+        self._check()
+        return self._root.find(0, _hash(key), key, default)
+
+    def __getitem__(self, key):
+        val = self.get(key, _MISSING)
+        if val is _MISSING:
+            raise KeyError(key)
+        return val
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def assoc(self, key, val):
+        self._check()
+        added = []
+        self._root = self._root.assoc(
+            self._edit, 0, _hash(key), key, val, added)
+        self._count += len(added)
+        return self
+
+    def dissoc(self, key):
+        self._check()
+        if key in self:
+            root = self._root.without(self._edit, 0, _hash(key), key)
+            self._root = _MapNode(self._edit, 0, []) if root is None else root
+            self._count -= 1
+        return self
+
+    def persistent(self):
+        '''The finished map: this transient can't be used after this'''
+        self._check()
+        self._edit = False
+        if not self._count:
+            return PersistentMap.EMPTY
+        return PersistentMap._make(self._count, self._root)
+
+
+PersistentMap.EMPTY = PersistentMap._make(0, _MapNode(None, 0, []))
+
+# Let Python code treat them like any other sequence or mapping
+Sequence.register(PersistentVector)
+Mapping.register(PersistentMap)
+
+
+# [...] and {...} in code are literals whose elements are evaluated: every
+# mode splits one up with `elements` and puts the values back with `rebuild`
+COLLECTIONS = (PersistentVector, PersistentMap)
+
+
+def elements(coll):
+    '''The forms in a vector or map literal: each key before its value'''
+    if isinstance(coll, PersistentMap):
+        return [form for item in coll.items() for form in item]
+    return list(coll)
+
+
+def rebuild(coll, vals):
+    '''A collection of the same kind as coll from the values of elements'''
+    if isinstance(coll, PersistentMap):
+        return PersistentMap(zip(vals[::2], vals[1::2]))
+    return PersistentVector(vals)
+
+
+def is_constant(coll):
+    '''Does a vector or map literal evaluate to itself?'''
+    for form in elements(coll):
+        if isinstance(form, Symbol) or (
+                isinstance(form, LispList) and form):
+            return False
+        if isinstance(form, COLLECTIONS) and not is_constant(form):
+            return False
+
+    return True
+
+
+# Builtins that work across the persistent collections and Python's own
+def hash_map(*kvs):
+    '''(hash-map k1 v1 k2 v2 ...)'''
+    if len(kvs) % 2:
+        raise RiplError('hash-map expects keys and values in pairs')
+    return PersistentMap(zip(kvs[::2], kvs[1::2]))
+
+
+def conj(coll, *vals):
+    '''
+    Add values to a collection wherever is cheapest for it: the end of a
+    vector and the front of a list. Values for a map are (key value) pairs.
+    '''
+    if isinstance(coll, PersistentVector):
+        if len(vals) == 1:
+            return coll.conj(vals[0])
+        vec = coll.transient()
+        for val in vals:
+            vec.conj(val)
+        return vec.persistent()
+
+    elif isinstance(coll, PersistentMap):
+        m = coll.transient()
+        for key, val in vals:
+            m.assoc(key, val)
+        return m.persistent()
+
+    elif isinstance(coll, (set, frozenset)):
+        return coll.union(vals)
+    elif isinstance(coll, tuple):
+        return coll + vals
+    elif isinstance(coll, list):
+        return coll + list(vals)
+    elif hasattr(coll, 'cons'):
+        # LispList and LazySeq
+        for val in vals:
+            coll = coll.cons(val)
+        return coll
+
+    raise RiplError(f"Can't conj on to {type(coll).__name__}")
+
+
+def assoc(coll, key, val, *kvs):
+    '''A copy of a map or vector with each key (or index) set to a value'''
+    if len(kvs) % 2:
+        raise RiplError('assoc expects keys and values in pairs')
+
+    pairs = [(key, val), *zip(kvs[::2], kvs[1::2])]
+
+    if isinstance(coll, (PersistentVector, PersistentMap)):
+        if not kvs:
+            return coll.assoc(key, val)
+        new = coll.transient()
+        for key, val in pairs:
+            new.assoc(key, val)
+        return new.persistent()
+
+    elif isinstance(coll, (dict, list)):
+        new = coll.copy()
+        for key, val in pairs:
+            new[key] = val
+        return new
+
+    raise RiplError(f"Can't assoc into {type(coll).__name__}")
+
+
+def dissoc(m, *keys):
+    '''A copy of a map without the given keys'''
+    if isinstance(m, PersistentMap):
+        for key in keys:
+            m = m.dissoc(key)
+        return m
+
+    elif isinstance(m, dict):
+        return {k: v for k, v in m.items() if k not in keys}
+
+    raise RiplError(f"Can't dissoc from {type(m).__name__}")
+
+
+def get(coll, key, default=None):
+    '''The value for a key (or index) in a collection, or `default`'''
+    if isinstance(coll, (PersistentMap, PersistentVector, dict)):
+        return coll.get(key, default)
+
+    try:
+        return coll[key]
+    except (IndexError, KeyError, TypeError):
+        return default
+
+
+def transient(coll):
+    '''A mutable copy of a persistent collection for building up a new one'''
+    return coll.transient()
+
+
+def persistent(coll):
+    '''Finish off a transient, which then can't be used any more'''
+    return coll.persistent()
+
+
+def conj_(coll, *vals):
+    '''Add values to the end of a transient vector or to a transient map'''
+    if isinstance(coll, TransientMap):
+        for key, val in vals:
+            coll.assoc(key, val)
+    else:
+        for val in vals:
+            coll.conj(val)
+    return coll
+
+
+def assoc_(coll, key, val, *kvs):
+    '''Set keys (or indices) in a transient'''
+    coll.assoc(key, val)
+    for key, val in zip(kvs[::2], kvs[1::2]):
+        coll.assoc(key, val)
+    return coll
+
+
+def dissoc_(coll, *keys):
+    '''Remove keys from a transient map'''
+    for key in keys:
+        coll.dissoc(key)
+    return coll
@@ -0,0 +1,55 @@
+'''
+A pool of interpretors for running many small, isolated programs.
+
+Setting up an interpretor (building the global environment and loading
+the prelude) costs far more than running a short script. A pool warms up
+one interpretor once and hands out clones of it: each clone shares the
+template's definitions and macros but keeps its own in a private layer, so
+nothing that one program defines can be seen by the next. Returning a
+clone to the pool drops that layer, which costs the same no matter how
+much was defined.
+'''
+from collections import deque
+from contextlib import contextmanager
+
+
+class InterpretorPool:
+    '''
+    Hand out clones of a template interpretor, resetting them on return.
+    `size` clones are made up front and at most `size` are kept for reuse:
+    if the pool runs dry a new clone is made rather than blocking.
+
+    The template is shared by every clone and can't be used to define
+    anything else once the pool has been made: see Evaluator.clone.
+    '''
+    def __init__(self, template, size=4):
+        self.template = template
+        self.size = size
+        # deque append/pop are atomic so the pool can be shared by threads
+        self._free = deque(template.clone() for _ in range(size))
+
+    def acquire(self):
+        '''Take a clean interpretor from the pool'''
+        try:
+            return self._free.pop()
+        except IndexError:
+            return self.template.clone()
+
+    def release(self, interp):
+        '''Reset an interpretor and put it back in the pool'''
+        interp.reset()
+        if len(self._free) < self.size:
+            self._free.append(interp)
+
+    @contextmanager
+    def interpretor(self):
+        '''
+        Borrow an interpretor for the duration of a with block:
+            with pool.interpretor() as interp:
+                results = list(interp.eval_expr(script))
+        '''
+        interp = self.acquire()
+        try:
+            yield interp
+        finally:
+            self.release(interp)
@@ -1,11 +1,16 @@
 '''
 Read in text and convert to internal data structures.
+
+Reading happens in a single pass: the lexer makes one scan over the input
+using a single combined regex and a table of per-tag conversions, and the
+parser builds nested forms using an explicit stack rather than recursion
+so there is no limit on how deeply nested the input can be.
 '''
 import re
-from itertools import chain
 from collections import namedtuple
 
-from .types import Symbol, Keyword, Procedure
+from .types import Symbol, Keyword, LispList
+from .persistent import PersistentVector, PersistentMap
 
 
 Tag = namedtuple('Tag', 'name regex')
@@ -55,12 +60,76 @@ _TAGS = '|'.join(
     for t in TAGS
 )
 
+# Blanks that are not newlines are swallowed in front of each token so
+# that they never reach the Python side of the lexer.
+_BLANKS = r'[ \t\r\f\v]*'
+_GROUPS = re.compile(_TAGS).groupindex
+
+# Conversions from source text to values. Anything else keeps its text.
+CONVERTERS = {
+    'NULL': lambda txt: LispList.EMPTY,
+    'COMPLEX': complex,
+    'COMPLEX_PURE': complex,
+    'FLOAT': float,
+    'BOOL': lambda txt: txt == '#t',
+}
+for _tag, _base in INT_BASES.items():
+    CONVERTERS[_tag] = lambda txt, base=_base: int(txt, base)
+
+# Tags that carry no data: dropped by the lexer after counting lines
+SKIPPED = frozenset(['COMMENT', 'COMMENT_SEXP', 'WHITESPACE', 'NEWLINE'])
+# Tags whose text can run over multiple lines
+MULTILINE = frozenset(['STRING', 'DOCSTRING']) | SKIPPED
+# Some tags are normalised to a single name in the token stream
+RENAMED = {'COMPLEX_PURE': 'COMPLEX'}
+
+# The lexer's dispatch table:
+#   tag -> (text group, converter, emitted tag, may span lines)
+# For tags with a capture group of their own (strings, docstrings and NULL)
+# the source text is that inner group rather than the whole match.
+LEX_TABLE = {
+    t.name: (
+        _GROUPS[t.name] + min(re.compile(t.regex).groups, 1),
+        CONVERTERS.get(t.name),
+        None if t.name in SKIPPED else RENAMED.get(t.name, t.name),
+        t.name in MULTILINE,
+    )
+    for t in TAGS
+}
+
+_make_token = Token.__new__
+
+
+def _lines(stream):
+    '''Lines of text from a file like object or mmap'''
+    readline = stream.readline
+    while True:
+        line = readline()
+        if not line:
+            return
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        yield line
+
+
+OPENERS = {
+    'PAREN_OPEN': 'PAREN_CLOSE',
+    'BRACKET_OPEN': 'BRACKET_CLOSE',
+    'BRACE_OPEN': 'BRACE_CLOSE',
+}
+CLOSERS = frozenset(OPENERS.values())
+UNCLOSED = {
+    'PAREN_OPEN': 'Unclosed s-expression in input',
+    'BRACKET_OPEN': 'missing closing ] in list literal.',
+    'BRACE_OPEN': 'missing closing } in dict literal.',
+}
+
 
 class Reader:
     '''
     Read a string input and convert it to internal data
     '''
-    tags = re.compile(_TAGS)
+    tags = re.compile(f'{_BLANKS}(?:{_TAGS})')
     tokens = None
 
     def read(self, text):
@@ -69,173 +138,165 @@ class Reader:
         '''
         return next(self.parse(self.tokenise(text)))
 
+    def read_all(self, text):
+        '''
+        Read every top level form in some input.
+        '''
+        return self.parse(self.tokenise(text))
+
+    def read_stream(self, stream):
+        '''
+        Read top level forms one at a time from a file like object or mmap.
+        Each form is yielded as soon as it is complete so only the form
+        currently being read is held in memory.
+        '''
+        return self.parse(self.tokenise_stream(stream))
+
     def tokenise(self, string):
         '''
         Convert an input string into tokens.
         '''
-        # Remove surrounding whitespace
-        string = string.strip()
-
-        # Check for invalid s-exps
-        if string.startswith('('):
-            if not string.endswith(')'):
-                raise SyntaxError(
-                    'Unclosed s-expression in input')
+        # Positions are counted from the first thing in the input that
+        # isn't whitespace, as they always have been
+        return self._lex(string.lstrip(), 1, 0, final=True)
 
-        line_num = 1
-        line_start = 0
+    def tokenise_stream(self, stream):
+        '''
+        Convert the contents of a file like object (or mmap) into tokens,
+        reading it a line at a time. Only a string literal that continues
+        on to the next line is ever carried over. Positions are counted in
+        the same way as for a string.
+        '''
+        pending, line_num, line_start = '', 1, 0
+        started = False
+
+        for line in _lines(stream):
+            if not started:
+                line = line.lstrip()
+                if not line:
+                    continue
+                started = True
+
+            pending += line
+            consumed, line_num, line_start = yield from self._lex(
+                pending, line_num, line_start, final=False)
+            pending = pending[consumed:]
+            line_start -= consumed
+
+        if pending:
+            yield from self._lex(pending, line_num, line_start, final=True)
+
+    def _lex(self, string, line_num, line_start, final):
+        '''
+        Tokenise a string, starting at line `line_num` which began at index
+        `line_start`. Unless this is the `final` piece of input, stop before
+        a string literal that may be continued in the next piece.
+        Returns (characters consumed, line_num, line_start).
+        '''
+        lex_table = LEX_TABLE
+        make_token = _make_token
 
-        for match in re.finditer(self.tags, string):
+        for match in self.tags.finditer(string):
             lex_tag = match.lastgroup
+            group, convert, tag, multiline = lex_table[lex_tag]
+            source_txt = match.group(group)
 
-            # If I'm honest, I forget why I need to do this...!
-            group = [g for g in match.groups() if g is not None]
-            source_txt = group[1] if len(group) == 2 else match.group(lex_tag)
-
-            if lex_tag == 'SYNTAX_ERROR':
-                # There was something that we didn't recognise
-                raise SyntaxError('Unable to parse: {}'.format(source_txt))
+            if tag is not None:
+                start = match.start(lex_tag)
 
-            elif lex_tag == 'NEWLINE':
-                # Increment the line count
-                line_start = match.end()
-                line_num += 1
+                if not final and string[start] == '"' and (
+                        tag == 'SYMBOL' or (tag == 'STRING' and
+                                            string.startswith('"""', start))):
+                    # An unterminated string: wait for more input
+                    return start, line_num, line_start
 
-            elif lex_tag in 'COMMENT COMMENT_SEXP WHITESPACE'.split():
-                # ignore things we don't care about
-                pass
+                if tag == 'SYNTAX_ERROR':
+                    # There was something that we didn't recognise
+                    raise SyntaxError(
+                        'Unable to parse: {}'.format(source_txt))
 
-            elif lex_tag.startswith('QUOTED'):
-                sub = '(quote ' + source_txt[1:] + ')'
-                yield from self.tokenise(sub)
+                val = convert(source_txt) if convert else source_txt
 
-            elif lex_tag == 'QUASI_QUOTED':
-                sub = '(quasiquote ' + source_txt[1:] + ')'
-                yield from self.tokenise(sub)
+                # Generate a token
+                yield make_token(Token, tag, val, line_num, start - line_start)
 
-            else:
-                # We have something that we can convert to a value
-                if lex_tag == 'NULL':
-                    val = []
-                elif lex_tag in INT_BASES:
-                    val = int(source_txt, INT_BASES[lex_tag])
-                elif lex_tag == 'FLOAT':
-                    val = float(source_txt)
-                elif lex_tag.startswith('COMPLEX'):
-                    # regex groups need to be distinct so we differentiate
-                    # above as a single regex is huuuuuge!
-                    val = complex(source_txt)
-                    lex_tag = 'COMPLEX'
-                elif lex_tag == 'BOOL':
-                    val = True if source_txt == '#t' else False
-                else:
-                    # string
-                    val = source_txt
-
-                column = match.start() - line_start
+            # Everything else is ignored, other than the lines that it spans
+            if multiline and '\n' in source_txt:
+                line_num += source_txt.count('\n')
+                line_start = string.rfind('\n', 0, match.end()) + 1
 
-                # Generate a token
-                yield Token(lex_tag, val, line_num, column)
+        return len(string), line_num, line_start
 
     def parse(self, tokens):
         '''
-        Convert a stream of tokens into a nested list of lists for evaluation.
+        Convert a stream of tokens into a nested list of lists for evaluation,
+        yielding each top level form as soon as it is complete.
+
+        Open s-expressions, vectors and dicts are held on an explicit stack
+        of (opening token, elements) along with pending quotes so that the
+        depth of nesting is only limited by memory.
         '''
-        if not tokens:
-            # Can't run an empty program!
-            raise SyntaxError('unexpected EOF while reading input')
+        stack = []
 
         for token in tokens:
-            if token.tag == 'PAREN_OPEN':
-                # Start of an s-expression, drop the intial paren
-                token = next(tokens)
-                sexp = []
-
-                if token.tag == 'PAREN_CLOSE':
-                    # Special case of the empty list
-                    yield []  # EmptyList()
-
-                else:
-                    # Read until the end of the current s-exp
-                    while token.tag != 'PAREN_CLOSE':
-                        tokens = chain([token], tokens)
-                        sexp.append(next(self.parse(tokens)))
-                        token = next(tokens)
-
-                    yield sexp
-
-            if token.tag in QUOTES:
-                yield [Symbol(QUOTES[token.tag]), next(self.parse(tokens))]
-                # yield from chain(
-                #     [Symbol(QUOTES[token.tag])],
-                #     self.parse(tokens))
-
-            elif token.tag == 'BRACKET_OPEN':
-                # start of a vector literal, drop the initial bracket
-                list_literal, tokens = self._parse_vector(tokens)
-                yield list_literal
-
-            elif token.tag == 'BRACE_OPEN':
-                # start of a dict literal, drop the initial brace
-                dict_literal, tokens = self._parse_dict(tokens)
-                yield dict_literal
-
-            elif token.tag in 'PAREN_CLOSE BRACKET_CLOSE BRACE_CLOSE'.split():
-                warning = 'unexpected {} in input (line {} col {})'.format(
-                    token.val, token.line, token.col)
-                raise SyntaxError(warning)
+            tag = token.tag
+
+            if tag in OPENERS:
+                stack.append((token, []))
+                continue
+
+            elif tag in QUOTES:
+                # The next complete form will be wrapped when it arrives
+                stack.append((token, None))
+                continue
+
+            elif tag in CLOSERS:
+                if not stack or OPENERS.get(stack[-1][0].tag) != tag:
+                    warning = 'unexpected {} in input (line {} col {})'.format(
+                        token.val, token.line, token.col)
+                    raise SyntaxError(warning)
+
+                opener, elems = stack.pop()
+                form = self._close(opener.tag, elems)
+
+            elif tag == 'COMMA' and stack and stack[-1][0].tag == 'BRACE_OPEN':
+                # Commas are just separators in dict literals
+                continue
 
             else:
-                yield self.make_atom(token)
+                form = self.make_atom(token)
 
-    def _parse_vector(self, tokens):
-        '''
-        Parse a vector literal all at once and return both the list and
-        remaining tokens from the input stream.
-        '''
-        tmp = []
-        token = next(tokens)
-
-        try:
-            while token.tag != 'BRACKET_CLOSE':
-                tmp.append(token)
-                token = next(tokens)
-            # Drop the final bracket
-            parsed = [v for v in self.parse(tmp)]
-            return parsed, tokens
-
-        except StopIteration:
-            # If we hit here then there was an error in the input.
-            raise SyntaxError('missing closing ] in list literal.')
-
-    def _parse_dict(self, tokens):
-        '''
-        Parse a dict literal and return the dict and remaining tokens
-        Dict literals are given as {k1 v1, k2 v2, ...}
-        '''
-        tmp = []
-        token = next(tokens)
+            # Hand the completed form to whatever is waiting for it
+            while stack and stack[-1][1] is None:
+                quote, _ = stack.pop()
+                form = LispList([Symbol(QUOTES[quote.tag]), form])
 
-        try:
-            while token.tag != 'BRACE_CLOSE':
-                if token.tag != 'COMMA':
-                    tmp.append(token)
-                token = next(tokens)
+            if stack:
+                stack[-1][1].append(form)
+            else:
+                yield form
 
-            # Drop the final brace
-            parsed = [v for v in self.parse(tmp)]
+        if stack:
+            opener = stack[-1][0]
+            if opener.tag in UNCLOSED:
+                raise SyntaxError(UNCLOSED[opener.tag])
+            raise SyntaxError('unexpected EOF while reading input')
 
-            if len(parsed) % 2 != 0:
-                # We didn't get key/value pairs
-                raise SyntaxError("Invalid dict literal")
+    @staticmethod
+    def _close(tag, elems):
+        '''Build the data structure for a closed bracket of some kind'''
+        if tag == 'PAREN_OPEN':
+            return LispList(elems)
 
-            pairs = [parsed[i:i+2] for i in range(0, len(parsed), 2)]
+        elif tag == 'BRACKET_OPEN':
+            return PersistentVector(elems)
 
-            return {k: v for k, v in pairs}, tokens
+        # Dict literals are given as {k1 v1, k2 v2, ...}
+        if len(elems) % 2 != 0:
+            # We didn't get key/value pairs
+            raise SyntaxError("Invalid dict literal")
 
-        except StopIteration:
-            # If we hit here then there was an error in the input.
-            raise SyntaxError('missing closing } in dict literal.')
+        return PersistentMap(zip(elems[::2], elems[1::2]))
 
     @staticmethod
     def make_atom(token):
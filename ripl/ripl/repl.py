@@ -6,7 +6,8 @@ import readline
 import traceback
 
 from .interpretor import Interpretor
-from .types import LispList, Procedure, Vector
+from .types import LispList, LazySeq, Procedure, Vector
+from .persistent import PersistentVector, PersistentMap
 
 
 COMPLETIONS = ['start', 'stop', 'list', 'print']
@@ -21,6 +22,36 @@ def has_matching_parens(text):
     return paren and bracket and brace
 
 
+def lisp_str(exp):
+    '''
+    Convert a Python object back into a Lisp-readable string for display.
+    '''
+    if isinstance(exp, (LispList, LazySeq)):
+        # (1 2 ... n)
+        string = f'({" ".join(map(lisp_str, exp))})'
+    elif isinstance(exp, (Vector, PersistentVector)):
+        # [1 2 ... n]
+        string = f'[{" ".join(map(lisp_str, exp))}]'
+    elif isinstance(exp, (dict, PersistentMap)):
+        # {a 1, b 2, ... k v}
+        tmp = ['{} {}'.format(k, v) for k, v in exp.items()]
+        string = '{' + ', '.join(tmp) + '}'
+    elif isinstance(exp, tuple):
+        # (, 1 2 ... n)
+        string = f'(, {" ".join(map(lisp_str, exp))})'
+    elif isinstance(exp, bool):
+        string = '#t' if exp else '#f'
+    elif isinstance(exp, Procedure):
+        if exp.__doc__ != '':
+            string = f'Procedure: {exp.__doc__}'
+        else:
+            string = 'Anonymous Procedure (λ)'
+    else:
+        string = str(exp)
+
+    return string
+
+
 class SimpleCompleter:
     '''A very simple completion engine for the repl'''
     def __init__(self, options):
@@ -54,9 +85,12 @@ class REPL(Interpretor):
     in_prompt = "λ > "
     out_prompt = "   "
 
-    def __init__(self, load_prelude=True):
+    def __init__(self, load_prelude=True, mode=None, cache=True,
+                 image=None, expand=False, jit=None, fold=False):
         '''Configure readline for parsing input'''
-        super().__init__()
+        super().__init__(
+            mode=mode, cache=cache, image=image, expand=expand, jit=jit,
+            fold=fold)
         self._load_prelude = load_prelude
 
         # Register the completer function
@@ -94,7 +128,9 @@ class REPL(Interpretor):
                 if _input:
                     if has_matching_parens(_input):
                         # TODO: Add history save
-                        result = self.evaluator.eval(self.reader.read(_input))
+                        expr = self.reader.read(_input)
+                        expr, = self._expanded([expr])
+                        result = self.evaluator.eval(expr)
 
                         if result is not None:
                             print('> ' + self.py_to_lisp_str(result) + '\n')
@@ -130,34 +166,17 @@ class REPL(Interpretor):
 
     def eval_and_print(self, prog):
         '''Evaluate and print the result of a program'''
-        for exp in map(self.py_to_lisp_str, self.evaluator.eval(prog)):
-            print(exp)
+        self._print_results(self.eval_expr(prog))
 
-    def py_to_lisp_str(self, exp):
-        '''
-        Convert a Python object back into a Lisp-readable string for display.
-        '''
-        if isinstance(exp, LispList):
-            # (1 2 ... n)
-            string = f'({" ".join(map(self.py_to_lisp_str, exp))})'
-        elif isinstance(exp, Vector):
-            # [1 2 ... n]
-            string = f'[{" ".join(map(self.py_to_lisp_str, exp))}]'
-        elif isinstance(exp, dict):
-            # {a 1, b 2, ... k v}
-            tmp = ['{} {}'.format(k, v) for k, v in exp.items()]
-            string = '{' + ', '.join(tmp) + '}'
-        elif isinstance(exp, tuple):
-            # (, 1 2 ... n)
-            string = f'(, {" ".join(map(self.py_to_lisp_str, exp))})'
-        elif isinstance(exp, bool):
-            string = '#t' if exp else '#f'
-        elif isinstance(exp, Procedure):
-            if exp.__doc__ != '':
-                string = f'Procedure: {exp.__doc__}'
-            else:
-                string = 'Anonymous Procedure (λ)'
-        else:
-            string = str(exp)
+    def eval_file_and_print(self, fname):
+        '''Evaluate and print the results of a file as they are computed'''
+        self._print_results(self.eval_file(fname))
 
-        return string
+    def _print_results(self, results):
+        for result in results:
+            if result is not None:
+                print(self.py_to_lisp_str(result))
+
+    def py_to_lisp_str(self, exp):
+        '''Convert a Python object to a string for display: see lisp_str'''
+        return lisp_str(exp)
@@ -0,0 +1,137 @@
+'''
+Lazy sequence functions: see ripl.types.LazySeq.
+
+map, filter, take, drop, range and iterate all return LazySeqs without
+doing any work up front: elements are computed a chunk at a time as they
+are used. They accept anything iterable, including Python iterators and
+generators, and reduce consumes its input one element at a time so a
+file can be streamed through in constant memory:
+    (reduce (lambda (n line) (+ n 1)) 0 (open "big.log"))
+
+Called without a collection, the functions that transform one return a
+transducer instead: see ripl.transduce.
+'''
+from itertools import count, islice
+
+from .types import LazySeq, LispList
+from .transduce import (
+    Reduced, sequence, mapping, filtering, taking, dropping, removing,
+    taking_while, dropping_while, mapcat, partition_all
+)
+
+# Marks a collection that wasn't given
+_MISSING = object()
+
+
+def seq(coll):
+    '''A lazy seq of the elements of any iterable'''
+    return LazySeq.from_iter(coll)
+
+
+def lazy_seq(thunk):
+    '''A seq of whatever `thunk` returns, only calling it when needed'''
+    return LazySeq(thunk)
+
+
+def lazy_range(*args):
+    '''(range) counts up from 0 for ever, otherwise as Python's range'''
+    if not args:
+        return LazySeq.from_iter(count())
+
+    return LazySeq.from_iter(range(*args))
+
+
+def iterate(f, x):
+    '''The infinite seq x, (f x), (f (f x)) ...'''
+    def iterating(x):
+        while True:
+            yield x
+            x = f(x)
+
+    return LazySeq.from_iter(iterating(x))
+
+
+def take(n, coll=_MISSING):
+    '''The first n elements of coll'''
+    if coll is _MISSING:
+        return taking(n)
+
+    return LazySeq(lambda: islice(coll, n))
+
+
+def drop(n, coll=_MISSING):
+    '''Everything but the first n elements of coll'''
+    if coll is _MISSING:
+        return dropping(n)
+
+    def skipped():
+        if isinstance(coll, LazySeq):
+            return coll.drop(n)
+        elif isinstance(coll, LispList):
+            # Shares the remaining cells
+            return coll[n:]
+        return islice(coll, n, None)
+
+    return LazySeq(skipped)
+
+
+def lazy_map(f, *colls):
+    '''(f x) for each x in coll, or (f x y ...) across several colls'''
+    if not colls:
+        return mapping(f)
+
+    return LazySeq(lambda: map(f, *colls))
+
+
+def lazy_filter(pred, coll=_MISSING):
+    '''The elements of coll for which (pred x) is true'''
+    if coll is _MISSING:
+        return filtering(pred)
+
+    return LazySeq(lambda: filter(pred, coll))
+
+
+def _transducing(make):
+    '''
+    A builtin that returns the transducer (make arg) when called without a
+    collection and applies it lazily to the collection otherwise.
+    '''
+    def builtin(arg, coll=_MISSING):
+        if coll is _MISSING:
+            return make(arg)
+        return sequence(make(arg), coll)
+
+    builtin.__doc__ = make.__doc__
+    return builtin
+
+
+remove = _transducing(removing)
+take_while = _transducing(taking_while)
+drop_while = _transducing(dropping_while)
+lazy_mapcat = _transducing(mapcat)
+partition = _transducing(partition_all)
+
+
+def reduce(f, *args):
+    '''
+    (reduce f coll) or (reduce f init coll): fold coll from the left.
+    Without an init value the first element is used. Returning
+    (reduced x) from f stops the fold early with x as the result.
+    '''
+    if len(args) == 2:
+        acc, coll = args
+        it = iter(coll)
+    else:
+        coll, = args
+        it = iter(coll)
+        try:
+            acc = next(it)
+        except StopIteration:
+            raise TypeError('reduce of an empty seq with no initial value')
+
+    for x in it:
+        acc = f(acc, x)
+        if type(acc) is Reduced:
+            return acc.value
+
+    return acc
@@ -0,0 +1,229 @@
+'''
+Serve evaluation requests over a Unix socket: `ripl --serve`.
+
+Starting Python, building the global environment and loading the prelude
+takes hundreds of milliseconds, while most scripts run in microseconds.
+The server pays for the start up once and then runs each request on a
+clean clone of the warmed up interpretor from an InterpretorPool (see
+ripl.pool), so nothing that one client defines is seen by any other.
+
+Requests and replies are JSON objects, one per line:
+    {"op": "eval", "code": "(+ 1 2)", "session": "name"}
+    {"values": ["3"], "out": ""}
+`values` are the non-nil results of each form in `code` printed as the
+REPL would print them and `out` is anything that the script printed. If
+one of the forms raises then the reply has an `error` with the values of
+the forms before it. `op` defaults to "eval".
+
+By default a request is run on an interpretor that belongs to the
+connection it came in on, which is reset and put back in the pool when the
+connection closes. Requests that name a `session` are run on that
+session's interpretor instead, which keeps its definitions between
+connections until {"op": "close", "session": "name"} ends it.
+
+Anyone that can connect to the socket can run code as the user running
+the server, so it is only made accessible to that user.
+'''
+import io
+import os
+import sys
+import json
+import stat
+import socket
+import threading
+import socketserver
+
+from .pool import InterpretorPool
+from .repl import lisp_str
+from .types import RiplError
+from .client import default_socket
+
+
+class Output(io.TextIOBase):
+    '''
+    Stands in for sys.stdout so that what each request prints is sent
+    back with its reply rather than being written by the server.
+    '''
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self, buf):
+        '''Send what this thread prints to buf, or back to the stream'''
+        self.local.buf = buf
+
+    def write(self, text):
+        buf = getattr(self.local, 'buf', None)
+        return (self.stream if buf is None else buf).write(text)
+
+    def flush(self):
+        if getattr(self.local, 'buf', None) is None:
+            self.stream.flush()
+
+    def writable(self):
+        return True
+
+
+class Session:
+    '''An interpretor that is kept between requests'''
+    def __init__(self, interp):
+        self.interp = interp
+        # A session can be used by several connections at once
+        self.lock = threading.Lock()
+
+
+class Handler(socketserver.StreamRequestHandler):
+    '''Answer each request on a connection in turn'''
+    def setup(self):
+        super().setup()
+        self.own = None
+
+    def finish(self):
+        if self.own is not None:
+            self.server.pool.release(self.own)
+        super().finish()
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+
+            try:
+                reply = self.answer(json.loads(line))
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                reply = {'error': f'Invalid request: {e}'}
+            except RiplError as e:
+                reply = {'error': str(e)}
+
+            self.wfile.write(json.dumps(reply).encode() + b'\n')
+            self.wfile.flush()
+
+    def answer(self, msg):
+        op = msg.get('op', 'eval')
+        name = msg.get('session')
+
+        if op == 'close':
+            self.server.close_session(name)
+            return {}
+        elif op != 'eval':
+            raise RiplError(f'Unknown op: {op}')
+
+        code = msg['code']
+        if not isinstance(code, str):
+            raise TypeError('code must be a string')
+
+        if name is None:
+            if self.own is None:
+                self.own = self.server.pool.acquire()
+            return self.server.evaluate(self.own, code)
+
+        session = self.server.session(name)
+        with session.lock:
+            return self.server.evaluate(session.interp, code)
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    '''
+    Run requests from each connection on its own thread using
+    interpretors from `pool`. Named sessions live until they are closed.
+    '''
+    daemon_threads = True
+
+    def __init__(self, path, pool, output):
+        self.pool = pool
+        self.output = output
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        super().__init__(path, Handler)
+
+    def server_bind(self):
+        # Only the user running the server can connect
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+    def session(self, name):
+        '''The named session, started if it doesn't exist yet'''
+        with self.sessions_lock:
+            try:
+                return self.sessions[name]
+            except KeyError:
+                session = Session(self.pool.acquire())
+                self.sessions[name] = session
+                return session
+
+    def close_session(self, name):
+        '''Forget a session and everything that it defined'''
+        with self.sessions_lock:
+            session = self.sessions.pop(name, None)
+
+        if session is not None:
+            with session.lock:
+                self.pool.release(session.interp)
+
+    def evaluate(self, interp, code):
+        '''Run code, collecting the printed results and output'''
+        buf = io.StringIO()
+        reply = {'values': []}
+        self.output.capture(buf)
+        try:
+            for result in interp.eval_expr(code):
+                if result is not None:
+                    reply['values'].append(lisp_str(result))
+        except Exception as e:
+            reply['error'] = f'{type(e).__name__}: {e}'
+        finally:
+            self.output.capture(None)
+
+        reply['out'] = buf.getvalue()
+        return reply
+
+
+def _clear_stale(path):
+    '''
+    Remove a socket left behind by a server that has stopped. Anything
+    other than a socket is left alone.
+    '''
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(mode):
+        raise RiplError(f'Refusing to serve on {path}: it is not a socket')
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            os.remove(path)
+            return
+
+    raise RiplError(f'A server is already listening on {path}')
+
+
+def serve(template, path=None, size=4):
+    '''
+    Serve requests on the socket at `path` (see client.default_socket)
+    using clones of the `template` interpretor, keeping `size` of them
+    warm, until interrupted.
+    '''
+    path = path or default_socket()
+    pool = InterpretorPool(template, size)
+    _clear_stale(path)
+
+    output = Output(sys.stdout)
+    sys.stdout = output
+    try:
+        with Server(path, pool, output) as server:
+            print(f'Serving on {path}', file=sys.stderr)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        sys.stdout = output.stream
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,314 @@
+'''
+Transducers: composable transformations of reducing functions.
+
+A reducing function takes an accumulated value and an element and returns
+the new accumulated value, like the function given to reduce. Called with
+only the accumulated value it finishes off the reduction. A transducer
+takes one reducing function and returns another that transforms each
+element on the way through: mapping it, dropping it or stopping early.
+
+(map f), (filter pred), (take n) and friends return transducers when they
+are not given a collection. These chain together with comp, outermost
+first, so
+    (transduce (comp (map inc) (filter even?) (take 10)) + 0 coll)
+runs the whole pipeline in a single pass over coll without building any
+intermediate collections. coll can be anything iterable.
+'''
+from itertools import chain
+
+from .types import LispList, LazySeq
+from .persistent import (
+    PersistentVector, PersistentMap, TransientVector, TransientMap
+)
+
+
+# Marks a call to a reducing function with no element: see `completing`
+COMPLETE = object()
+
+
+class Reduced:
+    '''Wraps the final value of a reduction that has finished early'''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return f'Reduced({self.value!r})'
+
+
+def reduced(value):
+    '''Stop the current reduction with `value` as its result'''
+    return Reduced(value)
+
+
+def is_reduced(value):
+    return type(value) is Reduced
+
+
+def ensure_reduced(value):
+    return value if type(value) is Reduced else Reduced(value)
+
+
+def completing(f, complete=None):
+    '''
+    Make a reducing function that transducers can wrap out of a plain
+    two argument function: finishing off calls `complete` on the result
+    if it was given and otherwise leaves it as it is.
+    '''
+    def step(acc, x=COMPLETE):
+        if x is COMPLETE:
+            return acc if complete is None else complete(acc)
+        return f(acc, x)
+
+    return step
+
+
+def transduce(xform, f, *args):
+    '''
+    (transduce xform f coll) or (transduce xform f init coll): reduce coll
+    with f transformed by xform. Without an init value (f) is used.
+    '''
+    if len(args) == 2:
+        acc, coll = args
+    else:
+        coll, = args
+        acc = f()
+
+    rf = xform(completing(f))
+    for x in coll:
+        acc = rf(acc, x)
+        if type(acc) is Reduced:
+            acc = acc.value
+            break
+
+    return rf(acc)
+
+
+def _append(acc, x):
+    acc.append(x)
+    return acc
+
+
+def _assoc_pair(acc, pair):
+    key, val = pair
+    return acc.assoc(key, val)
+
+
+def into(to, *args):
+    '''
+    (into to coll) or (into to xform coll): a copy of `to` with the
+    elements of coll added on the end, transformed by xform if given.
+    Adding to a dict needs (key value) pairs.
+    '''
+    if len(args) == 2:
+        xform, coll = args
+    else:
+        xform, (coll,) = None, args
+
+    if isinstance(to, PersistentVector):
+        # Built up in place and then frozen
+        add, acc = TransientVector.conj, to.transient()
+    elif isinstance(to, PersistentMap):
+        add, acc = _assoc_pair, to.transient()
+    else:
+        add, acc = _append, []
+
+    if xform is None:
+        for x in coll:
+            acc = add(acc, x)
+    else:
+        acc = transduce(xform, add, acc, coll)
+
+    if isinstance(acc, (TransientVector, TransientMap)):
+        return acc.persistent()
+
+    items = acc
+    if isinstance(to, dict):
+        new = dict(to)
+        new.update(items)
+        return new
+    elif isinstance(to, (set, frozenset)):
+        return type(to)(chain(to, items))
+    elif isinstance(to, tuple):
+        return to + tuple(items)
+    elif isinstance(to, list):
+        return to + list(items)
+
+    return to + LispList(items)
+
+
+def sequence(xform, coll):
+    '''A lazy seq of the elements of coll transformed by xform'''
+    def transducing():
+        buffer = []
+        rf = xform(completing(_append))
+        for x in coll:
+            done = type(rf(buffer, x)) is Reduced
+            yield from buffer
+            buffer.clear()
+            if done:
+                break
+
+        rf(buffer)
+        yield from buffer
+
+    return LazySeq.from_iter(transducing())
+
+
+# Transducers
+def mapping(f):
+    '''Transform each element with (f x)'''
+    def transducer(rf):
+        def step(acc, x=COMPLETE):
+            if x is COMPLETE:
+                return rf(acc)
+            return rf(acc, f(x))
+
+        return step
+
+    return transducer
+
+
+def filtering(pred):
+    '''Keep the elements for which (pred x) is true'''
+    def transducer(rf):
+        def step(acc, x=COMPLETE):
+            if x is COMPLETE:
+                return rf(acc)
+            return rf(acc, x) if pred(x) else acc
+
+        return step
+
+    return transducer
+
+
+def removing(pred):
+    '''Drop the elements for which (pred x) is true'''
+    return filtering(lambda x: not pred(x))
+
+
+def taking(n):
+    '''Stop after the first n elements'''
+    def transducer(rf):
+        left = n
+
+        def step(acc, x=COMPLETE):
+            nonlocal left
+            if x is COMPLETE:
+                return rf(acc)
+
+            left -= 1
+            if left > 0:
+                return rf(acc, x)
+            elif left == 0:
+                return ensure_reduced(rf(acc, x))
+            return ensure_reduced(acc)
+
+        return step
+
+    return transducer
+
+
+def dropping(n):
+    '''Skip over the first n elements'''
+    def transducer(rf):
+        left = n
+
+        def step(acc, x=COMPLETE):
+            nonlocal left
+            if x is COMPLETE:
+                return rf(acc)
+
+            if left > 0:
+                left -= 1
+                return acc
+            return rf(acc, x)
+
+        return step
+
+    return transducer
+
+
+def taking_while(pred):
+    '''Stop at the first element for which (pred x) is false'''
+    def transducer(rf):
+        def step(acc, x=COMPLETE):
+            if x is COMPLETE:
+                return rf(acc)
+            return rf(acc, x) if pred(x) else Reduced(acc)
+
+        return step
+
+    return transducer
+
+
+def dropping_while(pred):
+    '''Skip elements until (pred x) is first false'''
+    def transducer(rf):
+        skipping = True
+
+        def step(acc, x=COMPLETE):
+            nonlocal skipping
+            if x is COMPLETE:
+                return rf(acc)
+
+            if skipping and pred(x):
+                return acc
+            skipping = False
+            return rf(acc, x)
+
+        return step
+
+    return transducer
+
+
+def cat(rf):
+    '''A transducer that passes on each element of each element in turn'''
+    def step(acc, x=COMPLETE):
+        if x is COMPLETE:
+            return rf(acc)
+
+        for y in x:
+            acc = rf(acc, y)
+            if type(acc) is Reduced:
+                # Passed on as it is so that the outer reduction stops too
+                return acc
+        return acc
+
+    return step
+
+
+def mapcat(f):
+    '''Map (f x) over each element and concatenate the results'''
+    def transducer(rf):
+        return mapping(f)(cat(rf))
+
+    return transducer
+
+
+def partition_all(n):
+    '''Group elements into lists of n, with whatever is left at the end'''
+    def transducer(rf):
+        group = []
+
+        def step(acc, x=COMPLETE):
+            if x is COMPLETE:
+                if group:
+                    acc = rf(acc, LispList(group))
+                    group.clear()
+                    if type(acc) is Reduced:
+                        acc = acc.value
+                return rf(acc)
+
+            group.append(x)
+            if len(group) < n:
+                return acc
+
+            full = LispList(group)
+            group.clear()
+            return rf(acc, full)
+
+        return step
+
+    return transducer
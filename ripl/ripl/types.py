@@ -2,61 +2,483 @@
 LISPy types and aliases for existing Python types.
 
 For now, lets keep thigns simple and use builtins for pretty much everything!
-    list -> list   (make singly linked later)
-    vector -> list
+    list -> LispList (immutable, singly linked)
+    vector -> PersistentVector (immutable trie: see ripl.persistent)
+    {...} -> PersistentMap (immutable HAMT: see ripl.persistent)
+    lazy seq -> LazySeq (immutable, realised in chunks on demand)
 
 TODO:
     Set a `_ripl_seq` boolean property (lacking interfaces in Python)
     to mark types that are compatable with `conj` and other sequence
     functions.
 '''
+from itertools import chain, islice, zip_longest
+
 Vector = list
-# Just an alias for now but it may get expanded later
-LispList = list
+
+
+class LispList:
+    '''
+    An immutable singly linked list built out of cons cells.
+
+    Each cell holds its value (car), the rest of the list (cdr) and the
+    length of the list starting from it. Consing on to a list shares the
+    existing cells so cons, car, cdr, len and null? are all O(1).
+
+    LispList(iterable) builds a new list and every LispList is an iterable
+    of its elements so converting to and from Python is one pass.
+    The empty list is the single instance LispList.EMPTY.
+    '''
+    __slots__ = ('car', 'cdr', '_len')
+
+    EMPTY = None
+
+    def __new__(cls, items=()):
+        if isinstance(items, LispList):
+            return items
+
+        if not isinstance(items, (list, tuple)):
+            items = list(items)
+
+        lst = LispList.EMPTY
+        for item in reversed(items):
+            lst = lst.cons(item)
+
+        return lst
+
+    def cons(self, val):
+        '''A new list of `val` followed by this one'''
+        cell = _new_cell(LispList)
+        cell.car = val
+        cell.cdr = self
+        cell._len = self._len + 1
+        return cell
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        cell = self
+        while cell._len:
+            yield cell.car
+            cell = cell.cdr
+
+    def __reversed__(self):
+        return reversed(list(self))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is None and index.stop is None:
+                # Dropping from the front shares the remaining cells
+                start = index.start or 0
+                if start < 0:
+                    start = max(self._len + start, 0)
+                cell = self
+                for _ in range(min(start, self._len)):
+                    cell = cell.cdr
+                return cell
+
+            return LispList(list(self)[index])
+
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('LispList index out of range')
+
+        cell = self
+        for _ in range(index):
+            cell = cell.cdr
+        return cell.car
+
+    def __add__(self, other):
+        if not isinstance(other, (LispList, list, tuple)):
+            return NotImplemented
+
+        if not self._len:
+            return LispList(other)
+
+        # Only the cells of the first list need to be copied
+        lst = LispList(other)
+        for item in reversed(list(self)):
+            lst = lst.cons(item)
+        return lst
+
+    def __radd__(self, other):
+        if not isinstance(other, (list, tuple)):
+            return NotImplemented
+
+        return LispList(other) + self
+
+    def __eq__(self, other):
+        if not isinstance(other, LispList):
+            return NotImplemented
+
+        if self._len != other._len:
+            return False
+
+        a, b = self, other
+        while a._len:
+            if a is b:
+                # Shared tail
+                return True
+            if a.car != b.car:
+                return False
+            a, b = a.cdr, b.cdr
+
+        return True
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        # Rebuild through LispList() rather than filling in a bare cell
+        return (LispList, (list(self),))
+
+    def __repr__(self):
+        return f'({" ".join(map(repr, self))})'
+
+
+_new_cell = object.__new__
+LispList.EMPTY = _new_cell(LispList)
+LispList.EMPTY.car = None
+LispList.EMPTY.cdr = LispList.EMPTY
+LispList.EMPTY._len = 0
+
+
+# How many elements a LazySeq realises at a time
+CHUNK_SIZE = 32
+
+
+class LazySeq:
+    '''
+    An immutable sequence whose elements are only computed when needed.
+
+    A LazySeq starts out with either a thunk that returns something
+    iterable (see the lazy-seq macro) or a Python iterator to pull from.
+    Elements are realised CHUNK_SIZE at a time and then kept, so walking
+    a seq twice runs the underlying computation once. Each node holds a
+    tuple of realised elements, an offset into it (so that cdr can share
+    the chunk) and the node for whatever follows the chunk.
+
+    Anything iterable can be made into a LazySeq with LazySeq.from_iter
+    and every LazySeq is an iterable of its elements, so Python iterators
+    and generators can be streamed through seq functions. Holding on to
+    the head of a seq holds on to everything realised from it: iterating
+    only keeps the current chunk alive.
+    '''
+    __slots__ = ('_chunk', '_i', '_more', '_thunk', '_iter', '_count')
+
+    def __init__(self, thunk):
+        self._chunk = None
+        self._thunk = thunk
+        self._iter = None
+        self._count = None
+
+    @classmethod
+    def from_iter(cls, iterable):
+        '''A seq of the elements of any iterable, realised on demand'''
+        if isinstance(iterable, LazySeq):
+            return iterable
+
+        node = _new_node(cls)
+        node._chunk = node._thunk = node._count = None
+        node._iter = iter(iterable)
+        return node
+
+    @classmethod
+    def _realised(cls, chunk, i, more):
+        node = _new_node(cls)
+        node._chunk = chunk
+        node._i = i
+        node._more = more
+        node._thunk = node._iter = node._count = None
+        return node
+
+    def _realise(self):
+        '''Compute the first chunk of this seq if it isn't already known'''
+        # Thunks can return more unrealised seqs: follow them in a loop
+        # rather than recursing, then share the result with all of them
+        pending = []
+        node = self
+        while node._chunk is None and node._iter is None:
+            pending.append(node)
+            thunk, node._thunk = node._thunk, None
+            value = thunk()
+            if not isinstance(value, LazySeq):
+                node = LazySeq.from_iter(() if value is None else value)
+            else:
+                node = value
+
+        if node._chunk is None:
+            it, node._iter = node._iter, None
+            chunk = tuple(islice(it, CHUNK_SIZE))
+            node._i = 0
+            node._more = (
+                LazySeq.from_iter(it) if len(chunk) == CHUNK_SIZE else None)
+            node._chunk = chunk
+
+        for other in pending:
+            other._chunk, other._i, other._more = (
+                node._chunk, node._i, node._more)
+            other._count = node._count
+
+    def _nodes(self):
+        '''The realised nodes of this seq: one per chunk'''
+        node = self
+        while node is not None:
+            if node._chunk is None:
+                node._realise()
+            yield node
+            node = node._more
+
+    def __iter__(self):
+        node = self
+        # Don't keep the head alive while iterating
+        del self
+        while node is not None:
+            if node._chunk is None:
+                node._realise()
+            chunk, i = node._chunk, node._i
+            if i:
+                yield from islice(chunk, i, None)
+            else:
+                yield from chunk
+            node = node._more
+
+    def __bool__(self):
+        if self._chunk is None:
+            self._realise()
+        return self._i < len(self._chunk)
+
+    def __len__(self):
+        if self._count is None:
+            nodes = list(self._nodes())
+            count = 0
+            for node in reversed(nodes):
+                count += len(node._chunk) - node._i
+                node._count = count
+
+        return self._count
+
+    def first(self):
+        '''The first element of the seq'''
+        if not self:
+            raise IndexError('car of an empty list')
+        return self._chunk[self._i]
+
+    def rest(self):
+        '''Everything after the first element, sharing the chunks'''
+        if not self:
+            return self
+
+        i = self._i + 1
+        if i < len(self._chunk):
+            rest = LazySeq._realised(self._chunk, i, self._more)
+        elif self._more is not None:
+            return self._more
+        else:
+            rest = LazySeq._realised((), 0, None)
+
+        if self._count is not None:
+            rest._count = self._count - 1
+        return rest
+
+    def drop(self, n):
+        '''The seq without its first n elements, skipping whole chunks'''
+        node = self
+        while n > 0 and node:
+            left = len(node._chunk) - node._i
+            if n < left:
+                return LazySeq._realised(
+                    node._chunk, node._i + n, node._more)
+            n -= left
+            if node._more is None:
+                return LazySeq._realised((), 0, None)
+            node = node._more
+
+        return node
+
+    def cons(self, val):
+        '''A new seq of `val` followed by this one'''
+        node = LazySeq._realised((val,), 0, self)
+        if self._count is not None:
+            node._count = self._count + 1
+        return node
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is None and index.stop is None:
+                start = index.start or 0
+                if start < 0:
+                    start = max(len(self) + start, 0)
+                return self.drop(start)
+
+            return LispList(list(self)[index])
+
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            node = self.drop(index)
+            if node:
+                return node._chunk[node._i]
+
+        raise IndexError('LazySeq index out of range')
+
+    def __add__(self, other):
+        if not isinstance(other, (LispList, LazySeq, list, tuple)):
+            return NotImplemented
+
+        return LazySeq.from_iter(chain(self, other))
+
+    def __radd__(self, other):
+        if not isinstance(other, (LispList, list, tuple)):
+            return NotImplemented
+
+        return LazySeq.from_iter(chain(other, self))
+
+    def __eq__(self, other):
+        if not isinstance(other, (LispList, LazySeq)):
+            return NotImplemented
+
+        missing = object()
+        return all(
+            a == b for a, b in zip_longest(self, other, fillvalue=missing))
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __reduce__(self):
+        # Forcing a seq could run for ever: only finished ones are saved
+        node = self
+        while node is not None:
+            if node._chunk is None:
+                raise TypeError("Can't pickle an unrealised LazySeq")
+            node = node._more
+
+        return (LazySeq.from_iter, (tuple(self),))
+
+    def __repr__(self):
+        return f'({" ".join(map(repr, self))})'
+
+
+_new_node = object.__new__
+
+
+class RiplError(Exception):
+    pass
+
+
+def _intern(cls, name):
+    '''Find the canonical instance of cls for name, creating it if needed'''
+    # Drop down to a plain str so that the table is keyed on names
+    name = str.__str__(name)
+    try:
+        return cls._table[name]
+    except KeyError:
+        obj = str.__new__(cls, name)
+        # str caches its own hash: compute it once now
+        hash(obj)
+        # Threads can race to intern the same name: setdefault is atomic
+        # so whichever gets there first is the one that everyone uses
+        return cls._table.setdefault(name, obj)
 
 
 class Symbol(str):
     '''
     Internal representation of symbols
     Symbols can be bound to values using (define Symbol Value)
+
+    Symbols are interned: Symbol(name) always returns the same object for
+    the same name so they can be compared by identity.
     '''
+    __slots__ = ()
+    _table = {}
+
+    def __new__(cls, name):
+        return _intern(cls, name)
+
     def __eq__(self, other):
-        if isinstance(other, Symbol):
-            return super().__eq__(other)
+        return self is other
 
-        return False
+    def __ne__(self, other):
+        return self is not other
+
+    __hash__ = str.__hash__
 
     def __repr__(self):
         # Snip off the quotes for symbols
         return super().__repr__()[1:-1]
 
-    def __hash__(self):
-        return hash(str(self))
-
 
 class Keyword(str):
     '''
     Internal representation of Keywords
     Unlike symbols, keywords can only refer to themselves
         i.e. (define :keyword "foo") is a syntax error
+
+    Keywords are interned in the same way as Symbols.
     '''
+    __slots__ = ()
+    _table = {}
+
+    def __new__(cls, name):
+        return _intern(cls, name)
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return self is not other
+
+    __hash__ = str.__hash__
+
     def __repr__(self):
         return f':{super().__repr__()[1:-1]}'
 
-    def __hash__(self):
-        return hash(self.__repr__())
 
-    def __eq__(self, other):
-        if isinstance(other, Keyword):
-            return super().__eq__(other)
+# Interned symbols for the special forms so that evaluators can
+# check for them by identity.
+QUOTE = Symbol('quote')
+QUASIQUOTE = Symbol('quasiquote')
+UNQUOTE = Symbol('unquote')
+UNQUOTE_SPLICING = Symbol('unquote-splicing')
+IF = Symbol('if')
+COND = Symbol('cond')
+SET = Symbol('set!')
+DEFINE = Symbol('define')
+LAMBDA = Symbol('lambda')
+DEFN = Symbol('defn')
+DEFMACRO = Symbol('defmacro')
+LET = Symbol('let')
+BEGIN = Symbol('begin')
+EVAL = Symbol('eval')
+APPLY = Symbol('apply')
+LOOP = Symbol('loop')
+RECUR = Symbol('recur')
+ASYNC_FN = Symbol('async-fn')
+AWAIT = Symbol('await')
+LAMBDAS = frozenset([LAMBDA, Symbol('λ'), Symbol('fn')])
+UNQUOTES = frozenset([UNQUOTE, UNQUOTE_SPLICING])
+ELSE = Keyword('else')
+
 
-        return False
+def arity_error(params, args):
+    '''The error for calling a procedure with the wrong number of args'''
+    return RiplError(
+        f'Expected {len(params)} arguments, got {len(args)}: {params}')
 
 
 class Procedure:
     '''
     A user-defined Procedure.
     '''
+    # Call counting and compiled code for the JIT: see ripl.jit
+    _jit_calls = 0
+    _jit_code = None
+    _jit_core = None
+    # Run time state that is rebuilt rather than saved: see ripl.image
+    _transient = ('_jit_calls', '_jit_code', '_jit_core')
+
     def __init__(self, params, docstring, body, env, evaluator):
         '''Stash the procedure body for later evaluation'''
         self._params = params
@@ -67,9 +489,35 @@ class Procedure:
 
     def get_call_env(self, args):
         '''Generate the new nested environment'''
-        return self._outer_env.new_child(dict(zip(self._params, args)))
+        params = self._params
+        if isinstance(params, Symbol):
+            # (lambda args body) collects all arguments into `args`
+            return self._outer_env.new_child({params: LispList(args)})
+
+        if len(args) != len(params):
+            raise arity_error(params, args)
+
+        return self._outer_env.new_child(dict(zip(params, args)))
+
+    def set_body(self, body):
+        '''Replace the body, dropping anything compiled from the old one'''
+        self._body = body
+        self._jit_calls = 0
+        self._jit_code = self._jit_core = None
 
     def __call__(self, *args):
         '''Bind the given arguments and evaluate the procedure'''
+        jit = self._evaluator.jit
+        if jit is not None:
+            code = jit.entry(self)
+            if code is not None and len(args) == len(self._params):
+                return code(*args)
+
         env = self.get_call_env(args)
         return self._evaluator.eval(self._body, env)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self._transient:
+            state.pop(name, None)
+        return state
@@ -19,7 +19,7 @@ setup(
         'pytest-runner',
     ],
     tests_require=['pytest'],
-    extras_require={'test': ['pytest']},
+    extras_require={'test': ['pytest'], 'arrays': ['numpy']},
     packages=find_packages(),
     package_dir={'ripl': 'ripl'},
     include_package_data=True,
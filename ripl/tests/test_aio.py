@@ -0,0 +1,119 @@
+'''
+async-fn and await run RIPL code as coroutines on an asyncio loop.
+'''
+import asyncio
+
+import pytest
+
+from ripl.persistent import PersistentVector
+from ripl.types import RiplError, Symbol
+
+
+@pytest.fixture
+def arun(interp):
+    '''Run text on a new event loop, returning the last value'''
+    async def pause(x):
+        await asyncio.sleep(0)
+        return x
+
+    interp.evaluator.global_env[Symbol('pause')] = pause
+
+    async def collect(text):
+        return [result async for result in interp.eval_expr_async(text)]
+
+    def arun(text):
+        *_, result = asyncio.run(collect(text))
+        return result
+    return arun
+
+
+def test_top_level_await(arun):
+    assert arun('(+ 1 (await (pause 2)))') == 3
+
+
+def test_async_fn(arun):
+    assert arun('''
+    (define fetch-both
+      (async-fn (a b)
+        (let ((x (await (pause a))))
+          (+ x (await (pause b))))))
+    (await (fetch-both 1 2))
+    ''') == 3
+
+
+def test_await_in_branches(arun):
+    assert arun('''
+    (define pick (async-fn (x)
+      (cond ((await (pause (= x 0))) :zero)
+            (:else (if (await (pause #t)) :other :never)))))
+    [(await (pick 0)) (await (pick 1))]
+    ''') == arun('[:zero :other]')
+
+
+def test_await_in_a_vector(arun):
+    result = arun('[1 (await (pause 2)) 3]')
+    assert isinstance(result, PersistentVector)
+    assert list(result) == [1, 2, 3]
+
+
+def test_tail_recursion_in_constant_stack(arun):
+    assert arun('''
+    (define count-down (async-fn (n)
+      (if (= n 0)
+          :done
+          (begin (await (pause n)) (await (count-down (- n 1)))))))
+    (await (count-down 5000))
+    ''') == arun(':done')
+
+
+def test_set_global_after_await(arun):
+    assert arun('''
+    (define total 0)
+    (define bump (async-fn ()
+      (let ((n (await (pause 5)))) (set! total n))))
+    (await (bump))
+    total
+    ''') == 5
+
+
+def test_set_parameter_after_await(arun):
+    assert arun('''
+    (define reset (async-fn (x)
+      (begin (let ((y (await (pause 5)))) (set! x y)) x)))
+    (await (reset 1))
+    ''') == 5
+
+
+def test_set_captured_local_after_await(arun):
+    assert arun('''
+    (define make (lambda (n)
+      (async-fn ()
+        (begin (let ((y (await (pause 10)))) (set! n (+ n y))) n))))
+    (await ((make 1)))
+    ''') == 11
+
+
+def test_scripts_interleave(interp):
+    order = []
+
+    async def step(name):
+        order.append(name)
+        await asyncio.sleep(0)
+        return name
+
+    interp.evaluator.global_env[Symbol('step')] = step
+
+    async def script(name):
+        text = f'(begin (await (step {name})) (await (step {name})))'
+        return [r async for r in interp.eval_expr_async(text)]
+
+    async def both():
+        return await asyncio.gather(script(1), script(2))
+
+    assert asyncio.run(both()) == [[1], [2]]
+    assert order == [1, 2, 1, 2]
+
+
+def test_await_outside_async(run):
+    with pytest.raises(RiplError):
+        run('(await 1)')
@@ -0,0 +1,66 @@
+'''
+The variadic arithmetic and comparison builtins, fast paths included.
+'''
+import pytest
+
+from ripl.env import BINARY, STD_OPS
+from ripl.types import Symbol
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('(+)', 0),
+    ('(*)', 1),
+    ('(+ 4)', 4),
+    ('(- 4)', -4),
+    ('(/ 4)', 0.25),
+    ('(+ 1 2)', 3),
+    ('(- 10 1 2 3)', 4),
+    ('(* 1 2 3 4)', 24),
+    ('(/ 12 2 3)', 2),
+    ('(% 7 3)', 1),
+    ('(< 1)', True),
+    ('(< 1 2)', True),
+    ('(< 1 3 2)', False),
+    ('(<= 1 1 2)', True),
+    ('(> 3 2 1)', True),
+    ('(>= 3 3 4)', False),
+    ('(= 2 2 2)', True),
+    ('(= 2 2 3)', False),
+    ('(!= 1 2)', True),
+])
+def test_operators(run, text, expected):
+    assert run(text) == expected
+
+
+def test_two_argument_calls_in_a_procedure(run):
+    run('(defn fib (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))')
+    assert run('(fib 15)') == 610
+
+
+def test_operator_as_a_value(run):
+    assert run('((lambda (f) (f 6 3)) -)') == 3
+    assert run('((lambda (f) (f 6 3 1)) -)') == 2
+
+
+def test_shadowed_operator(run):
+    run('(defn local-plus (+) (+ 2 3))')
+    assert run('(local-plus *)') == 6
+    assert run('(+ 2 3)') == 5
+
+
+def test_rebound_operator(run):
+    run('(defn sum2 (a b) (+ a b))')
+    assert run('(sum2 2 3)') == 5
+    run('(define + *)')
+    assert run('(sum2 2 3)') == 6
+    assert run('(+ 2 3)') == 6
+
+
+def test_no_arguments_without_identity(run):
+    with pytest.raises(TypeError):
+        run('(-)')
+
+
+def test_binary_table():
+    for name in ('+', '-', '*', '/', '%', '<', '>', '<=', '>=', '=', '!='):
+        assert STD_OPS[Symbol(name)] in BINARY
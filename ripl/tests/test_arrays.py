@@ -0,0 +1,66 @@
+'''
+Arrays need numpy: the reductions fall back to plain Python without it.
+'''
+import pytest
+
+from ripl import arrays
+from ripl.types import RiplError
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('(sum [1 2 3])', 6),
+    ('(sum (range 4) 10)', 16),
+    ('(mean [1 2 3 4])', 2.5),
+    ('(min [3 1 2])', 1),
+    ('(max 3 1 2)', 3),
+    ('(dot [1 2 3] [4 5 6])', 32),
+    ('(array? [1 2])', False),
+])
+def test_python_fallbacks(run, text, expected):
+    assert run(text) == expected
+
+
+def test_mismatched_dot(run):
+    with pytest.raises(RiplError):
+        run('(dot [1 2] [1])')
+
+
+def test_no_numpy(run, monkeypatch):
+    monkeypatch.setattr(arrays, 'np', None)
+    with pytest.raises(RiplError):
+        run('(array [1 2 3])')
+
+
+@pytest.fixture
+def np():
+    return pytest.importorskip('numpy')
+
+
+def test_element_wise(np, run):
+    run('(define xs (array [1 -2 3]))')
+    assert run('(array? xs)')
+    assert list(run('(* xs 2)')) == [2, -4, 6]
+    assert list(run('(+ xs xs 1)')) == [3, -3, 7]
+    assert list(run('(< -3 xs 2)')) == [True, True, False]
+
+
+def test_masks(np, run):
+    run('(define xs (array [1 -2 3]))')
+    assert list(run('(mask xs (> xs 0))')) == [1, 3]
+    assert list(run('(where (> xs 0) xs 0)')) == [1, 0, 3]
+
+
+def test_reductions(np, run):
+    run('(define xs (array [1 2 3 4]))')
+    assert run('(sum xs)') == 10
+    assert run('(mean xs)') == 2.5
+    assert run('(min xs)') == 1
+    assert run('(max xs)') == 4
+    assert run('(dot xs xs)') == 30
+
+
+def test_buffers_are_shared(np):
+    data = bytearray(b'\x01\x02\x03')
+    arr = arrays.array(data, 'uint8')
+    data[0] = 9
+    assert arr[0] == 9
@@ -0,0 +1,67 @@
+'''
+The on disk cache of read and macro expanded forms.
+'''
+import os
+
+import pytest
+
+from ripl.cache import FormCache, fingerprint, is_private
+from ripl.interpretor import Interpretor
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'cache'
+    monkeypatch.setenv('RIPL_CACHE_DIR', str(path))
+    return path
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'prog.rpl'
+    path.write_text('(define x 20)\n(defn twice (n) (* 2 n))\n(twice x)\n')
+    return str(path)
+
+
+def test_cache_dir_is_looked_up_when_made(cache_dir):
+    # RIPL_CACHE_DIR is set after ripl was imported
+    assert Interpretor().cache_dir == str(cache_dir)
+
+
+def test_results_are_the_same_from_the_cache(mode, cache_dir, source):
+    first = list(Interpretor(mode=mode).eval_file(source))
+    assert first[-1] == 40
+    assert os.listdir(cache_dir)
+
+    interp = Interpretor(mode=mode)
+    key = interp.cache.key(source, fingerprint(interp.evaluator))
+    assert interp.cache.load(source, key) is not None
+    assert list(interp.eval_file(source)) == first
+
+
+def test_cache_dir_is_private(cache_dir, source):
+    list(Interpretor().eval_file(source))
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+
+
+def test_editing_the_source_is_a_miss(cache_dir, source):
+    list(Interpretor().eval_file(source))
+
+    with open(source, 'a') as f:
+        f.write('(+ x 1)\n')
+
+    assert list(Interpretor().eval_file(source))[-1] == 21
+
+
+def test_shared_directories_are_never_loaded_from(tmp_path, source):
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    assert not is_private(str(shared))
+
+    cache = FormCache(str(shared))
+    with cache.writer(source, 'key') as writer:
+        writer.add(1)
+
+    assert os.listdir(shared) == []
+    assert cache.load(source, 'key') is None
@@ -0,0 +1,48 @@
+'''
+The stack machine runs non tail recursive code without the Python stack.
+'''
+import sys
+
+import pytest
+
+from ripl.interpretor import Interpretor
+
+
+@pytest.fixture
+def interp():
+    return Interpretor(mode='cek', cache=False)
+
+
+DEPTH = sys.getrecursionlimit() * 10
+
+
+def test_deep_non_tail_recursion(run):
+    run('(defn sum-to (n) (if (= n 0) 0 (+ n (sum-to (- n 1)))))')
+    assert run(f'(sum-to {DEPTH})') == DEPTH * (DEPTH + 1) // 2
+
+
+def test_deep_mutual_recursion(run):
+    run('''
+    (defn depth-a (n) (if (= n 0) 0 (+ 1 (depth-b (- n 1)))))
+    (defn depth-b (n) (if (= n 0) 0 (+ 1 (depth-a (- n 1)))))
+    ''')
+    assert run(f'(depth-a {DEPTH})') == DEPTH
+
+
+def test_deep_recursion_in_if_test(run):
+    run('(defn all-zero (n) (if (if (= n 0) #t (all-zero (- n 1))) #t #f))')
+    assert run(f'(all-zero {DEPTH})') is True
+
+
+def test_deep_recursion_through_the_prelude(run_prelude):
+    run_prelude("(defn build (n) (if (= n 0) '() (cons n (build (- n 1)))))")
+    assert run_prelude(f'(foldl + 0 (build {DEPTH}))') == \
+        DEPTH * (DEPTH + 1) // 2
+
+
+def test_walk_mode_runs_out_of_stack():
+    walk = Interpretor(mode='walk', cache=False)
+    list(walk.eval_expr(
+        '(defn sum-to (n) (if (= n 0) 0 (+ n (sum-to (- n 1)))))'))
+    with pytest.raises(RecursionError):
+        list(walk.eval_expr(f'(sum-to {DEPTH})'))
@@ -0,0 +1,117 @@
+'''
+Go blocks park on channels and hand values to each other.
+'''
+import pytest
+
+from ripl.channels import Channel
+from ripl.types import RiplError
+
+
+def test_go_result(run_prelude):
+    assert run_prelude('(<!! (go (* 6 7)))') == 42
+
+
+def test_unbuffered_hand_off(run_prelude):
+    run_prelude('(define c (chan))')
+    run_prelude('(go (>! c 42))')
+    assert run_prelude('(<!! c)') == 42
+
+
+def test_ping_pong(run_prelude):
+    run_prelude('''
+    (define ping (chan))
+    (define pong (chan))
+    (go (loop ((n (<! ping)))
+          (if (= n 0)
+              (close! pong)
+              (begin (>! pong n) (recur (<! ping))))))
+    ''')
+    results = []
+    for n in (3, 2, 1):
+        run_prelude(f'(>!! ping {n})')
+        results.append(run_prelude('(<!! pong)'))
+    run_prelude('(>!! ping 0)')
+    assert results == [3, 2, 1]
+    assert run_prelude('(<!! pong)') is None
+
+
+def test_buffered(run_prelude):
+    run_prelude('(define c (chan 2))')
+    run_prelude('(>!! c 1)')
+    run_prelude('(>!! c 2)')
+    assert [run_prelude('(<!! c)') for _ in range(2)] == [1, 2]
+
+
+def test_closed_channel(run_prelude):
+    run_prelude('(define c (chan 1))')
+    run_prelude('(close! c)')
+    assert run_prelude('(<!! c)') is None
+    assert run_prelude('(>!! c 1)') is False
+
+
+def test_alts(run_prelude):
+    run_prelude('(define a (chan))')
+    run_prelude('(define b (chan 1))')
+    run_prelude('(>!! b :b)')
+    value, chan = run_prelude('(alts!! [a b])')
+    assert value == run_prelude(':b')
+    assert chan is run_prelude('b')
+
+
+def test_alts_put(run_prelude):
+    run_prelude('(define a (chan 1))')
+    run_prelude('(alts!! [[a 5]])')
+    assert run_prelude('(<!! a)') == 5
+
+
+def test_many_tasks(run_prelude):
+    run_prelude('(define out (chan))')
+    run_prelude('''
+    (loop ((i 0)) (if (< i 1000) (begin (go (>! out i)) (recur (+ i 1)))))
+    ''')
+    assert sorted(run_prelude('(<!! out)') for _ in range(1000)) \
+        == list(range(1000))
+
+
+def test_errors_reach_the_taker(run_prelude):
+    with pytest.raises(IndexError):
+        run_prelude("(<!! (go (car '())))")
+
+
+def test_thread_call(run_prelude):
+    assert run_prelude('(<!! (go (<! (thread-call + 1 2))))') == 3
+
+
+def test_deadlock(run_prelude):
+    run_prelude('(define c (chan))')
+    with pytest.raises(RiplError):
+        run_prelude('(<!! c)')
+
+
+def test_no_nil_values(run_prelude):
+    with pytest.raises(RiplError):
+        run_prelude('(>!! (chan 1) (if #f #f))')
+
+
+def test_chan_predicate(run):
+    assert run('(chan? (chan))')
+    assert isinstance(run('(chan 3)'), Channel)
+
+
+def test_alts_leaves_no_handles_behind(run_prelude):
+    run_prelude('''
+    (define data (chan))
+    (define never (chan))
+    (go (loop ((i 0))
+          (if (< i 1000)
+              (begin (alts [data never]) (recur (+ i 1))))))
+    (loop ((i 0)) (if (< i 1000) (begin (>!! data i) (recur (+ i 1)))))
+    ''')
+    assert not run_prelude('never').takers
+
+
+def test_deadlock_leaves_no_handles_behind(run_prelude):
+    run_prelude('(define c (chan))')
+    with pytest.raises(RiplError):
+        run_prelude('(<!! c)')
+    assert not run_prelude('c').takers
@@ -0,0 +1,94 @@
+'''
+Clones of an interpretor share its definitions and never see each other's.
+'''
+import pytest
+
+from ripl.pool import InterpretorPool
+from ripl.types import RiplError
+
+
+@pytest.fixture
+def template(prelude):
+    list(prelude.eval_expr('''
+        (define counter 0)
+        (defn bump () (set! counter (+ counter 1)))
+        (defn double (x) (* 2 x))
+    '''))
+    return prelude
+
+
+def last(interp, text):
+    *_, result = interp.eval_expr(text)
+    return result
+
+
+def test_clones_share_the_base(template):
+    a, b = template.clone(), template.clone()
+    assert last(a, '(double 4)') == 8
+    assert last(b, '(unless #f 1)') == 1
+
+
+def test_definitions_are_private(template):
+    a, b = template.clone(), template.clone()
+    last(a, '(define secret 42)')
+    assert last(a, 'secret') == 42
+    with pytest.raises(RiplError):
+        last(b, 'secret')
+
+
+def test_set_of_a_base_global_stays_in_the_clone(template):
+    a, b = template.clone(), template.clone()
+    last(a, '(set! counter 10)')
+    assert last(a, 'counter') == 10
+    assert last(b, 'counter') == 0
+
+
+def test_base_procedure_cant_write_the_shared_layer(template):
+    a, b = template.clone(), template.clone()
+    for clone in (a, b):
+        with pytest.raises(RiplError):
+            last(clone, '(bump)')
+
+    assert last(a, 'counter') == 0
+    assert last(b, 'counter') == 0
+
+
+def test_base_cant_define_once_cloned(template):
+    template.clone()
+    with pytest.raises(RiplError):
+        last(template, '(define late 1)')
+    with pytest.raises(RiplError):
+        last(template, '(defmacro late-macro (x) x)')
+
+
+def test_reset_forgets_private_definitions(template):
+    a = template.clone()
+    last(a, '(define secret 42)')
+    last(a, '(defmacro twice (x) (list (quote +) x x))')
+    assert last(a, '(twice 2)') == 4
+
+    a.reset()
+    with pytest.raises(RiplError):
+        last(a, 'secret')
+    assert last(a, 'counter') == 0
+
+
+def test_clone_of_a_clone(template):
+    a = template.clone()
+    last(a, '(define level 1)')
+    b = a.clone()
+    assert last(b, 'level') == 1
+    last(b, '(define deeper 2)')
+    with pytest.raises(RiplError):
+        last(a, 'deeper')
+
+
+def test_pool_hands_out_clean_interpretors(template):
+    pool = InterpretorPool(template, size=1)
+    with pool.interpretor() as interp:
+        last(interp, '(define scratch 1)')
+
+    with pool.interpretor() as interp:
+        with pytest.raises(RiplError):
+            last(interp, 'scratch')
+        assert last(interp, '(double 5)') == 10
@@ -0,0 +1,65 @@
+'''
+Running files and streams one top level form at a time.
+'''
+import io
+
+import pytest
+
+from ripl.types import RiplError
+
+
+@pytest.fixture
+def write(tmp_path):
+    def write(text, name='prog.rpl'):
+        path = tmp_path / name
+        path.write_text(text)
+        return str(path)
+
+    return write
+
+
+def test_slurp_defines_everything(interp, run, write):
+    interp.slurp(write('(define a 1)\n(defn inc (x) (+ x 1))\n'))
+    assert run('(inc a)') == 2
+
+
+def test_eval_file_yields_each_result(interp, write):
+    results = interp.eval_file(write('1\n"two"\n(+ 1 2)\n'))
+    assert list(results) == [1, 'two', 3]
+
+
+def test_forms_run_before_the_rest_is_read(interp, write):
+    # The syntax error is only found once the first form has run
+    results = interp.eval_file(write('(define early 1)\n(oops'))
+    assert next(results) is None
+    with pytest.raises(SyntaxError):
+        next(results)
+    assert list(interp.eval_expr('early')) == [1]
+
+
+def test_later_forms_see_earlier_macros(interp, write):
+    path = write('(defmacro twice (x) `(+ ~x ~x))\n(twice 4)\n')
+    assert list(interp.eval_file(path))[-1] == 8
+
+
+def test_empty_file(interp, write):
+    assert list(interp.eval_file(write(''))) == []
+
+
+def test_only_rpl_files(interp, write):
+    with pytest.raises(NameError):
+        interp.slurp(write('1', name='prog.txt'))
+
+
+def test_errors_stop_the_file(interp, write):
+    with pytest.raises(RiplError):
+        interp.slurp(write('(define x 1)\n(undefined)\n(define y 2)\n'))
+
+    assert list(interp.eval_expr('x')) == [1]
+    with pytest.raises(RiplError):
+        list(interp.eval_expr('y'))
+
+
+def test_eval_stream(interp):
+    stream = io.StringIO('(define s "multi\nline")\n(len s)\n')
+    assert list(interp.eval_stream(stream)) == [None, 10]
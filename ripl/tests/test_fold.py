@@ -0,0 +1,124 @@
+'''
+Constant folding must never change what a program does.
+'''
+import pytest
+
+from ripl.fold import _symbols
+from ripl.interpretor import Interpretor
+from ripl.types import LispList, Symbol
+
+
+@pytest.fixture
+def interp(mode):
+    return Interpretor(mode=mode, cache=False, fold=True)
+
+
+def test_folds_pure_calls(interp, run):
+    assert run('(+ 1 2 3)') == 6
+    assert any(after == 6 for _, after in interp.folder.changes)
+
+
+def test_drops_dead_branches(interp, run):
+    assert run('(if (< 1 2) "yes" (undefined))') == 'yes'
+
+
+def test_let_literals(run):
+    assert run('(let ((a 2) (b 3)) (* a b))') == 6
+
+
+def test_rebinding_a_builtin_after_defn(run):
+    # Folding (+ 1 2) into the body would leave (f) returning 3
+    run('(defn f () (+ 1 2))')
+    run('(define + -)')
+    assert run('(f)') == -1
+
+
+def test_rebinding_a_builtin_used_by_a_lambda(run):
+    run('(define g (lambda (x) (* 2 3 x)))')
+    run('(define * +)')
+    assert run('(g 1)') == 6
+
+
+def test_set_global_constant_after_defn(run):
+    run('(define rate 2)')
+    run('(defn scale (x) (* rate x))')
+    run('(set! rate 5)')
+    assert run('(scale 3)') == 15
+
+
+def test_constants_in_the_same_batch(run):
+    assert run('(define n 4) (+ n 1)') == 5
+
+
+def test_shadowed_builtin(run):
+    assert run('(let ((+ -)) (+ 5 3))') == 2
+
+
+def body(interp, name):
+    return interp.evaluator.global_env[Symbol(name)]._body
+
+
+def test_folds_top_level_procedure_bodies(interp, run):
+    run('(define rate 4)')
+    run('(defn cost (x) (* x (+ rate 1 2)))')
+    assert body(interp, 'cost') == LispList([Symbol('*'), Symbol('x'), 7])
+    assert run('(cost 2)') == 14
+
+
+def test_folds_define_lambda_bodies(interp, run):
+    run('(define square-sum (lambda () (+ (* 2 2) (* 3 3))))')
+    assert body(interp, 'square-sum') == 13
+    assert run('(square-sum)') == 13
+
+
+def test_rebinding_restores_folded_bodies(interp, run):
+    run('(define rate 4)')
+    run('(defn cost (x) (* x (+ rate 1)))')
+    assert run('(cost 2)') == 10
+    run('(set! rate 9)')
+    assert Symbol('rate') in _symbols(body(interp, 'cost'))
+    assert run('(cost 2)') == 20
+    run('(define + *)')
+    assert run('(cost 2)') == 18
+
+
+def test_rebinding_restores_promoted_bodies(mode):
+    interp = Interpretor(mode=mode, cache=False, fold=True, jit=2)
+
+    def run(text):
+        *_, result = interp.eval_expr(text)
+        return result
+
+    run('(define rate 4)')
+    run('(defn cost (x) (* x rate))')
+    assert [run('(cost 2)') for _ in range(3)] == [8, 8, 8]
+    run('(set! rate 5)')
+    assert [run('(cost 2)') for _ in range(3)] == [10, 10, 10]
+
+
+def test_nested_procedures_look_globals_up(interp, run):
+    run('(define rate 4)')
+    run('(defn make () (lambda (x) (* x rate)))')
+    run('(define times-rate (make))')
+    run('(set! rate 5)')
+    assert run('(times-rate 2)') == 10
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("(define x 5) (eval '(set! x 10)) x", 10),
+    ("(define x 5) (eval '(set! x 10)) (+ x 1)", 11),
+    ("(define x 5) (begin (eval '(set! x 10)) x)", 10),
+])
+def test_rebinding_through_eval(run, text, expected):
+    assert run(text) == expected
+
+
+def test_rebinding_through_eval_in_a_later_batch(run):
+    run('(define x 5)')
+    assert run("(begin (eval '(set! x 10)) x)") == 10
+
+
+def test_rebinding_through_eval_in_a_procedure(run):
+    run('(define x 5)')
+    run("(defn change () (eval '(set! x 10)))")
+    assert run('(begin (change) (+ x 1))') == 11
@@ -0,0 +1,70 @@
+'''
+Futures run on a shared thread pool and hand back results and errors.
+'''
+import threading
+
+import pytest
+
+from ripl.types import LispList, Symbol
+
+
+def test_future_and_deref(run_prelude):
+    run_prelude('(define f (future (+ 1 2)))')
+    assert run_prelude('(future? f)')
+    assert run_prelude('(deref f)') == 3
+    assert run_prelude('(realised? f)')
+
+
+def test_future_call(run):
+    assert run('(deref (future-call + 1 2 3))') == 6
+
+
+def test_future_all(run_prelude):
+    assert run_prelude('''
+    (future-all (map (lambda (x) (future (* x x))) (range 5)))
+    ''') == LispList([0, 1, 4, 9, 16])
+
+
+def test_deref_timeout(interp, run_prelude):
+    release = threading.Event()
+    interp.evaluator.global_env[Symbol('wait-for-release')] = release.wait
+    run_prelude('(define f (future (wait-for-release)))')
+    try:
+        assert run_prelude('(deref f 10 :late)') == run_prelude(':late')
+        assert not run_prelude('(realised? f)')
+    finally:
+        release.set()
+    assert run_prelude('(deref f)') is True
+
+
+def test_errors_are_raised_by_deref(run_prelude):
+    run_prelude('(define f (future (car (quote ()))))')
+    with pytest.raises(IndexError):
+        run_prelude('(deref f)')
+
+
+def test_future_all_fails_fast(interp, run_prelude):
+    release = threading.Event()
+    interp.evaluator.global_env[Symbol('wait-for-release')] = release.wait
+    try:
+        with pytest.raises(IndexError):
+            run_prelude('''
+            (future-all [(future (wait-for-release))
+                         (future (car (quote ())))])
+            ''')
+    finally:
+        release.set()
+
+
+def test_set_globals_from_futures(run_prelude):
+    run_prelude('(define from-a 0)')
+    run_prelude('(define from-b 0)')
+    run_prelude('''
+    (future-all [(future (set! from-a 1)) (future (set! from-b 2))])
+    ''')
+    assert run_prelude('(+ from-a from-b)') == 3
+
+
+def test_deref_needs_a_future(run):
+    with pytest.raises(TypeError):
+        run('(deref 1)')
@@ -0,0 +1,69 @@
+'''
+Cached lookups of globals always see the latest binding.
+'''
+import pytest
+
+from ripl.env import Env
+from ripl.types import Symbol, RiplError
+
+
+def test_shadowed_builtin_is_seen(run):
+    run('(defn total (a b) (+ a b))')
+    assert run('(total 5 3)') == 8
+    run('(define + -)')
+    assert run('(total 5 3)') == 2
+
+
+def test_set_is_seen(run):
+    run('(define rate 2)')
+    run('(defn charge (x) (* rate x))')
+    assert run('(charge 5)') == 10
+    run('(set! rate 4)')
+    assert run('(charge 5)') == 20
+
+
+def test_redefined_procedure_is_seen(run):
+    run('(defn helper (x) (+ x 1))')
+    run('(defn caller (x) (helper x))')
+    assert run('(caller 1)') == 2
+    run('(set! helper (lambda (x) (- x 1)))')
+    assert run('(caller 1)') == 0
+
+
+def test_missing_name_defined_later(run):
+    run('(defn use-later () later)')
+    with pytest.raises(RiplError):
+        run('(use-later)')
+    run('(define later 7)')
+    assert run('(use-later)') == 7
+
+
+def test_reset_forgets_cached_globals(interp, run):
+    run('(define gone 1)')
+    run('(defn get-gone () gone)')
+    assert run('(get-gone)') == 1
+    interp.reset()
+    run('(defn get-gone () gone)')
+    with pytest.raises(RiplError):
+        run('(get-gone)')
+
+
+def test_local_shadows_global(run):
+    run('(define x 1)')
+    run('(defn shadow (x) x)')
+    assert run('(shadow 2)') == 2
+    assert run('x') == 1
+
+
+def test_every_write_moves_the_version_on():
+    env = Env({})
+    versions = [env.version]
+    env[Symbol('a')] = 1
+    versions.append(env.version)
+    env.update({Symbol('b'): 2})
+    versions.append(env.version)
+    del env[Symbol('a')]
+    versions.append(env.version)
+    env.changed()
+    versions.append(env.version)
+    assert len(set(versions)) == len(versions)
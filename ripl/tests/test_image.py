@@ -0,0 +1,75 @@
+'''
+Saving an interpretor to an image and booting from it.
+'''
+import pytest
+
+from ripl.interpretor import Interpretor
+from ripl.types import Symbol, RiplError
+
+
+def last(interp, text):
+    *_, result = interp.eval_expr(text)
+    return result
+
+
+@pytest.fixture
+def image(prelude, tmp_path):
+    list(prelude.eval_expr('''
+        (define base 10)
+        (defn add-base (x) (+ x base))
+        (define plus +)
+        (define counter (let ((n 0)) (lambda () (begin (set! n (+ n 1)) n))))
+        (defmacro swap-args (f a b) `(~f ~b ~a))
+    '''))
+    path = str(tmp_path / 'boot.img')
+    assert prelude.save_image(path) == []
+    return path
+
+
+def test_boot_from_an_image(mode, image):
+    interp = Interpretor(mode=mode, cache=False, image=image)
+    assert last(interp, '(add-base 5)') == 15
+    assert last(interp, '(swap-args - 1 10)') == 9
+    assert last(interp, '(unless #f "prelude")') == 'prelude'
+
+
+def test_closures_keep_their_state(mode, image):
+    interp = Interpretor(mode=mode, cache=False, image=image)
+    assert [last(interp, '(counter)') for _ in range(2)] == [1, 2]
+
+
+def test_builtins_are_stored_by_reference(mode, image):
+    interp = Interpretor(mode=mode, cache=False, image=image)
+    assert last(interp, 'plus') is interp.evaluator.builtins[Symbol('+')]
+
+
+def test_booted_images_are_independent(mode, image):
+    a = Interpretor(mode=mode, cache=False, image=image)
+    b = Interpretor(mode=mode, cache=False, image=image)
+    last(a, '(set! base 100)')
+    assert last(a, '(add-base 1)') == 101
+    assert last(b, '(add-base 1)') == 11
+
+
+def test_unpicklable_globals_are_skipped(interp, tmp_path):
+    list(interp.eval_expr('(define gen (iter [1 2])) (define ok 1)'))
+    path = str(tmp_path / 'partial.img')
+    assert [str(name) for name in interp.save_image(path)] == ['gen']
+
+    booted = Interpretor(mode=interp.evaluator.mode, cache=False, image=path)
+    assert last(booted, 'ok') == 1
+
+
+def test_mode_must_match(image):
+    # The fixture's image is saved in each mode: pick a different one
+    saved = Interpretor(cache=False, image=image).evaluator.mode
+    other = 'cek' if saved != 'cek' else 'walk'
+    with pytest.raises(RiplError):
+        Interpretor(mode=other, cache=False, image=image)
+
+
+def test_not_an_image(tmp_path):
+    path = tmp_path / 'junk.img'
+    path.write_bytes(b'not a pickle')
+    with pytest.raises(RiplError):
+        Interpretor(cache=False, image=str(path))
@@ -0,0 +1,95 @@
+'''
+Hot procedures are compiled to Python and give the same results.
+'''
+import os
+
+import pytest
+
+from ripl.interpretor import Interpretor
+from ripl.types import Symbol
+
+
+@pytest.fixture(params=['walk', 'closure'])
+def interp(request):
+    # cek mode never promotes anything: see JIT.eligible
+    return Interpretor(mode=request.param, cache=False, jit=3)
+
+
+def proc(interp, name):
+    return interp.evaluator.global_env[Symbol(name)]
+
+
+def promoted(interp, name):
+    p = proc(interp, name)
+    code = p._jit_code or getattr(p, '_code', None)
+    return code is not None and code.__code__.co_filename == '<ripl-jit>'
+
+
+def test_promoted_after_threshold(interp, run):
+    run('(defn poly (x) (+ (* x x) (* 2 x) 1))')
+    results = [run(f'(poly {i})') for i in range(6)]
+    assert results == [i * i + 2 * i + 1 for i in range(6)]
+    assert promoted(interp, 'poly')
+
+
+def test_self_tail_calls_become_a_loop(interp, run):
+    run('''
+    (defn count-to (n acc)
+      (if (= n 0) acc (count-to (- n 1) (+ acc 1))))
+    ''')
+    for _ in range(3):
+        run('(count-to 3 0)')
+    assert promoted(interp, 'count-to')
+    assert run('(count-to 100000 0)') == 100000
+
+
+def test_rebinding_a_dependency_demotes(interp, run):
+    run('(defn plus2 (x) (+ x 2))')
+    for _ in range(4):
+        assert run('(plus2 1)') == 3
+    assert promoted(interp, 'plus2')
+
+    run('(define + -)')
+    assert not promoted(interp, 'plus2')
+    assert run('(plus2 1)') == -1
+
+
+def test_redefined_global_is_seen(interp, run):
+    run('(define scale 2)')
+    run('(defn scaled (x) (* scale x))')
+    for _ in range(4):
+        run('(scaled 1)')
+    run('(set! scale 10)')
+    assert run('(scaled 1)') == 10
+
+
+def test_unsupported_forms_stay_interpreted(interp, run):
+    run('(defn make-adder (n) (lambda (x) (+ x n)))')
+    for _ in range(5):
+        assert run('((make-adder 1) 2)') == 3
+    assert not promoted(interp, 'make-adder')
+
+
+def test_cond_and_let(interp, run):
+    run('''
+    (defn classify (n)
+      (let ((m (% n 3)))
+        (cond ((= m 0) "fizz") ((= m 1) "one") (:else "other"))))
+    ''')
+    assert [run(f'(classify {i})') for i in range(6)] == [
+        'fizz', 'one', 'other'] * 2
+    assert promoted(interp, 'classify')
+
+
+def test_cek_never_promotes():
+    interp = Interpretor(mode='cek', cache=False, jit=1)
+    *_, result = interp.eval_expr('(defn sq (x) (* x x)) (sq 2) (sq 3)')
+    assert result == 9
+    assert not promoted(interp, 'sq')
+
+
+def test_compiled_code_is_cached_on_disk(tmp_path, monkeypatch):
+    monkeypatch.setenv('RIPL_CACHE_DIR', str(tmp_path))
+    interp = Interpretor(mode='closure', jit=2)
+    list(interp.eval_expr('(defn sq (x) (* x x)) (sq 1) (sq 2) (sq 3)'))
+    assert any(name.startswith('jit-') for name in os.listdir(tmp_path))
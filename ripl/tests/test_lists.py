@@ -0,0 +1,77 @@
+'''
+LispList: immutable lists of cons cells, and the builtins that use them.
+'''
+import pickle
+
+import pytest
+
+from ripl.types import LispList
+
+
+def test_round_trip():
+    assert list(LispList([1, 2, 3])) == [1, 2, 3]
+    assert LispList(range(3)) == LispList([0, 1, 2])
+
+
+def test_cdr_and_drop_share_cells():
+    lst = LispList([1, 2, 3, 4])
+    assert lst.cdr.cdr is lst[2:]
+    assert lst[-1:] == LispList([4])
+
+
+def test_indexing():
+    lst = LispList('abc')
+    assert lst[0] == 'a' and lst[-1] == 'c'
+    assert lst[0:2] == LispList('ab')
+    with pytest.raises(IndexError):
+        lst[3]
+
+
+def test_add_copies_only_the_first_list():
+    a, b = LispList([1, 2]), LispList([3, 4])
+    joined = a + b
+    assert joined == LispList([1, 2, 3, 4])
+    assert joined[2:] is b
+
+
+def test_equality_and_hashing():
+    assert LispList([1, 2]) == LispList([1, 2])
+    assert LispList([1, 2]) != LispList([1, 3])
+    assert len({LispList([1, 2]), LispList([1, 2])}) == 1
+
+
+def test_pickle():
+    lst = LispList([1, LispList([2])])
+    assert pickle.loads(pickle.dumps(lst)) == lst
+    assert pickle.loads(pickle.dumps(LispList.EMPTY)) == LispList.EMPTY
+
+
+def test_long_lists_dont_recurse():
+    lst = LispList(range(100000))
+    assert len(lst) == 100000
+    assert lst == LispList(range(100000))
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("(cons 1 '(2 3))", LispList([1, 2, 3])),
+    ("(car '(1 2 3))", 1),
+    ("(cdr '(1 2 3))", LispList([2, 3])),
+    ("(cdr '())", LispList.EMPTY),
+    ("(append '(1) '(2 3))", LispList([1, 2, 3])),
+    ("(null? '())", True),
+    ("(null? '(1))", False),
+    ("(len '(1 2 3))", 3),
+])
+def test_builtins(run, text, expected):
+    assert run(text) == expected
+
+
+def test_car_of_empty_list(run):
+    with pytest.raises(IndexError):
+        run("(car '())")
+
+
+def test_prelude_list_functions(run_prelude):
+    assert run_prelude("(reverse '(1 2 3))") == LispList([3, 2, 1])
+    assert run_prelude("(foldl + 0 '(1 2 3 4))") == 10
+    assert run_prelude("(last '(1 2 3))") == 3
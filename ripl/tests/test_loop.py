@@ -0,0 +1,75 @@
+'''
+loop/recur rebinds its names in place and checks every recur up front.
+'''
+import pytest
+
+from ripl.types import LispList, RiplError
+
+
+def test_count(run):
+    assert run('(loop ((i 0)) (if (= i 100000) i (recur (+ i 1))))') == 100000
+
+
+def test_recur_through_cond_and_let(run):
+    assert run('''
+    (loop ((n 10) (acc '()))
+      (cond ((= n 0) acc)
+            (:else (let ((m (- n 1))) (recur m (cons n acc))))))
+    ''') == LispList(range(1, 11))
+
+
+def test_loop_in_a_procedure(run):
+    run('''
+    (defn fact (n)
+      (loop ((i n) (acc 1)) (if (= i 0) acc (recur (- i 1) (* acc i)))))
+    ''')
+    assert run('(fact 20)') == 2432902008176640000
+
+
+def test_inner_loop_is_recurred_to(run):
+    assert run('''
+    (loop ((i 0) (total 0))
+      (if (= i 3)
+          total
+          (recur (+ i 1)
+                 (+ total (loop ((j 0)) (if (= j 5) j (recur (+ j 1))))))))
+    ''') == 15
+
+
+def test_closures_keep_their_iteration(run):
+    # Each time round gets its own bindings for procedures to close over
+    assert run('''
+    (map (lambda (f) (f))
+         (loop ((i 0) (fs '()))
+           (if (= i 3) fs (recur (+ i 1) (cons (lambda () i) fs)))))
+    ''') == LispList([2, 1, 0])
+
+
+def test_closures_keep_their_iteration_under_let(run):
+    assert run('''
+    (map (lambda (f) (f))
+         (loop ((i 0) (fs '()))
+           (if (= i 3)
+               fs
+               (let ((j (+ i 1))) (recur j (cons (lambda () i) fs))))))
+    ''') == LispList([2, 1, 0])
+
+
+@pytest.mark.parametrize('text', [
+    '(loop ((i 0)) (+ 1 (recur i)))',
+    '(loop ((i 0)) (if (recur i) 1 2))',
+    '(loop ((i 0)) (begin (recur i) 1))',
+    '(loop ((i 0)) (recur i 1))',
+    '(loop ((i 0)) (lambda () (recur i)))',
+    '(recur 1)',
+])
+def test_bad_recur(run, text):
+    with pytest.raises(RiplError):
+        run(text)
+
+
+def test_bad_recur_is_caught_before_running(run):
+    run('(define ran 0)')
+    with pytest.raises(RiplError):
+        run('(loop ((i 0)) (begin (set! ran 1) (+ 1 (recur i))))')
+    assert run('ran') == 0
@@ -0,0 +1,63 @@
+'''
+Macros are expanded once per call site, however often it runs.
+'''
+import pytest
+
+from ripl.interpretor import Interpretor
+from ripl.types import RiplError
+
+
+COUNTED = '''
+(define expansions 0)
+(defmacro counted (x)
+  (begin
+    (set! expansions (+ expansions 1))
+    x))
+'''
+
+
+def test_each_call_site_expands_once(run):
+    run(COUNTED)
+    run('(defn f (a) (counted (* a 2)))')
+    assert [run(f'(f {i})') for i in range(5)] == [0, 2, 4, 6, 8]
+    assert run('expansions') == 1
+
+
+def test_separate_call_sites(run):
+    run(COUNTED)
+    run('(defn g (a) (+ (counted a) (counted 1)))')
+    for _ in range(3):
+        run('(g 1)')
+    assert run('expansions') == 2
+
+
+def test_expansion_in_a_loop(run):
+    run(COUNTED)
+    assert run('''
+    (loop ((i 0) (acc 0))
+      (if (= i 10) acc (recur (+ i 1) (+ acc (counted i)))))
+    ''') == 45
+    assert run('expansions') == 1
+
+
+def test_expand_up_front(mode):
+    interp = Interpretor(mode=mode, cache=False, expand=True)
+    list(interp.eval_expr(COUNTED))
+    *_, result = interp.eval_expr('(defn h (a) (counted a)) (h 3) (h 4)')
+    assert result == 4
+    assert list(interp.eval_expr('expansions')) == [1]
+
+
+def test_expansion_cache_is_bounded(interp, run):
+    interp.evaluator.max_expansions = 8
+    run('(defmacro ident (x) x)')
+    for i in range(20):
+        assert run(f'(eval (cons (quote ident) (cons {i} (quote ()))))') == i
+    assert len(interp.evaluator._expansions) <= 8
+
+
+def test_macros_cant_be_redefined(run):
+    run('(defmacro once (x) x)')
+    with pytest.raises(RiplError):
+        run('(defmacro once (x) x)')
+
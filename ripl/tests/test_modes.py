@@ -0,0 +1,126 @@
+'''
+Every evaluation mode should give the same result for the same program.
+'''
+import pytest
+
+from ripl.types import Keyword, LispList, Symbol, RiplError
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('1', 1),
+    ('-2.5', -2.5),
+    ('1+2j', 1+2j),
+    ('#t', True),
+    ('#f', False),
+    ('"abc"', 'abc'),
+    ('""', ''),
+    (':key', Keyword('key')),
+    ('()', LispList.EMPTY),
+])
+def test_literals(run, text, expected):
+    result = run(text)
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+def test_string_is_not_a_symbol(run):
+    result = run('"car"')
+    assert result == 'car'
+    assert not isinstance(result, Symbol)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ("'x", Symbol('x')),
+    ("'(1 x)", LispList([1, Symbol('x')])),
+    ('(+ 1 2 3)', 6),
+    ('(- 5)', -5),
+    ('(< 1 2 3)', True),
+    ('(if #f 1 2)', 2),
+    ('(if #f 1)', None),
+    ('(cond (#f 1) (:else 2))', 2),
+    ('(let ((a 1) (b 2)) (+ a b))', 3),
+    ('(begin 1 2 3)', 3),
+    ('((lambda (x y) (* x y)) 3 4)', 12),
+    ('((if #t + -) 5 3)', 8),
+    ("(eval '(+ 1 2))", 3),
+    ('(loop ((i 0) (acc 0)) (if (> i 4) acc (recur (+ i 1) (+ acc i))))',
+     10),
+])
+def test_expressions(run, text, expected):
+    assert run(text) == expected
+
+
+def test_define_and_call(run):
+    run('(defn add (a b) (+ a b))')
+    assert run('(add 2 3)') == 5
+
+
+def test_set_closed_over_name(run):
+    run('''
+    (define counter
+      (let ((n 0))
+        (lambda () (begin (set! n (+ n 1)) n))))
+    ''')
+    assert [run('(counter)') for _ in range(3)] == [1, 2, 3]
+
+
+def test_set_global_from_procedure(run):
+    run('(define total 0)')
+    run('(defn bump (x) (set! total (+ total x)))')
+    run('(bump 2)')
+    run('(bump 3)')
+    assert run('total') == 5
+
+
+def test_quasiquote(run):
+    run('(define x 2)')
+    run("(define xs '(3 4))")
+    assert run('`(1 ~x ~@xs)') == LispList([1, 2, 3, 4])
+
+
+def test_macro_from_prelude(run_prelude):
+    assert run_prelude('(unless #f "yes")') == 'yes'
+    assert run_prelude('(unless #t "yes")') is None
+
+
+def test_deep_tail_recursion(run):
+    run('(defn count-down (n) (if (= n 0) "done" (count-down (- n 1))))')
+    assert run('(count-down 5000)') == 'done'
+
+
+def test_defmacro_only_at_the_top_level(run):
+    # The frame of a lambda without parameters is empty
+    with pytest.raises(RiplError):
+        run('((lambda () (defmacro inner (x) x)))')
+
+
+@pytest.mark.parametrize('text', [
+    '((lambda (a) a) 1 2)',
+    '((lambda (a b) b) 1)',
+    '(begin (defn f (a b) b) (f 1 2 3))',
+])
+def test_wrong_number_of_arguments(run, text):
+    with pytest.raises(RiplError, match='Expected'):
+        run(text)
+
+
+def test_wrong_number_of_arguments_once_hot(run):
+    # After enough calls the procedure runs as compiled code, which must
+    # still reject a call with too few or too many arguments
+    run('(defn f (a b) (+ a b))')
+    run('(defn g (n) (if (= n 0) 0 (begin (f n n) (g (- n 1)))))')
+    run('(g 500)')
+    with pytest.raises(RiplError, match='Expected'):
+        run('(f 1)')
+    with pytest.raises(RiplError, match='Expected'):
+        run('(f 1 2 3)')
+
+
+@pytest.mark.parametrize('text, message', [
+    ('(define x 1 2)', 'Invalid `define`: (x 1 2)'),
+    ('(set! x)', 'Invalid `set!`: (x)'),
+])
+def test_invalid_binding_form(run, text, message):
+    with pytest.raises(RiplError) as info:
+        run(text)
+    assert str(info.value) == message
@@ -0,0 +1,80 @@
+'''
+pmap, preduce and pcall give the same results as running in process.
+'''
+import pytest
+
+from ripl.eval import Evaluator
+from ripl.interpretor import Interpretor
+from ripl.parallel import _batches, free_variables
+from ripl.types import LispList, Symbol
+
+
+@pytest.fixture(scope='module', params=Evaluator.modes)
+def pooled(request):
+    '''One interpretor with two workers per mode: they are slow to start'''
+    interp = Interpretor(mode=request.param, cache=False)
+    interp.load_prelude()
+    interp.evaluator.workers.size = 2
+    yield interp
+    interp.evaluator.workers.shutdown()
+
+
+@pytest.fixture
+def prun(pooled):
+    def run(text):
+        *_, result = pooled.eval_expr(text)
+        return result
+    return run
+
+
+def test_pmap(prun):
+    prun('(defn square (x) (* x x))')
+    assert list(prun('(pmap square (range 20))')) == [
+        x * x for x in range(20)]
+
+
+def test_pmap_several_colls(prun):
+    assert list(prun('(pmap + [1 2 3] [10 20 30])')) == [11, 22, 33]
+
+
+def test_pmap_closure(prun):
+    prun('(defn scaler (k) (lambda (x) (* k x)))')
+    assert list(prun('(pmap (scaler 3) [1 2 3])')) == [3, 6, 9]
+
+
+def test_globals_defined_after_starting(prun):
+    prun('(pmap (lambda (x) x) [1])')
+    prun('(define offset 100)')
+    prun('(defn shift (x) (+ x offset))')
+    assert list(prun('(pmap shift [1 2])')) == [101, 102]
+
+
+def test_preduce(prun):
+    assert prun('(preduce + (range 100))') == sum(range(100))
+    assert prun('(preduce + 1000 (range 10))') == 1045
+    assert prun("(preduce + 7 '())") == 7
+
+
+def test_pcall(prun):
+    assert prun('(pcall (lambda () 1) (lambda () (+ 1 1)) (lambda () 3))') \
+        == LispList([1, 2, 3])
+
+
+def test_workers_dont_share_state(prun):
+    prun('(define hits 0)')
+    prun('(defn hit (x) (begin (set! hits (+ hits 1)) hits))')
+    list(prun('(pmap hit (range 10))'))
+    assert prun('hits') == 0
+
+
+def test_batches():
+    assert _batches(list(range(5)), 2) == [[0, 1, 2], [3, 4]]
+    assert _batches([1], 4) == [[1]]
+
+
+def test_free_variables(interp, run):
+    run('(define g 1)')
+    run('(define f ((lambda (a b) (lambda (x) (+ x a g))) 2 3))')
+    captured, names = free_variables(interp.evaluator.global_env[Symbol('f')])
+    assert captured == {Symbol('a'): 2}
+    assert Symbol('g') in names and Symbol('b') not in names
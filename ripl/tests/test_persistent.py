@@ -0,0 +1,99 @@
+'''
+Persistent vectors and hash maps, and the [...] and {...} literals for them.
+'''
+import pytest
+
+from ripl.interpretor import Interpretor
+from ripl.persistent import PersistentVector, PersistentMap, hash_map
+from ripl.types import Keyword, RiplError
+
+
+def test_vector_literal_elements_are_evaluated(run):
+    run('(define x 5)')
+    assert run('[x (+ 1 2)]') == PersistentVector([5, 3])
+
+
+def test_map_literal_elements_are_evaluated(run):
+    run('(define k :a)')
+    assert run('{k (* 2 3), :b [k]}') == PersistentMap([
+        (Keyword('a'), 6), (Keyword('b'), PersistentVector([Keyword('a')]))
+    ])
+
+
+def test_constant_literals_evaluate_to_themselves(run):
+    assert run('[1 "two" :three]') == PersistentVector([1, 'two', Keyword(
+        'three')])
+
+
+def test_quoted_vector_is_not_evaluated(run):
+    result = run("'[x (+ 1 2)]")
+    assert repr(result) == '[x (+ 1 2)]'
+
+
+def test_literal_in_a_procedure(run):
+    run('(defn pair (a b) [a b {:sum (+ a b)}])')
+    assert run('(pair 1 2)') == PersistentVector(
+        [1, 2, PersistentMap([(Keyword('sum'), 3)])])
+
+
+def test_unknown_name_in_a_literal(run):
+    with pytest.raises(RiplError):
+        run('[undefined-name]')
+
+
+def test_literal_with_jit(mode):
+    interp = Interpretor(mode=mode, cache=False, jit=2)
+    list(interp.eval_expr('(defn wrap (a) [a (* a a)])'))
+    results = [list(interp.eval_expr(f'(wrap {i})'))[-1] for i in range(5)]
+    assert results[-1] == PersistentVector([4, 16])
+
+
+def test_literal_with_folding(mode):
+    interp = Interpretor(mode=mode, cache=False, fold=True)
+    *_, result = interp.eval_expr(
+        '(define n 1) [(set! n 2)] [n (+ 1 2)]')
+    assert result == PersistentVector([2, 3])
+
+
+def test_vector_operations(run):
+    assert run('(conj [1 2] 3)') == PersistentVector([1, 2, 3])
+    assert run('(assoc [1 2 3] 1 :x)') == PersistentVector(
+        [1, Keyword('x'), 3])
+    assert run('(get [1 2 3] 2)') == 3
+
+
+def test_map_operations(run):
+    assert run('(get (assoc {:a 1} :b 2) :b)') == 2
+    assert run('(dissoc {:a 1 :b 2} :a)') == PersistentMap(
+        [(Keyword('b'), 2)])
+
+
+def test_updates_share_structure():
+    vec = PersistentVector(range(1000))
+    new = vec.assoc(500, 'x')
+    assert vec[500] == 500 and new[500] == 'x'
+    assert list(vec.conj(1000)) == list(range(1001))
+    assert len(vec.pop()) == 999
+
+
+def test_map_with_many_keys():
+    m = PersistentMap((i, i * i) for i in range(2000))
+    assert len(m) == 2000
+    assert m[1234] == 1234 ** 2
+    assert 1999 not in m.dissoc(1999)
+
+
+def test_transients():
+    t = PersistentVector().transient()
+    for i in range(100):
+        t.conj(i)
+    vec = t.persistent()
+    assert list(vec) == list(range(100))
+    with pytest.raises(RiplError):
+        t.conj(100)
+
+
+def test_hash_map_needs_pairs():
+    assert hash_map(1, 2) == PersistentMap([(1, 2)])
+    with pytest.raises(RiplError):
+        hash_map(1)
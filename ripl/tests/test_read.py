@@ -0,0 +1,90 @@
+'''
+The reader: one pass over the input, however it is split up.
+'''
+import io
+
+import pytest
+
+from ripl.read import Reader
+from ripl.types import Symbol, Keyword, LispList
+from ripl.persistent import PersistentVector, PersistentMap
+
+
+@pytest.fixture
+def reader():
+    return Reader()
+
+
+def read_all(reader, text):
+    return list(reader.read_all(text))
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('42', 42),
+    ('-7', -7),
+    ('0x1f', 31),
+    ('0b101', 5),
+    ('2.5', 2.5),
+    ('1+2j', 1+2j),
+    ('#t', True),
+    ('"a string"', 'a string'),
+    (':kw', Keyword('kw')),
+    ('sym', Symbol('sym')),
+    ('()', LispList.EMPTY),
+])
+def test_atoms(reader, text, expected):
+    assert reader.read(text) == expected
+
+
+def test_nested_forms(reader):
+    form = reader.read("(a (b 1) '(c) [1 2] {:k 2})")
+    assert form == LispList([
+        Symbol('a'),
+        LispList([Symbol('b'), 1]),
+        LispList([Symbol('quote'), LispList([Symbol('c')])]),
+        PersistentVector([1, 2]),
+        PersistentMap([(Keyword('k'), 2)]),
+    ])
+
+
+def test_deep_nesting(reader):
+    depth = 5000
+    form = reader.read('(' * depth + ')' * depth)
+    for _ in range(depth - 1):
+        form = form.car
+    assert form == LispList.EMPTY
+
+
+def test_comments_are_skipped(reader):
+    assert read_all(reader, '; a comment\n1 ; another\n2') == [1, 2]
+
+
+def test_stream_matches_string(reader):
+    text = '  \n(define s "multi\nline")\n\n(+ 1 2) [3 4]\n'
+    assert (list(reader.read_stream(io.StringIO(text))) ==
+            read_all(reader, text))
+
+
+@pytest.mark.parametrize('text', [')', '   )', '\n\n  )'])
+def test_error_positions_ignore_leading_whitespace(reader, text):
+    with pytest.raises(SyntaxError, match=r'line 1 col 0'):
+        read_all(reader, text)
+
+    with pytest.raises(SyntaxError, match=r'line 1 col 0'):
+        list(reader.read_stream(io.StringIO(text)))
+
+
+def test_error_position_on_a_later_line(reader):
+    with pytest.raises(SyntaxError, match=r'line 2 col 3'):
+        read_all(reader, '(a)\n   ]')
+
+
+@pytest.mark.parametrize('text', ['(a b', '[1 2', '{:a 1'])
+def test_unclosed(reader, text):
+    with pytest.raises(SyntaxError):
+        read_all(reader, text)
+
+
+def test_odd_dict_literal(reader):
+    with pytest.raises(SyntaxError):
+        read_all(reader, '{:a}')
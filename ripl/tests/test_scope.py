@@ -0,0 +1,78 @@
+'''
+How names are found: locals resolved lexically, globals looked up late.
+'''
+import pytest
+
+from ripl.persistent import PersistentVector
+from ripl.types import LispList, RiplError
+
+
+def test_nested_closures(run):
+    run('(defn adder (a) (lambda (b) (lambda (c) (+ a b c))))')
+    assert run('(((adder 1) 2) 3)') == 6
+
+
+def test_closures_keep_their_own_frames(run):
+    run('(defn make (n) (lambda () n))')
+    run('(define one (make 1))')
+    run('(define two (make 2))')
+    assert run('[(one) (two)]') == PersistentVector([1, 2])
+
+
+def test_inner_names_shadow_outer(run):
+    run('(define x "global")')
+    assert run('((lambda (x) x) "param")') == 'param'
+    assert run('(let ((x "let")) ((lambda () x)))') == 'let'
+    assert run('x') == 'global'
+
+
+def test_local_define(run):
+    run('''
+    (defn f (a)
+      (begin
+        (define b (* a 2))
+        (+ a b)))
+    ''')
+    assert run('(f 3)') == 9
+    with pytest.raises(RiplError):
+        run('b')
+
+
+def test_local_recursive_defn(run):
+    run('''
+    (defn fact (n)
+      (begin
+        (defn go (i acc) (if (= i 0) acc (go (- i 1) (* acc i))))
+        (go n 1)))
+    ''')
+    assert run('(fact 10)') == 3628800
+
+
+def test_variadic_params(run):
+    run('(defn all-args args args)')
+    assert run('(all-args 1 2 3)') == LispList([1, 2, 3])
+
+
+def test_globals_defined_later_are_seen(run):
+    run('(defn uses-later () (later))')
+    run('(defn later () "found")')
+    assert run('(uses-later)') == 'found'
+
+
+def test_set_in_enclosing_let(run):
+    assert run('''
+    (let ((n 1))
+      (begin
+        ((lambda () (set! n 10)))
+        n))
+    ''') == 10
+
+
+def test_unknown_name(run):
+    with pytest.raises(RiplError, match='Unknown symbol'):
+        run('((lambda () not-defined))')
+
+
+def test_redefining_a_local(run):
+    with pytest.raises(RiplError, match='re-define'):
+        run('((lambda (a) (begin (define a 2) a)) 1)')
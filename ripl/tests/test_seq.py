@@ -0,0 +1,79 @@
+'''
+Lazy seqs only do the work that is needed, a chunk at a time.
+'''
+import pytest
+
+from ripl.types import CHUNK_SIZE, LazySeq, LispList
+
+
+@pytest.fixture
+def counted(run):
+    '''Define (seen x): the identity, counting how many times it is called'''
+    run('(define calls 0)')
+    run('(defn seen (x) (begin (set! calls (+ calls 1)) x))')
+    return run
+
+
+def test_nothing_is_realised_up_front(counted):
+    counted('(define xs (map seen (range 1000)))')
+    assert counted('calls') == 0
+
+
+def test_realised_a_chunk_at_a_time(counted):
+    counted('(define xs (map seen (range 1000)))')
+    assert counted('(car xs)') == 0
+    assert counted('calls') == CHUNK_SIZE
+    assert counted(f'(car (drop {CHUNK_SIZE} xs))') == CHUNK_SIZE
+    assert counted('calls') == 2 * CHUNK_SIZE
+
+
+def test_realised_once(counted):
+    counted('(define xs (map seen (range 10)))')
+    assert counted('(reduce + xs)') == 45
+    assert counted('(reduce + xs)') == 45
+    assert counted('calls') == 10
+
+
+def test_infinite_seqs(run):
+    assert list(run('(take 5 (filter (lambda (x) (= (% x 2) 0)) (range)))')) \
+        == [0, 2, 4, 6, 8]
+    assert list(run('(take 4 (iterate (lambda (x) (* x 2)) 1))')) \
+        == [1, 2, 4, 8]
+
+
+def test_car_and_cdr(run):
+    run('(define xs (range 3))')
+    assert run('(car xs)') == 0
+    assert list(run('(cdr xs)')) == [1, 2]
+    assert list(run('(cons -1 xs)')) == [-1, 0, 1, 2]
+
+
+def test_reduce_early_exit(run):
+    assert run('''
+    (reduce (lambda (acc x) (if (> x 3) (reduced acc) (+ acc x))) 0 (range))
+    ''') == 6
+
+
+def test_lazy_seq_macro(run_prelude):
+    run_prelude('(defn nats-from (n) (lazy-seq (cons n (nats-from (+ n 1)))))')
+    assert list(run_prelude('(take 3 (nats-from 5))')) == [5, 6, 7]
+
+
+def test_python_iterators_are_streamed():
+    pulled = []
+
+    def gen():
+        for i in range(100):
+            pulled.append(i)
+            yield i
+
+    xs = LazySeq.from_iter(gen())
+    assert xs.first() == 0
+    assert len(pulled) == CHUNK_SIZE
+    assert list(xs) == list(range(100))
+    assert list(xs) == list(range(100))
+
+
+def test_drop_from_a_list():
+    lst = LispList([1, 2, 3])
+    assert list(LazySeq.from_iter(lst).drop(1)) == [2, 3]
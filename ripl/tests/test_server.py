@@ -0,0 +1,117 @@
+'''
+`ripl --serve`: requests over a Unix socket run on isolated interpretors.
+'''
+import os
+import sys
+import socket
+import threading
+
+import pytest
+
+from ripl import cli, client, server
+from ripl.client import request
+from ripl.interpretor import Interpretor
+from ripl.pool import InterpretorPool
+from ripl.types import RiplError
+
+
+@pytest.fixture
+def sock_path(tmp_path):
+    return str(tmp_path / 'ripl.sock')
+
+
+@pytest.fixture
+def srv(sock_path):
+    template = Interpretor(cache=False)
+    template.load_prelude()
+    srv = server.Server(
+        sock_path, InterpretorPool(template, 2), server.Output(sys.stdout))
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def running(srv):
+    return srv.server_address
+
+
+def test_eval(running):
+    reply = request({'code': '(define x 4) (* x x)'}, running)
+    assert reply == {'values': ['16'], 'out': ''}
+
+
+def test_output_is_captured(srv, monkeypatch):
+    # serve() swaps sys.stdout for the server's Output
+    monkeypatch.setattr(sys, 'stdout', srv.output)
+    reply = request({'code': '(print "hi")'}, srv.server_address)
+    assert reply['out'] == 'hi\n'
+
+
+def test_errors_are_reported(running):
+    reply = request({'code': '1 (undefined-name)'}, running)
+    assert reply['values'] == ['1']
+    assert 'undefined-name' in reply['error']
+
+
+def test_connections_are_isolated(running):
+    request({'code': '(define private 1)'}, running)
+    reply = request({'code': 'private'}, running)
+    assert 'error' in reply
+
+
+def test_sessions_keep_definitions(running):
+    request({'code': '(define kept 7)', 'session': 's'}, running)
+    assert request({'code': 'kept', 'session': 's'}, running)['values'] == [
+        '7']
+
+    request({'op': 'close', 'session': 's'}, running)
+    assert 'error' in request({'code': 'kept', 'session': 's'}, running)
+
+
+def test_client_refuses_a_socket_owned_by_someone_else(
+        running, monkeypatch, capsys):
+    monkeypatch.setattr(os, 'getuid', lambda: os.stat(running).st_uid + 1)
+    with pytest.raises(PermissionError):
+        request({'code': '1'}, running)
+
+    assert client.main(['--socket', running, '-s', '1']) == 2
+    assert 'another user' in capsys.readouterr().err
+
+
+def test_clear_stale_leaves_other_files_alone(tmp_path):
+    path = tmp_path / 'not-a-socket'
+    path.write_text('keep me')
+
+    with pytest.raises(RiplError):
+        server._clear_stale(str(path))
+    assert path.read_text() == 'keep me'
+
+
+def test_clear_stale_removes_a_dead_socket(sock_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(sock_path)
+
+    server._clear_stale(sock_path)
+    assert not os.path.exists(sock_path)
+
+
+def test_clear_stale_refuses_a_live_socket(running):
+    with pytest.raises(RiplError):
+        server._clear_stale(running)
+
+
+def test_cli_saves_an_image_and_then_serves(tmp_path, monkeypatch):
+    served = []
+    monkeypatch.setattr(
+        server, 'serve', lambda repl, path, size: served.append(path))
+
+    image = str(tmp_path / 'boot.img')
+    cli.main([
+        '--no-cache', '-s', '(define x 1)', '--save-image', image,
+        '--serve', '--socket', 'sock'])
+
+    assert os.path.exists(image)
+    assert served == ['sock']
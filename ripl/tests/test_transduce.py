@@ -0,0 +1,72 @@
+'''
+Transducers run a whole pipeline in one pass with no intermediate seqs.
+'''
+import pytest
+
+from ripl.persistent import PersistentVector
+from ripl.transduce import transduce, into, sequence, mapping, taking
+from ripl.types import LispList
+
+
+def test_transduce(run):
+    assert run('''
+    (transduce (comp (map (lambda (x) (* x x)))
+                     (filter (lambda (x) (= (% x 2) 0)))
+                     (take 3))
+               + 0 (range))
+    ''') == 0 + 4 + 16
+
+
+def test_transduce_without_init(run):
+    assert run('(transduce (map (lambda (x) (+ x 1))) + (range 3))') == 6
+
+
+def test_into_a_vector(run):
+    result = run('(into [0] (map (lambda (x) (* 2 x))) (range 1 4))')
+    assert isinstance(result, PersistentVector)
+    assert list(result) == [0, 2, 4, 6]
+
+
+def test_into_a_list(run):
+    assert run("(into '(1) (range 2 4))") == LispList([1, 2, 3])
+
+
+def test_sequence_is_lazy(run):
+    run('(define calls 0)')
+    run('(defn seen (x) (begin (set! calls (+ calls 1)) x))')
+    run('(define xs (sequence (map seen) (range 1000)))')
+    assert run('(car xs)') == 0
+    assert run('calls') < 1000
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('(into [] (drop 2) (range 5))', [2, 3, 4]),
+    ('(into [] (take-while (lambda (x) (< x 3))) (range))', [0, 1, 2]),
+    ('(into [] (drop-while (lambda (x) (< x 3))) (range 5))', [3, 4]),
+    ('(into [] (remove (lambda (x) (= x 1))) (range 3))', [0, 2]),
+    ('(into [] (mapcat (lambda (x) [x x])) (range 2))', [0, 0, 1, 1]),
+    ('(into [] (partition-all 2) (range 5))', [[0, 1], [2, 3], [4]]),
+])
+def test_transducers(run, text, expected):
+    assert [list(x) if not isinstance(x, int) else x
+            for x in run(text)] == expected
+
+
+def test_early_exit_stops_pulling():
+    pulled = []
+
+    def gen():
+        for i in range(100):
+            pulled.append(i)
+            yield i
+
+    assert transduce(taking(3), lambda acc, x: acc + x, 0, gen()) == 3
+    assert len(pulled) == 3
+
+
+def test_python_collections():
+    double = mapping(lambda x: 2 * x)
+    assert into([], double, range(3)) == [0, 2, 4]
+    assert into((9,), double, [1]) == (9, 2)
+    assert into(set(), double, [1, 1]) == {2}
+    assert list(sequence(double, iter([1, 2]))) == [2, 4]
@@ -0,0 +1,56 @@
+'''
+Interned Symbols and Keywords, and the cons cells behind LispList.
+'''
+import threading
+
+from ripl.types import Symbol, Keyword, LispList
+
+
+def test_symbols_are_interned():
+    assert Symbol('foo') is Symbol('foo')
+    assert Symbol('foo') is Symbol(str(Symbol('foo')))
+    assert Symbol('foo') != Symbol('bar')
+
+
+def test_keywords_are_interned_apart_from_symbols():
+    assert Keyword('foo') is Keyword('foo')
+    assert Keyword('foo') is not Symbol('foo')
+    assert Keyword('foo') != Symbol('foo')
+
+
+def test_symbols_still_hash_like_str():
+    assert {Symbol('x'): 1}[Symbol('x')] == 1
+    assert hash(Symbol('x')) == hash('x')
+
+
+def test_interning_from_many_threads():
+    names = [f'race-{i}' for i in range(200)]
+    barrier = threading.Barrier(8)
+    seen = []
+
+    def intern():
+        barrier.wait()
+        seen.append([Symbol(name) for name in names])
+
+    threads = [threading.Thread(target=intern) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for syms in seen:
+        assert all(a is b for a, b in zip(syms, seen[0]))
+
+
+def test_cons_shares_the_tail():
+    tail = LispList([2, 3])
+    lst = tail.cons(1)
+    assert list(lst) == [1, 2, 3]
+    assert lst.cdr is tail
+    assert lst.car == 1
+
+
+def test_empty_list():
+    assert not LispList.EMPTY
+    assert LispList([]) == LispList.EMPTY
+    assert len(LispList([1, 2])) == 2